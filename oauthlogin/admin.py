@@ -1,13 +1,126 @@
+import datetime
+
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import OAuthConnection, OAuthProviderConfig
+from .providers import get_provider_keys
+
+
+def get_admin_search_email() -> bool:
+    return getattr(settings, "OAUTH_LOGIN_ADMIN_SEARCH_EMAIL", False)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use the table statistics instead of COUNT(*) for the unfiltered changelist on PostgreSQL,
+    where counting millions of rows means a full scan.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+
+        if connection.vendor == "postgresql" and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s",
+                    [self.object_list.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # reltuples is -1 (or 0) if the table hasn't been analyzed yet
+            if row and row[0] > 0:
+                return int(row[0])
+
+        return super().count
+
+
+class ProviderKeyListFilter(admin.SimpleListFilter):
+    # Uses the keys from settings instead of a DISTINCT over the whole table
+    title = "provider"
+    parameter_name = "provider_key"
+
+    def lookups(self, request, model_admin):
+        return [(key, key) for key in get_provider_keys()]
 
-from .models import OAuthConnection
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(provider_key=self.value())
+        return queryset
+
+
+class AccessTokenExpiryListFilter(admin.SimpleListFilter):
+    title = "access token expiration"
+    parameter_name = "access_token_expiry"
+
+    def lookups(self, request, model_admin):
+        return [
+            ("expired", "Expired"),
+            ("day", "Expires in the next 24 hours"),
+            ("valid", "Not expired"),
+            ("never", "No expiration"),
+        ]
+
+    def queryset(self, request, queryset):
+        now = timezone.now()
+        if self.value() == "expired":
+            return queryset.filter(access_token_expires_at__lt=now)
+        if self.value() == "day":
+            return queryset.filter(
+                access_token_expires_at__gte=now,
+                access_token_expires_at__lt=now + datetime.timedelta(days=1),
+            )
+        if self.value() == "valid":
+            return queryset.filter(access_token_expires_at__gte=now)
+        if self.value() == "never":
+            return queryset.filter(access_token_expires_at__isnull=True)
+        return queryset
 
 
 @admin.register(OAuthConnection)
 class OAuthConnectionAdmin(admin.ModelAdmin):
     list_display = ("user", "provider_key", "provider_user_id", "created_at")
-    search_fields = (
-        "user__email",
-        "provider_user_id",
-    )
-    list_filter = ("provider_key",)
+    list_select_related = ("user",)
+    list_filter = (ProviderKeyListFilter, AccessTokenExpiryListFilter)
+    # Search is on indexed columns only (see get_search_results)
+    search_fields = ("=provider_user_id",)
+    raw_id_fields = ("user",)
+    ordering = ("-pk",)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    @property
+    def search_help_text(self):
+        if get_admin_search_email():
+            return "An exact user email, or a provider user ID (or the start of one)"
+        return "A provider user ID (or the start of one)"
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        # The user's email column needs an index for this (Django's default User doesn't have one)
+        if get_admin_search_email() and "@" in search_term:
+            return queryset.filter(user__email=search_term), False
+
+        return queryset.filter(provider_user_id__startswith=search_term), False
+
+
+@admin.register(OAuthProviderConfig)
+class OAuthProviderConfigAdmin(admin.ModelAdmin):
+    list_display = ("provider_key", "provider_class", "client_id", "enabled")
+    list_filter = ("enabled",)
+    search_fields = ("=provider_key",)
+    ordering = ("provider_key",)
+
+    def get_readonly_fields(self, request, obj=None):
+        # Cached by provider_key, so a renamed config would keep its old entry around
+        if obj:
+            return ("provider_key",)
+        return ()
@@ -0,0 +1,112 @@
+import datetime
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+if TYPE_CHECKING:
+    from .providers import OAuthProvider, OAuthToken
+
+APP_TOKEN_CACHE_KEY_PREFIX = "oauthlogin:app_token:"
+
+# In-process copies of app tokens, keyed by cache key
+_app_tokens: Dict[str, "OAuthToken"] = {}
+_fetch_locks: Dict[str, threading.Lock] = {}
+_fetch_locks_lock = threading.Lock()
+
+
+def get_app_token_renew_margin() -> int:
+    return getattr(settings, "OAUTH_LOGIN_APP_TOKEN_RENEW_MARGIN", 60 * 5)
+
+
+def _cache_key(provider: "OAuthProvider") -> str:
+    return f"{APP_TOKEN_CACHE_KEY_PREFIX}{provider.provider_key}:{provider.get_client_id()}"
+
+
+def _fetch_lock(key: str) -> threading.Lock:
+    with _fetch_locks_lock:
+        if key not in _fetch_locks:
+            _fetch_locks[key] = threading.Lock()
+        return _fetch_locks[key]
+
+
+def _needs_renewal(oauth_token: "OAuthToken") -> bool:
+    return oauth_token.access_token_expires_at is not None and (
+        oauth_token.access_token_expires_at
+        <= timezone.now() + datetime.timedelta(seconds=get_app_token_renew_margin())
+    )
+
+
+def _expired(oauth_token: "OAuthToken") -> bool:
+    return (
+        oauth_token.access_token_expires_at is not None
+        and oauth_token.access_token_expires_at <= timezone.now()
+    )
+
+
+def _fetch_app_token(provider: "OAuthProvider", key: str) -> "OAuthToken":
+    oauth_token = provider.fetch_app_token()
+
+    if oauth_token.access_token_expires_at is None:
+        timeout = None
+    else:
+        timeout = max(
+            int((oauth_token.access_token_expires_at - timezone.now()).total_seconds()),
+            1,
+        )
+
+    _app_tokens[key] = oauth_token
+    cache.set(key, oauth_token, timeout=timeout)
+    return oauth_token
+
+
+def get_app_token(provider: "OAuthProvider") -> "OAuthToken":
+    """
+    Get the provider's app token (like a client credentials token),
+    shared in-process and across workers through the Django cache.
+
+    Tokens are renewed OAUTH_LOGIN_APP_TOKEN_RENEW_MARGIN seconds before they expire.
+    Only one worker renews a token at a time,
+    and the others keep using the current one while it is still valid.
+    """
+    key = _cache_key(provider)
+    oauth_token: Optional["OAuthToken"] = _app_tokens.get(key)
+
+    if oauth_token is None or _needs_renewal(oauth_token):
+        # Another worker may have already renewed it
+        shared_oauth_token = cache.get(key)
+        if shared_oauth_token is not None:
+            oauth_token = shared_oauth_token
+            _app_tokens[key] = shared_oauth_token
+
+    if oauth_token is not None and not _needs_renewal(oauth_token):
+        return oauth_token
+
+    with _fetch_lock(key):
+        # Another thread may have renewed it while we waited for the lock
+        local_oauth_token = _app_tokens.get(key)
+        if local_oauth_token is not None and not _needs_renewal(local_oauth_token):
+            return local_oauth_token
+
+        if cache.add(key + ":lock", True, timeout=30):
+            try:
+                return _fetch_app_token(provider, key)
+            finally:
+                cache.delete(key + ":lock")
+
+        # Another worker is renewing it
+        if oauth_token is not None and not _expired(oauth_token):
+            return oauth_token
+
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            time.sleep(0.1)
+            shared_oauth_token = cache.get(key)
+            if shared_oauth_token is not None and not _expired(shared_oauth_token):
+                _app_tokens[key] = shared_oauth_token
+                return shared_oauth_token
+
+        return _fetch_app_token(provider, key)
@@ -1,6 +1,81 @@
+import logging
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+logger = logging.getLogger(__name__)
 
 
 class OAuthLoginConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "oauthlogin"
+
+    def ready(self):
+        from .cache import invalidate_user_identities
+        from .checks import check_providers, get_check_providers
+        from .provider_configs import invalidate_provider_config
+        from .revocation import revoke_user_tokens
+        from .routers import unpin
+
+        request_started.connect(unpin, dispatch_uid="oauthlogin_unpin")
+        pre_delete.connect(
+            invalidate_user_identities,
+            sender=settings.AUTH_USER_MODEL,
+            dispatch_uid="oauthlogin_invalidate_user_identities",
+        )
+        pre_delete.connect(
+            revoke_user_tokens,
+            sender=settings.AUTH_USER_MODEL,
+            dispatch_uid="oauthlogin_revoke_user_tokens",
+        )
+        post_save.connect(
+            invalidate_provider_config,
+            sender="oauthlogin.OAuthProviderConfig",
+            dispatch_uid="oauthlogin_invalidate_provider_config_save",
+        )
+        post_delete.connect(
+            invalidate_provider_config,
+            sender="oauthlogin.OAuthProviderConfig",
+            dispatch_uid="oauthlogin_invalidate_provider_config_delete",
+        )
+
+        checks.register(check_providers)
+
+        if get_check_providers():
+            self.check_providers_on_boot()
+
+    def check_providers_on_boot(self):
+        """
+        Build every provider when the app loads, since a web server
+        (unlike manage.py) doesn't run the system checks,
+        and optionally open connections to them in the background.
+        """
+        from .checks import check_providers, get_prewarm_connections
+        from .http import prewarm_connections
+        from .providers import get_oauth_provider_instance, get_provider_keys
+
+        errors = check_providers()
+        for error in errors:
+            logger.error("%s", error)
+
+        if not get_prewarm_connections():
+            return
+
+        providers = []
+        for provider_key in get_provider_keys():
+            try:
+                providers.append(get_oauth_provider_instance(provider_key=provider_key))
+            except Exception:
+                # Already logged by the check
+                continue
+
+        threading.Thread(
+            target=prewarm_connections,
+            args=(providers,),
+            name="oauthlogin-prewarm",
+            daemon=True,
+        ).start()
@@ -0,0 +1,103 @@
+from typing import Any, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+CONNECTIONS_CACHE_KEY = "oauthlogin:connections:{}"
+
+
+def get_connections_cache_timeout() -> Optional[int]:
+    return getattr(settings, "OAUTH_LOGIN_CONNECTIONS_CACHE_TIMEOUT", None)
+
+
+def get_user_connections(user: Any) -> List[dict]:
+    """
+    The rows for a user's connection list, from the cache if it's enabled.
+
+    Each row has the connection's provider_key, provider_user_id, profile
+    and user_connection_count (from with_disconnectable()).
+    """
+    timeout = get_connections_cache_timeout()
+    key = CONNECTIONS_CACHE_KEY.format(user.pk)
+
+    if timeout:
+        connections = cache.get(key)
+        if connections is not None:
+            return connections
+
+    connections = list(
+        user.oauth_connections.with_disconnectable().values(
+            "provider_key",
+            "provider_user_id",
+            "profile",
+            "user_connection_count",
+        )
+    )
+
+    if timeout:
+        cache.set(key, connections, timeout=timeout)
+
+    return connections
+
+
+def invalidate_user_connections(user_id: Any) -> None:
+    if get_connections_cache_timeout():
+        cache.delete(CONNECTIONS_CACHE_KEY.format(user_id))
+
+
+IDENTITY_CACHE_KEY = "oauthlogin:identity:{}:{}"
+
+
+def get_identity_cache_timeout() -> Optional[int]:
+    return getattr(settings, "OAUTH_LOGIN_IDENTITY_CACHE_TIMEOUT", None)
+
+
+def get_cached_identity(provider_key: str, provider_user_id: str) -> Optional[dict]:
+    """
+    The connection_id, user_id and profile_fetched_at (a timestamp)
+    for a provider identity, if the identity cache is enabled and has it.
+    """
+    if not get_identity_cache_timeout():
+        return None
+    return cache.get(IDENTITY_CACHE_KEY.format(provider_key, provider_user_id))
+
+
+def set_cached_identity(connection: Any) -> None:
+    timeout = get_identity_cache_timeout()
+    if not timeout:
+        return
+
+    cache.set(
+        IDENTITY_CACHE_KEY.format(connection.provider_key, connection.provider_user_id),
+        {
+            "connection_id": connection.pk,
+            "user_id": connection.user_id,
+            "profile_fetched_at": connection.profile_fetched_at.timestamp()
+            if connection.profile_fetched_at
+            else None,
+        },
+        timeout=timeout,
+    )
+
+
+def invalidate_identities(identities: List[Tuple[str, str]]) -> None:
+    # identities are (provider_key, provider_user_id) pairs
+    if get_identity_cache_timeout() and identities:
+        cache.delete_many(
+            [
+                IDENTITY_CACHE_KEY.format(provider_key, provider_user_id)
+                for provider_key, provider_user_id in identities
+            ]
+        )
+
+
+def invalidate_user_identities(sender: Any, instance: Any, **kwargs) -> None:
+    # Connected to pre_delete for the user model, whose connections are deleted with it
+    if get_identity_cache_timeout():
+        invalidate_identities(
+            list(
+                instance.oauth_connections.values_list(
+                    "provider_key", "provider_user_id"
+                )
+            )
+        )
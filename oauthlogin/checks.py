@@ -0,0 +1,58 @@
+from typing import List
+
+from django.conf import settings
+from django.core.checks import CheckMessage, Error
+
+
+def get_check_providers() -> bool:
+    return getattr(settings, "OAUTH_LOGIN_CHECK_PROVIDERS", False)
+
+
+def get_prewarm_connections() -> bool:
+    return getattr(settings, "OAUTH_LOGIN_PREWARM_CONNECTIONS", False)
+
+
+def check_providers(app_configs=None, **kwargs) -> List[CheckMessage]:
+    """
+    A system check that imports and instantiates every configured provider
+    (if OAUTH_LOGIN_CHECK_PROVIDERS is enabled),
+    so a bad class path or kwargs shows up before the first login does.
+    """
+    if not get_check_providers():
+        return []
+
+    from .providers import get_oauth_provider_instance, get_provider_keys
+
+    try:
+        provider_keys = get_provider_keys()
+    except Exception as e:
+        return [
+            Error(
+                f"The OAuth providers couldn't be loaded: {e}",
+                hint="Check OAUTH_LOGIN_PROVIDERS_SOURCE",
+                id="oauthlogin.E004",
+            )
+        ]
+
+    errors: List[CheckMessage] = []
+
+    for provider_key in provider_keys:
+        try:
+            get_oauth_provider_instance(provider_key=provider_key)
+        except ImportError as e:
+            errors.append(
+                Error(
+                    f'The class for the OAuth provider "{provider_key}" couldn\'t be imported: {e}',
+                    id="oauthlogin.E002",
+                )
+            )
+        except Exception as e:
+            errors.append(
+                Error(
+                    f'The OAuth provider "{provider_key}" couldn\'t be created: {e!r}',
+                    hint="Check its class and kwargs in OAUTH_LOGIN_PROVIDERS",
+                    id="oauthlogin.E003",
+                )
+            )
+
+    return errors
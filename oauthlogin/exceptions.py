@@ -14,3 +14,19 @@ class OAuthCannotDisconnectError(OAuthError):
 
 class OAuthUserAlreadyExistsError(OAuthError):
     pass
+
+
+class OAuthWebhookSignatureError(OAuthError):
+    pass
+
+
+class OAuthRefreshTokenRejectedError(OAuthError):
+    """Raised by refresh_oauth_token() when the provider won't accept the refresh token"""
+
+    pass
+
+
+class OAuthRateLimitError(OAuthError):
+    def __init__(self, *args, retry_after: float = 0):
+        super().__init__(*args)
+        self.retry_after = retry_after
@@ -0,0 +1,397 @@
+import datetime
+import email.utils
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.utils import timezone
+
+from .exceptions import OAuthRateLimitError
+
+if TYPE_CHECKING:
+    import requests
+
+    from .models import OAuthConnection
+    from .providers import OAuthProvider
+
+logger = logging.getLogger(__name__)
+
+# Response headers that are kept with a cached body and replayed on a 304
+CACHED_RESPONSE_HEADERS = ("Content-Type", "Link")
+
+_sessions: Dict[str, "requests.Session"] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(key: str) -> "requests.Session":
+    """
+    Get the pooled requests session for a provider key,
+    so connections to a provider are reused across requests in this process.
+    """
+    import requests
+
+    with _sessions_lock:
+        if key not in _sessions:
+            _sessions[key] = requests.Session()
+        return _sessions[key]
+
+
+def prewarm_connections(providers: List["OAuthProvider"]) -> None:
+    """
+    Open a pooled connection to each provider's prewarm URLs,
+    so the first real requests don't wait on DNS and the TLS handshake.
+    """
+    for provider in providers:
+        try:
+            urls = provider.get_prewarm_urls()
+        except Exception:
+            logger.warning(
+                "Failed to get prewarm URLs for %s",
+                provider.provider_key,
+                exc_info=True,
+            )
+            continue
+
+        session = provider.get_session()
+        for url in urls:
+            try:
+                # Any response (even an error status) leaves the connection in the pool
+                session.head(url, timeout=5)
+            except Exception:
+                logger.warning(
+                    "Failed to prewarm a connection to %s", url, exc_info=True
+                )
+
+
+class ConditionalResponseCache:
+    """
+    A bounded, in-process LRU of GET responses that had an ETag or Last-Modified header.
+
+    Entries are keyed by a hash of the access token and URL,
+    so a repeat request can be sent with If-None-Match/If-Modified-Since
+    and a 304 can be answered from the stored body.
+    """
+
+    def __init__(self, *, maxsize: Optional[int] = None):
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self) -> int:
+        if self._maxsize is not None:
+            return self._maxsize
+        return getattr(settings, "OAUTH_LOGIN_RESPONSE_CACHE_SIZE", 1000)
+
+    @staticmethod
+    def get_key(*, token: str, url: str) -> str:
+        return hashlib.sha256(f"{token} {url}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, response: "requests.Response") -> None:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+
+        entry = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content": response.content,
+            "headers": {
+                name: response.headers[name]
+                for name in CACHED_RESPONSE_HEADERS
+                if name in response.headers
+            },
+        }
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(self.maxsize, 0):
+                self._entries.popitem(last=False)
+
+    def record(self, *, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+response_cache = ConditionalResponseCache()
+
+
+def conditional_get(
+    session: "requests.Session",
+    url: str,
+    *,
+    token: str,
+    headers: Optional[dict] = None,
+    params: Optional[dict] = None,
+    **kwargs,
+) -> "requests.Response":
+    """
+    A GET that revalidates a previously cached response for the same token and URL.
+
+    A 304 is returned to the caller as a 200 with the cached body,
+    so callers can use the response the same way either way.
+    """
+    import requests
+
+    prepared_url = requests.Request("GET", url, params=params).prepare().url or url
+    key = response_cache.get_key(token=token, url=prepared_url)
+    entry = response_cache.get(key)
+
+    headers = dict(headers or {})
+    if entry:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = session.get(url, headers=headers, params=params, **kwargs)
+
+    if entry and response.status_code == 304:
+        response_cache.record(hit=True)
+        response.status_code = 200
+        response._content = entry["content"]
+        for name, value in entry["headers"].items():
+            response.headers.setdefault(name, value)
+        return response
+
+    response_cache.record(hit=False)
+    if response.status_code == 200:
+        response_cache.set(key, response)
+
+    return response
+
+
+def get_next_page_url(response: "requests.Response") -> Optional[str]:
+    """
+    Find the next page of a paginated response,
+    from a Link header (GitHub, GitLab) or a "next" key in the body (Bitbucket).
+    """
+    if "next" in response.links:
+        return response.links["next"]["url"]
+
+    if response.headers.get("Content-Type", "").startswith("application/json"):
+        data = response.json()
+        if isinstance(data, dict) and data.get("next"):
+            return data["next"]
+
+    return None
+
+
+def get_page_items(data: Any) -> list:
+    if isinstance(data, dict):
+        return data.get("values") or data.get("items") or []
+    return data
+
+
+def iter_list_items(
+    get: Callable[..., "requests.Response"],
+    url: str,
+    *,
+    max_pages: Optional[int] = None,
+    **kwargs,
+) -> Iterator[Any]:
+    """
+    Iterate the items of a paginated list endpoint with the given GET function.
+
+    Pages are only requested as the previous one is consumed,
+    so a caller that stops early doesn't pay for the rest of the list.
+    """
+    next_url: Optional[str] = url
+    pages = 0
+    while next_url and (max_pages is None or pages < max_pages):
+        response = get(next_url, **kwargs)
+        response.raise_for_status()
+        pages += 1
+        yield from get_page_items(response.json())
+
+        next_url = get_next_page_url(response)
+        # The next URL already has the query params in it
+        kwargs.pop("params", None)
+
+
+def get_rate_limit_wait(response: "requests.Response") -> Optional[float]:
+    """
+    The number of seconds to wait before making another request, if the response says so.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+            return max((retry_at - timezone.now()).total_seconds(), 0)
+
+    remaining = response.headers.get(
+        "X-RateLimit-Remaining", response.headers.get("RateLimit-Remaining")
+    )
+    reset = response.headers.get(
+        "X-RateLimit-Reset", response.headers.get("RateLimit-Reset")
+    )
+    if remaining == "0" and reset:
+        reset_seconds = float(reset)
+        # Some APIs send an epoch timestamp, others the number of seconds left
+        if reset_seconds > 1_000_000_000:
+            reset_seconds -= time.time()
+        return max(reset_seconds, 0)
+
+    return None
+
+
+class OAuthAPIClient:
+    """
+    Make provider API requests as the user of an OAuthConnection.
+
+    Requests use the provider's pooled session (and conditional GETs),
+    the access token is refreshed when it is about to expire or gets a 401,
+    and rate limit headers are respected by waiting (up to max_rate_limit_wait)
+    or raising OAuthRateLimitError.
+    """
+
+    def __init__(
+        self,
+        connection: "OAuthConnection",
+        *,
+        provider: Optional["OAuthProvider"] = None,
+        base_url: Optional[str] = None,
+        refresh_margin: Optional[datetime.timedelta] = None,
+        max_rate_limit_wait: Optional[float] = None,
+    ):
+        from .providers import get_oauth_provider_instance
+
+        self.connection = connection
+        self.provider = provider or get_oauth_provider_instance(
+            provider_key=connection.provider_key
+        )
+        self.base_url = base_url or self.provider.api_base_url
+
+        if refresh_margin is None:
+            refresh_margin = datetime.timedelta(
+                seconds=getattr(settings, "OAUTH_LOGIN_API_REFRESH_MARGIN", 60)
+            )
+        self.refresh_margin = refresh_margin
+
+        if max_rate_limit_wait is None:
+            max_rate_limit_wait = getattr(
+                settings, "OAUTH_LOGIN_API_MAX_RATE_LIMIT_WAIT", 60
+            )
+        self.max_rate_limit_wait = max_rate_limit_wait
+
+        # When the last response said we're out of requests
+        self.rate_limited_until: Optional[float] = None
+
+    def can_refresh(self) -> bool:
+        return bool(self.connection.refresh_token) and not (
+            self.connection.refresh_token_expired()
+        )
+
+    def access_token_expiring(self) -> bool:
+        return (
+            self.connection.access_token_expires_at is not None
+            and self.connection.access_token_expires_at
+            < timezone.now() + self.refresh_margin
+        )
+
+    def wait_for_rate_limit(self, wait: float) -> None:
+        if wait > self.max_rate_limit_wait:
+            raise OAuthRateLimitError(
+                f"Rate limited by {self.connection.provider_key} for {wait:.0f} seconds",
+                retry_after=wait,
+            )
+        time.sleep(wait)
+
+    def send(self, method: str, url: str, **kwargs) -> "requests.Response":
+        oauth_token = self.connection.get_oauth_token()
+        headers = {
+            **self.provider.get_api_headers(oauth_token=oauth_token),
+            **kwargs.pop("headers", {}),
+        }
+        session = self.provider.get_session()
+
+        if method.upper() == "GET":
+            return conditional_get(
+                session,
+                url,
+                token=oauth_token.access_token,
+                headers=headers,
+                **kwargs,
+            )
+
+        return session.request(method, url, headers=headers, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> "requests.Response":
+        url = urljoin(self.base_url, url)
+
+        if self.access_token_expiring() and self.can_refresh():
+            self.connection.refresh_access_token()
+
+        if self.rate_limited_until is not None:
+            self.wait_for_rate_limit(max(self.rate_limited_until - time.time(), 0))
+            self.rate_limited_until = None
+
+        response = self.send(method, url, **kwargs)
+
+        if response.status_code == 401 and self.can_refresh():
+            self.connection.refresh_access_token()
+            response = self.send(method, url, **kwargs)
+
+        wait = get_rate_limit_wait(response)
+        if wait is not None and response.status_code in (403, 429):
+            # Retry the request once the limit resets
+            self.wait_for_rate_limit(wait)
+            response = self.send(method, url, **kwargs)
+            wait = get_rate_limit_wait(response)
+
+        if wait is not None:
+            # Out of requests for now, so hold off on the next one
+            self.rate_limited_until = time.time() + wait
+
+        return response
+
+    def get(self, url: str, **kwargs) -> "requests.Response":
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> "requests.Response":
+        return self.request("POST", url, **kwargs)
+
+    def paginate(
+        self, url: str, *, max_pages: Optional[int] = None, **kwargs
+    ) -> Iterator[Any]:
+        """
+        Iterate the items of a paginated list endpoint,
+        only requesting the next page when the previous one has been consumed.
+        """
+        return iter_list_items(self.get, url, max_pages=max_pages, **kwargs)
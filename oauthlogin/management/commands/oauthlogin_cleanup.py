@@ -0,0 +1,186 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, router, transaction
+
+from oauthlogin.cache import invalidate_identities, invalidate_user_connections
+from oauthlogin.models import OAuthConnection
+from oauthlogin.providers import get_oauth_provider_instance
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete connections whose refresh token has expired or keeps failing to refresh"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the connections that would be deleted without deleting them",
+        )
+        parser.add_argument(
+            "--provider",
+            action="append",
+            dest="provider_keys",
+            help="Only clean up connections for this provider key (can be repeated)",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to wait between batches (to let replicas catch up)",
+        )
+        parser.add_argument(
+            "--after-id",
+            type=int,
+            default=0,
+            help="Start after this connection ID (to resume an interrupted run)",
+        )
+        parser.add_argument(
+            "--revoke",
+            action="store_true",
+            help="Revoke the tokens at the provider before deleting the connections",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="The number of revoke requests to make at the same time",
+        )
+        parser.add_argument(
+            "--include-last-connections",
+            action="store_true",
+            help="Also delete connections that are the only way their user can log in",
+        )
+
+    def handle(self, *args, **options):
+        queryset = OAuthConnection.objects.dead()
+        if not options["include_last_connections"]:
+            queryset = queryset.without_last_logins()
+        if options["provider_keys"]:
+            queryset = queryset.filter(provider_key__in=options["provider_keys"])
+
+        database = router.db_for_write(OAuthConnection)
+        queryset = queryset.using(database)
+        # The dead conditions join the user table, which doesn't need to be locked
+        lock_kwargs = {}
+        if connections[database].features.has_select_for_update_of:
+            lock_kwargs["of"] = ("self",)
+
+        providers = {}
+        deleted = 0
+        revoke_failed = 0
+        last_pk = options["after_id"]
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            while True:
+                batch = list(
+                    queryset.filter(pk__gt=last_pk)
+                    .order_by("pk")
+                    .only(
+                        "pk",
+                        "user_id",
+                        "provider_key",
+                        "provider_user_id",
+                        "access_token",
+                        "refresh_token",
+                        "access_token_expires_at",
+                        "refresh_token_expires_at",
+                    )[: options["batch_size"]]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                if options["dry_run"]:
+                    for connection in batch:
+                        self.stdout.write(
+                            f"Would delete {connection.provider_key} connection {connection.pk}"
+                        )
+                    deleted += len(batch)
+                    continue
+
+                if options["revoke"]:
+                    for provider_key in {
+                        connection.provider_key for connection in batch
+                    }:
+                        if provider_key not in providers:
+                            providers[provider_key] = self.get_provider(provider_key)
+
+                    errors = executor.map(
+                        lambda connection: self.revoke_token(
+                            providers[connection.provider_key], connection
+                        ),
+                        batch,
+                    )
+                    for connection, error in zip(batch, errors):
+                        if error:
+                            # The connection is dead either way, so it's still deleted
+                            revoke_failed += 1
+                            self.stderr.write(
+                                f"Failed to revoke {connection.pk}: {error}"
+                            )
+
+                # Checking the dead conditions again means a connection
+                # that was refreshed in the meantime is left alone.
+                # That's a separate locking SELECT, so the DELETE itself is a plain
+                # one by pk (MySQL can't delete from a table its subquery reads).
+                # Short transactions, one per batch, so locks are only held briefly.
+                with transaction.atomic(using=database):
+                    rechecked = list(
+                        queryset.filter(pk__in=[connection.pk for connection in batch])
+                        .select_for_update(**lock_kwargs)
+                        .values_list("pk", flat=True)
+                    )
+                    batch_deleted, _ = (
+                        OAuthConnection.objects.using(database)
+                        .filter(pk__in=rechecked)
+                        .delete()
+                    )
+                deleted += batch_deleted
+
+                invalidate_identities(
+                    [
+                        (connection.provider_key, connection.provider_user_id)
+                        for connection in batch
+                    ]
+                )
+                for user_id in {connection.user_id for connection in batch}:
+                    invalidate_user_connections(user_id)
+
+                self.stdout.write(
+                    f"Deleted {batch_deleted} connections (resume with --after-id {last_pk})"
+                )
+
+                if options["sleep"]:
+                    time.sleep(options["sleep"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"Would delete {deleted} connections")
+        else:
+            self.stdout.write(
+                f"Deleted {deleted} connections ({revoke_failed} failed to revoke)"
+            )
+
+    def get_provider(self, provider_key):
+        try:
+            return get_oauth_provider_instance(provider_key=provider_key)
+        except Exception as e:
+            # Likely a provider that was removed, whose connections still need deleting
+            return e
+
+    def revoke_token(self, provider, connection):
+        if isinstance(provider, Exception):
+            return provider
+
+        try:
+            provider.revoke_oauth_token(oauth_token=connection.get_oauth_token())
+        except NotImplementedError:
+            # The provider doesn't support revoking
+            return None
+        except Exception as e:
+            return e
+        return None
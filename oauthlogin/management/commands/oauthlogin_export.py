@@ -0,0 +1,101 @@
+import csv
+import datetime
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from oauthlogin.models import OAuthConnection
+
+# Users are referred to by email, so the rows can be imported into another database
+EXPORT_FIELDS = (
+    "user_email",
+    "provider_key",
+    "provider_user_id",
+    "access_token",
+    "refresh_token",
+    "access_token_expires_at",
+    "refresh_token_expires_at",
+    "profile",
+    "profile_fetched_at",
+)
+
+
+class Command(BaseCommand):
+    help = "Stream OAuth connections to a JSON lines or CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            help="The file to write to (defaults to stdout)",
+        )
+        parser.add_argument(
+            "--format",
+            choices=["jsonl", "csv"],
+            help="Defaults to the --output file extension, or jsonl",
+        )
+        parser.add_argument(
+            "--provider",
+            action="append",
+            dest="provider_keys",
+            help="Only export connections for this provider key (can be repeated)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        format = options["format"]
+        if not format:
+            format = (
+                "csv"
+                if options["output"] and options["output"].endswith(".csv")
+                else "jsonl"
+            )
+
+        queryset = (
+            OAuthConnection.objects.using(options["database"])
+            .order_by("pk")
+            .values(*EXPORT_FIELDS[1:], user_email=F("user__email"))
+        )
+        if options["provider_keys"]:
+            queryset = queryset.filter(provider_key__in=options["provider_keys"])
+
+        if options["output"]:
+            output = open(options["output"], "w", newline="")
+        else:
+            output = sys.stdout
+
+        try:
+            exported = self.write_rows(
+                output, format, queryset.iterator(chunk_size=options["chunk_size"])
+            )
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        self.stderr.write(f"Exported {exported} connections")
+
+    def write_rows(self, output, format, rows):
+        exported = 0
+
+        if format == "csv":
+            writer = csv.DictWriter(output, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+
+        for row in rows:
+            # Full precision datetimes, which the import parses back
+            for key, value in row.items():
+                if isinstance(value, datetime.datetime):
+                    row[key] = value.isoformat()
+
+            if format == "csv":
+                if row["profile"] is not None:
+                    row["profile"] = json.dumps(row["profile"])
+                writer.writerow(row)
+            else:
+                output.write(json.dumps(row) + "\n")
+
+            exported += 1
+
+        return exported
@@ -0,0 +1,163 @@
+import csv
+import itertools
+import json
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from oauthlogin.cache import invalidate_user_connections
+from oauthlogin.models import OAuthConnection, get_access_token_digest
+
+# The fields that --on-conflict update overwrites on an existing connection
+UPDATE_FIELDS = (
+    "access_token",
+    "access_token_digest",
+    "refresh_token",
+    "access_token_expires_at",
+    "refresh_token_expires_at",
+    "profile",
+    "profile_fetched_at",
+)
+
+
+class Command(BaseCommand):
+    help = "Import OAuth connections from a JSON lines or CSV file (like oauthlogin_export makes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=["jsonl", "csv"],
+            help="Defaults to the file extension, or jsonl",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--on-conflict",
+            choices=["ignore", "update"],
+            default="ignore",
+            help="What to do when a connection with the same provider_key and provider_user_id exists",
+        )
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        format = options["format"] or (
+            "csv" if options["path"].endswith(".csv") else "jsonl"
+        )
+        database = options["database"]
+
+        if options["on_conflict"] == "update":
+            if django.VERSION < (4, 1):
+                raise CommandError("--on-conflict update requires Django 4.1 or later")
+            bulk_create_kwargs = {
+                "update_conflicts": True,
+                "unique_fields": ["provider_key", "provider_user_id"],
+                "update_fields": list(UPDATE_FIELDS) + ["updated_at"],
+            }
+        else:
+            bulk_create_kwargs = {"ignore_conflicts": True}
+
+        created = 0
+        conflicts = 0
+        skipped = 0
+
+        with open(options["path"], newline="") as f:
+            if format == "csv":
+                rows = csv.DictReader(f)
+            else:
+                rows = (json.loads(line) for line in f if line.strip())
+
+            while True:
+                batch = list(itertools.islice(rows, options["batch_size"]))
+                if not batch:
+                    break
+
+                # One query per batch to match the rows to users by email
+                user_ids = dict(
+                    get_user_model()
+                    .objects.using(database)
+                    .filter(email__in={row["user_email"] for row in batch})
+                    .values_list("email", "pk")
+                )
+
+                connections = []
+                for row in batch:
+                    if row["user_email"] not in user_ids:
+                        skipped += 1
+                        self.stderr.write(
+                            f"Skipping {row['provider_key']} connection {row['provider_user_id']}, no user with email {row['user_email']}"
+                        )
+                        continue
+
+                    connections.append(
+                        self.build_connection(row, user_ids[row["user_email"]])
+                    )
+
+                # bulk_create() doesn't say which rows hit a conflict, so look first
+                # (a superset of the existing pairs, narrowed down below)
+                existing = set(
+                    OAuthConnection.objects.using(database)
+                    .filter(
+                        provider_key__in={c.provider_key for c in connections},
+                        provider_user_id__in={c.provider_user_id for c in connections},
+                    )
+                    .values_list("provider_key", "provider_user_id")
+                )
+                new = {
+                    (c.provider_key, c.provider_user_id) for c in connections
+                } - existing
+
+                OAuthConnection.objects.using(database).bulk_create(
+                    connections, **bulk_create_kwargs
+                )
+                created += len(new)
+                conflicts += len(connections) - len(new)
+
+                for user_id in {connection.user_id for connection in connections}:
+                    invalidate_user_connections(user_id)
+
+        if options["on_conflict"] == "update":
+            conflicts_message = f"{conflicts} existing updated"
+        else:
+            conflicts_message = f"{conflicts} existing left alone"
+
+        self.stdout.write(
+            f"Created {created} connections ({conflicts_message}, {skipped} skipped without a matching user)"
+        )
+
+    def build_connection(self, row, user_id):
+        try:
+            profile = row.get("profile") or None
+            if isinstance(profile, str):
+                # CSV stores the profile as a JSON string
+                profile = json.loads(profile)
+
+            return OAuthConnection(
+                user_id=user_id,
+                provider_key=row["provider_key"],
+                provider_user_id=row["provider_user_id"],
+                access_token=row["access_token"],
+                access_token_digest=get_access_token_digest(row["access_token"]),
+                refresh_token=row.get("refresh_token") or "",
+                access_token_expires_at=self.parse_datetime(
+                    row.get("access_token_expires_at")
+                ),
+                refresh_token_expires_at=self.parse_datetime(
+                    row.get("refresh_token_expires_at")
+                ),
+                profile=profile,
+                profile_fetched_at=self.parse_datetime(row.get("profile_fetched_at")),
+            )
+        except (KeyError, ValueError) as e:
+            raise CommandError(
+                f"Invalid {row.get('provider_key')} connection {row.get('provider_user_id')}: {e}"
+            )
+
+    def parse_datetime(self, value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f"Invalid datetime {value!r}")
+        return parsed
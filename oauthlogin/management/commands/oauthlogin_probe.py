@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from oauthlogin.exceptions import OAuthRateLimitError
+from oauthlogin.models import OAuthConnection, get_dead_connections_q
+from oauthlogin.providers import get_oauth_provider_instance, get_provider_keys
+
+
+class Command(BaseCommand):
+    help = "Check which saved access tokens still work, and mark the ones that don't"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--provider",
+            action="append",
+            dest="provider_keys",
+            help="Only probe connections for this provider key (can be repeated)",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=16,
+            help="The number of probe requests to make at the same time",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="A file to save progress in, so an interrupted run can pick up where it left off",
+        )
+        parser.add_argument(
+            "--max-rate-limit-wait",
+            type=int,
+            default=60 * 5,
+            help="Stop (and resume later) instead of waiting longer than this many seconds on a rate limit",
+        )
+
+    def handle(self, *args, **options):
+        self.max_rate_limit_wait = options["max_rate_limit_wait"]
+        # Per provider, when requests can start again after a rate limit (time.monotonic)
+        self.paused_until = {}
+        self.paused_lock = threading.Lock()
+
+        self.providers = {}
+        for provider_key in options["provider_keys"] or get_provider_keys():
+            provider = get_oauth_provider_instance(provider_key=provider_key)
+            if provider.get_probe_url():
+                self.providers[provider_key] = provider
+            else:
+                self.stderr.write(f"Skipping {provider_key}, it has no probe_url")
+
+        if not self.providers:
+            return
+
+        # Expired tokens don't need a probe (they need a refresh)
+        queryset = (
+            OAuthConnection.objects.filter(provider_key__in=self.providers.keys())
+            .exclude(get_dead_connections_q())
+            .filter(
+                Q(access_token_expires_at__isnull=True)
+                | Q(access_token_expires_at__gt=timezone.now())
+            )
+            .order_by("pk")
+            .only(
+                "pk",
+                "provider_key",
+                "access_token",
+                "refresh_token",
+                "access_token_expires_at",
+                "refresh_token_expires_at",
+            )
+        )
+
+        last_pk = self.read_checkpoint(options["checkpoint"])
+        valid = 0
+        invalid = 0
+        failed = 0
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk)[: options["batch_size"]])
+                if not batch:
+                    break
+
+                results = list(executor.map(self.probe, batch))
+
+                invalid_pks = []
+                rate_limit_error = None
+                for connection, (token_valid, error) in zip(batch, results):
+                    if isinstance(error, OAuthRateLimitError):
+                        rate_limit_error = error
+                    elif error:
+                        failed += 1
+                        self.stderr.write(f"Failed to probe {connection.pk}: {error}")
+                    elif token_valid:
+                        valid += 1
+                    else:
+                        invalid += 1
+                        invalid_pks.append(connection.pk)
+
+                # Marked in bulk, and left alone if they've gotten a new token since
+                OAuthConnection.objects.filter(
+                    pk__in=invalid_pks,
+                    invalidated_at__isnull=True,
+                    access_token__in=[
+                        connection.access_token
+                        for connection in batch
+                        if connection.pk in invalid_pks
+                    ],
+                ).update(invalidated_at=timezone.now())
+
+                if rate_limit_error:
+                    # The batch is probed again when the run is resumed
+                    raise CommandError(
+                        f"{rate_limit_error}, resume after {last_pk} with the same --checkpoint"
+                    )
+
+                last_pk = batch[-1].pk
+                self.write_checkpoint(options["checkpoint"], last_pk)
+
+        if options["checkpoint"] and os.path.exists(options["checkpoint"]):
+            # Finished, so the next run starts from the beginning
+            os.remove(options["checkpoint"])
+
+        self.stdout.write(
+            f"Probed {valid + invalid + failed} access tokens ({valid} valid, {invalid} invalid, {failed} failed)"
+        )
+
+    def probe(self, connection):
+        provider = self.providers[connection.provider_key]
+
+        while True:
+            with self.paused_lock:
+                wait = (
+                    self.paused_until.get(provider.provider_key, 0) - time.monotonic()
+                )
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                return (
+                    provider.probe_oauth_token(
+                        oauth_token=connection.get_oauth_token()
+                    ),
+                    None,
+                )
+            except OAuthRateLimitError as e:
+                if e.retry_after > self.max_rate_limit_wait:
+                    return None, e
+                # Every thread for this provider waits, not just this one
+                with self.paused_lock:
+                    self.paused_until[provider.provider_key] = max(
+                        self.paused_until.get(provider.provider_key, 0),
+                        time.monotonic() + e.retry_after,
+                    )
+            except Exception as e:
+                return None, e
+
+    def read_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return json.load(f)["last_pk"]
+
+    def write_checkpoint(self, path, last_pk):
+        if not path:
+            return
+        # Replaced in one step, so an interruption can't leave a partial file
+        with open(path + ".tmp", "w") as f:
+            json.dump({"last_pk": last_pk}, f)
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,214 @@
+import datetime
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from oauthlogin.models import OAuthConnection, OAuthLease
+from oauthlogin.providers import get_oauth_provider_instance
+from oauthlogin.refresher import RefreshScheduler
+
+LEASE_NAME = "oauthlogin_refresher"
+
+
+class Command(BaseCommand):
+    help = "Keep access tokens fresh by refreshing each one shortly before it expires"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--margin",
+            type=int,
+            default=60 * 5,
+            help="Refresh tokens this many seconds before they expire",
+        )
+        parser.add_argument(
+            "--horizon",
+            type=int,
+            default=60 * 60,
+            help="Keep tokens that expire within this many seconds in memory",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=int,
+            default=30,
+            help="Seconds between checks for new or changed connections",
+        )
+        parser.add_argument(
+            "--retry-delay",
+            type=int,
+            default=60,
+            help="Seconds to wait before retrying a failed refresh (doubled on each failure in a row)",
+        )
+        parser.add_argument(
+            "--max-retry-delay",
+            type=int,
+            default=60 * 60,
+            help="The longest wait between retries of a failed refresh",
+        )
+        parser.add_argument(
+            "--provider",
+            action="append",
+            dest="provider_keys",
+            help="Only refresh connections for this provider key (can be repeated)",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="The number of refresh requests to make at the same time",
+        )
+        parser.add_argument(
+            "--lease-duration",
+            type=int,
+            default=60,
+            help="Seconds another refresher waits to take over if this one stops",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Refresh the tokens that are due and exit",
+        )
+
+    def handle(self, *args, **options):
+        margin = datetime.timedelta(seconds=options["margin"])
+        poll_interval = options["poll_interval"]
+        lease_duration = datetime.timedelta(seconds=options["lease_duration"])
+        # Lease renewals need to happen well before it runs out
+        poll_interval = min(poll_interval, options["lease_duration"] // 2 or 1)
+        holder = f"{socket.gethostname()}:{os.getpid()}"
+
+        scheduler = RefreshScheduler(
+            horizon=datetime.timedelta(seconds=options["horizon"]),
+            provider_keys=options["provider_keys"],
+        )
+        self.providers = {}
+        # Failures in a row for each pk, for the retry backoff
+        self.retry_attempts = {}
+        self.retry_delay = options["retry_delay"]
+        self.max_retry_delay = options["max_retry_delay"]
+        self.chunk_size = options["concurrency"] * 4
+
+        def renew_lease():
+            return OAuthLease.acquire(
+                name=LEASE_NAME, holder=holder, duration=lease_duration
+            )
+
+        try:
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                while True:
+                    if not renew_lease():
+                        # Another refresher is running, start over if we take over later
+                        scheduler.clear()
+                        self.retry_attempts.clear()
+                        if options["once"]:
+                            self.stdout.write("Another refresher holds the lease")
+                            return
+                        time.sleep(poll_interval)
+                        continue
+
+                    scheduler.load()
+
+                    due = scheduler.pop_due(margin=margin)
+                    if due:
+                        self.refresh(executor, scheduler, due, margin, renew_lease)
+
+                    if options["once"]:
+                        return
+
+                    # Sleep until the next token is due, or the next poll
+                    sleep = poll_interval
+                    next_due_at = scheduler.next_due_at(margin=margin)
+                    if next_due_at is not None:
+                        sleep = min(
+                            sleep,
+                            max((next_due_at - timezone.now()).total_seconds(), 0),
+                        )
+                    time.sleep(sleep)
+        finally:
+            OAuthLease.release(name=LEASE_NAME, holder=holder)
+
+    def refresh(self, executor, scheduler, pks, margin, renew_lease):
+        # Check they're still due, the token may have been refreshed elsewhere
+        connections = list(
+            scheduler.get_queryset().filter(
+                pk__in=pks, access_token_expires_at__lte=timezone.now() + margin
+            )
+        )
+
+        for provider_key in {connection.provider_key for connection in connections}:
+            if provider_key in self.providers:
+                continue
+            try:
+                self.providers[provider_key] = get_oauth_provider_instance(
+                    provider_key=provider_key
+                )
+            except Exception as e:
+                # A removed or broken provider shouldn't stop the others from
+                # being refreshed, its connections are dropped from the schedule
+                self.stderr.write(
+                    f'Skipping connections for the OAuth provider "{provider_key}": {e!r}'
+                )
+
+        connections = [
+            connection
+            for connection in connections
+            if connection.provider_key in self.providers
+        ]
+
+        refreshed = 0
+        attempted = 0
+
+        for i in range(0, len(connections), self.chunk_size):
+            # Renewed before each chunk, so a long run can't outlast the lease
+            # and overlap with another refresher using the same refresh tokens
+            if i and not renew_lease():
+                self.stderr.write("Lost the lease, stopping")
+                break
+
+            chunk = connections[i : i + self.chunk_size]
+            attempted += len(chunk)
+
+            # Only the provider requests happen in the threads,
+            # the results are saved here on the main thread
+            results = executor.map(
+                lambda connection: self.refresh_token(
+                    self.providers[connection.provider_key], connection
+                ),
+                chunk,
+            )
+
+            for connection, (oauth_token, error) in zip(chunk, results):
+                if error:
+                    self.stderr.write(f"Failed to refresh {connection}: {error}")
+                    # Only counted if the provider rejected the refresh token
+                    connection.record_refresh_failure(error)
+                    self.schedule_retry(scheduler, connection, margin)
+                    continue
+
+                self.retry_attempts.pop(connection.pk, None)
+                connection.set_token_fields(oauth_token)
+                connection.save()
+                refreshed += 1
+
+        self.stdout.write(f"Refreshed {refreshed} of {attempted} access tokens")
+
+    def schedule_retry(self, scheduler, connection, margin):
+        attempts = self.retry_attempts.get(connection.pk, 0)
+        self.retry_attempts[connection.pk] = attempts + 1
+        delay = min(self.retry_delay * 2**attempts, self.max_retry_delay)
+        scheduler.schedule(
+            connection.pk,
+            timezone.now() + margin + datetime.timedelta(seconds=delay),
+        )
+
+    def refresh_token(self, provider, connection):
+        try:
+            return (
+                provider.refresh_oauth_token(oauth_token=connection.get_oauth_token()),
+                None,
+            )
+        except Exception as e:
+            return None, e
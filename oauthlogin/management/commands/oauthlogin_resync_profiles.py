@@ -0,0 +1,122 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from oauthlogin.cache import invalidate_identities, invalidate_user_connections
+from oauthlogin.models import OAuthConnection, get_profile_max_age
+from oauthlogin.providers import get_oauth_provider_instance
+
+
+class Command(BaseCommand):
+    help = "Refetch provider profiles for connections with a missing or stale snapshot"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            help="Resync profiles older than this many seconds (defaults to OAUTH_LOGIN_PROFILE_MAX_AGE)",
+        )
+        parser.add_argument(
+            "--provider",
+            action="append",
+            dest="provider_keys",
+            help="Only resync connections for this provider key (can be repeated)",
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="The number of provider requests to make at the same time",
+        )
+
+    def handle(self, *args, **options):
+        if options["max_age"] is not None:
+            max_age = datetime.timedelta(seconds=options["max_age"])
+        else:
+            max_age = get_profile_max_age()
+
+        queryset = OAuthConnection.objects.filter(
+            Q(profile_fetched_at__isnull=True)
+            | Q(profile_fetched_at__lt=timezone.now() - max_age)
+        ).order_by("pk")
+        if options["provider_keys"]:
+            queryset = queryset.filter(provider_key__in=options["provider_keys"])
+
+        providers = {}
+        resynced = 0
+        failed = 0
+        last_pk = 0
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk)[: options["batch_size"]])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                for connection in batch:
+                    if connection.provider_key not in providers:
+                        providers[
+                            connection.provider_key
+                        ] = get_oauth_provider_instance(
+                            provider_key=connection.provider_key
+                        )
+
+                # Only the provider requests happen in the threads,
+                # the results are saved here on the main thread
+                results = executor.map(
+                    lambda connection: self.fetch_profile(
+                        providers[connection.provider_key], connection
+                    ),
+                    batch,
+                )
+
+                profile_updates = []
+                identities = []
+                for connection, (oauth_token, oauth_user, error) in zip(batch, results):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f"Failed to resync {connection}: {error}")
+                        continue
+
+                    resynced += 1
+                    if oauth_token:
+                        connection.set_user_fields(oauth_user)
+                        connection.set_token_fields(oauth_token)
+                        connection.save()
+                    else:
+                        profile_updates.append(connection)
+                        identities.append(
+                            (connection.provider_key, connection.provider_user_id)
+                        )
+                        connection.set_user_fields(oauth_user)
+
+                OAuthConnection.objects.bulk_update(
+                    profile_updates, ["profile", "profile_fetched_at"]
+                )
+                # bulk_update() skips save(), so clear what it would have
+                # (the cached identities still have the old profile_fetched_at)
+                invalidate_identities(identities)
+                for user_id in {connection.user_id for connection in profile_updates}:
+                    invalidate_user_connections(user_id)
+
+        self.stdout.write(f"Resynced {resynced} profiles ({failed} failed)")
+
+    def fetch_profile(self, provider, connection):
+        try:
+            oauth_token = connection.get_oauth_token()
+            refreshed_oauth_token = None
+            if connection.access_token_expired() and oauth_token.refresh_token:
+                refreshed_oauth_token = provider.refresh_oauth_token(
+                    oauth_token=oauth_token
+                )
+                oauth_token = refreshed_oauth_token
+
+            oauth_user = provider.get_oauth_user(oauth_token=oauth_token)
+            return refreshed_oauth_token, oauth_user, None
+        except Exception as e:
+            return None, None, e
@@ -0,0 +1,103 @@
+import datetime
+import json
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from oauthlogin.models import OAuthConnection
+
+STAT_NAMES = (
+    "connections",
+    "access_token_expired",
+    "access_token_expiring",
+    "no_refresh_token",
+    "refresh_token_expired",
+)
+
+
+class Command(BaseCommand):
+    help = "Print connection and token expiration counts per provider"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["text", "json"], default="text")
+        parser.add_argument(
+            "--expiring-within",
+            type=int,
+            default=60 * 60 * 24,
+            help="Count access tokens that expire within this many seconds as expiring (default 1 day)",
+        )
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expiring_before = now + datetime.timedelta(seconds=options["expiring_within"])
+        connections = OAuthConnection.objects.using(options["database"])
+
+        # Everything per provider comes from one pass over the table
+        rows = (
+            connections.order_by("provider_key")
+            .values("provider_key")
+            .annotate(
+                connections=Count("pk"),
+                access_token_expired=Count(
+                    "pk", filter=Q(access_token_expires_at__lt=now)
+                ),
+                access_token_expiring=Count(
+                    "pk",
+                    filter=Q(
+                        access_token_expires_at__gte=now,
+                        access_token_expires_at__lt=expiring_before,
+                    ),
+                ),
+                no_refresh_token=Count("pk", filter=Q(refresh_token="")),
+                refresh_token_expired=Count(
+                    "pk", filter=Q(refresh_token_expires_at__lt=now)
+                ),
+            )
+        )
+
+        # Users that would be locked out if their only connection stopped working
+        single_connection_users = (
+            connections.filter(user__password__startswith=UNUSABLE_PASSWORD_PREFIX)
+            .order_by()
+            .values("user")
+            .annotate(count=Count("pk"))
+            .filter(count=1)
+            .count()
+        )
+
+        providers = {row.pop("provider_key"): row for row in rows}
+        totals = {
+            name: sum(row[name] for row in providers.values()) for name in STAT_NAMES
+        }
+
+        if options["format"] == "json":
+            self.stdout.write(
+                json.dumps(
+                    {
+                        "generated_at": now.isoformat(),
+                        "providers": providers,
+                        "totals": totals,
+                        "single_connection_users_without_password": single_connection_users,
+                    }
+                )
+            )
+            return
+
+        header = ["provider"] + list(STAT_NAMES)
+        table = [header]
+        for provider_key, row in providers.items():
+            table.append([provider_key] + [str(row[name]) for name in STAT_NAMES])
+        table.append(["total"] + [str(totals[name]) for name in STAT_NAMES])
+
+        widths = [max(len(row[i]) for row in table) for i in range(len(header))]
+        for row in table:
+            self.stdout.write(
+                "  ".join(value.ljust(width) for value, width in zip(row, widths))
+            )
+
+        self.stdout.write(
+            f"\nUsers with a single connection and no usable password: {single_connection_users}"
+        )
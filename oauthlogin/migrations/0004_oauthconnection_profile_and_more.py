@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauthlogin", "0003_alter_oauthconnection_access_token_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="oauthconnection",
+            name="profile",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="oauthconnection",
+            name="profile_fetched_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
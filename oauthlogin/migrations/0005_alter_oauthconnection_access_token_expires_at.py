@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauthlogin", "0004_oauthconnection_profile_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="oauthconnection",
+            name="access_token_expires_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauthlogin", "0005_alter_oauthconnection_access_token_expires_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="oauthconnection",
+            name="refresh_failures",
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name="oauthconnection",
+            name="refresh_token_expires_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
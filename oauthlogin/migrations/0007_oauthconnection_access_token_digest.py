@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauthlogin", "0006_oauthconnection_refresh_failures"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="oauthconnection",
+            name="access_token_digest",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
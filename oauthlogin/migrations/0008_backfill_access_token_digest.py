@@ -0,0 +1,45 @@
+import hashlib
+
+from django.db import migrations
+
+
+def backfill_access_token_digest(apps, schema_editor):
+    OAuthConnection = apps.get_model("oauthlogin", "OAuthConnection")
+    connections = (
+        OAuthConnection.objects.using(schema_editor.connection.alias)
+        .filter(access_token_digest="")
+        .exclude(access_token="")
+        .order_by("pk")
+        .only("pk", "access_token")
+    )
+
+    last_pk = 0
+    while True:
+        batch = list(connections.filter(pk__gt=last_pk)[:1000])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        for connection in batch:
+            connection.access_token_digest = hashlib.sha256(
+                connection.access_token.encode()
+            ).hexdigest()
+
+        OAuthConnection.objects.using(schema_editor.connection.alias).bulk_update(
+            batch, ["access_token_digest"]
+        )
+
+
+class Migration(migrations.Migration):
+    # Each batch is committed on its own instead of one long transaction
+    atomic = False
+
+    dependencies = [
+        ("oauthlogin", "0007_oauthconnection_access_token_digest"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_access_token_digest, reverse_code=migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauthlogin", "0008_backfill_access_token_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OAuthLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("holder", models.CharField(max_length=255)),
+                ("expires_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "OAuth Lease",
+            },
+        ),
+        migrations.AlterField(
+            model_name="oauthconnection",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauthlogin", "0009_oauthlease_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="oauthconnection",
+            name="invalidated_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
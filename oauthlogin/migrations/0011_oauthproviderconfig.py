@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("oauthlogin", "0010_oauthconnection_invalidated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OAuthProviderConfig",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("provider_key", models.SlugField(max_length=100, unique=True)),
+                ("provider_class", models.CharField(max_length=255)),
+                ("client_id", models.CharField(max_length=255)),
+                ("client_secret", models.CharField(blank=True, max_length=255)),
+                ("kwargs", models.JSONField(blank=True, default=dict)),
+                ("enabled", models.BooleanField(default=True)),
+            ],
+            options={
+                "verbose_name": "OAuth Provider Config",
+            },
+        ),
+    ]
@@ -1,24 +1,162 @@
-from typing import TYPE_CHECKING
+import datetime
+import hashlib
+import logging
+import time
+from typing import TYPE_CHECKING, Optional
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.checks import Error
-from django.db import models
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.checks import Error, Warning
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import models, router, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery
 from django.db.utils import IntegrityError, OperationalError, ProgrammingError
 from django.utils import timezone
 
-from .exceptions import OAuthUserAlreadyExistsError
+from .cache import (
+    get_cached_identity,
+    invalidate_identities,
+    invalidate_user_connections,
+    set_cached_identity,
+)
+from .exceptions import (
+    OAuthCannotDisconnectError,
+    OAuthRefreshTokenRejectedError,
+    OAuthUserAlreadyExistsError,
+)
+from .revocation import get_revoke_tokens, revoke_tokens_on_commit
+from .routers import reading_from_replica, use_primary
 
 if TYPE_CHECKING:
+    from .http import OAuthAPIClient
     from .providers import OAuthToken, OAuthUser
 
+logger = logging.getLogger(__name__)
+
+
+def get_profile_max_age() -> datetime.timedelta:
+    return datetime.timedelta(
+        seconds=getattr(settings, "OAUTH_LOGIN_PROFILE_MAX_AGE", 60 * 60 * 24)
+    )
+
+
+def get_refresh_profiles_on_login() -> bool:
+    return getattr(settings, "OAUTH_LOGIN_REFRESH_PROFILES_ON_LOGIN", False)
+
+
+def get_max_refresh_failures() -> int:
+    return getattr(settings, "OAUTH_LOGIN_MAX_REFRESH_FAILURES", 5)
+
+
+def get_access_token_digest(access_token: str) -> str:
+    if not access_token:
+        return ""
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def is_refresh_token_rejected(error: Exception) -> bool:
+    """
+    Whether a refresh failed because the provider rejected the refresh token,
+    instead of something that may go away on its own (a timeout, an outage, a rate limit).
+    """
+    if isinstance(error, OAuthRefreshTokenRejectedError):
+        return True
+
+    # A requests.HTTPError from raise_for_status() on the token response
+    response = getattr(error, "response", None)
+    if response is None or response.status_code not in (400, 401):
+        return False
+
+    try:
+        data = response.json()
+    except ValueError:
+        return False
+
+    return isinstance(data, dict) and data.get("error") == "invalid_grant"
+
+
+def get_dead_connections_q() -> Q:
+    now = timezone.now()
+    return (
+        Q(refresh_token_expires_at__lt=now, access_token_expires_at__lt=now)
+        | Q(refresh_failures__gte=get_max_refresh_failures())
+        | Q(invalidated_at__isnull=False)
+    )
+
 
 # django check for deploy that ensures all provider keys in db are also in settings?
 
 
+class OAuthConnectionQuerySet(models.QuerySet):
+    def get_by_access_token(self, access_token: str) -> "OAuthConnection":
+        """
+        Find the connection for a provider access token, using the indexed digest.
+        """
+        return self.get(
+            access_token_digest=get_access_token_digest(access_token),
+            access_token=access_token,
+        )
+
+    def get_with_fallback(self, **kwargs) -> "OAuthConnection":
+        """
+        Like get(), but if the row isn't found on the read database
+        then look on the primary too, in case it was just written.
+        """
+        try:
+            return self.get(**kwargs)
+        except self.model.DoesNotExist:
+            if not reading_from_replica():
+                raise
+
+        with use_primary():
+            return self.get(**kwargs)
+
+    def dead(self) -> "OAuthConnectionQuerySet":
+        """
+        Connections that can't get a working access token anymore:
+        the refresh token has expired along with the access token,
+        refreshing has failed OAUTH_LOGIN_MAX_REFRESH_FAILURES times in a row,
+        or the provider said the tokens were revoked.
+        """
+        return self.filter(get_dead_connections_q())
+
+    def without_last_logins(self) -> "OAuthConnectionQuerySet":
+        """
+        Exclude connections whose user has no usable password
+        and no other connection that still works.
+        """
+        other_working_connections = (
+            self.model._default_manager.filter(user=OuterRef("user"))
+            .exclude(pk=OuterRef("pk"))
+            .exclude(get_dead_connections_q())
+        )
+        return self.filter(
+            ~Q(user__password__startswith=UNUSABLE_PASSWORD_PREFIX)
+            | Exists(other_working_connections)
+        )
+
+    def with_disconnectable(self) -> "OAuthConnectionQuerySet":
+        """
+        Load the users and annotate each connection with its user's connection count,
+        so can_be_disconnected() on every row comes from this one query.
+        """
+        user_connection_count = (
+            self.model._default_manager.filter(user=OuterRef("user"))
+            .order_by()
+            .values("user")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return self.select_related("user").annotate(
+            user_connection_count=Subquery(user_connection_count)
+        )
+
+
 class OAuthConnection(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed for the refresher, which picks up changed connections by it
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -34,9 +172,27 @@ class OAuthConnection(models.Model):
 
     # Token data
     access_token = models.CharField(max_length=2000)
+    # The sha256 of the access token, so it can be looked up by index (see get_by_access_token)
+    access_token_digest = models.CharField(max_length=64, blank=True, db_index=True)
     refresh_token = models.CharField(max_length=2000, blank=True)
-    access_token_expires_at = models.DateTimeField(blank=True, null=True)
-    refresh_token_expires_at = models.DateTimeField(blank=True, null=True)
+    access_token_expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    refresh_token_expires_at = models.DateTimeField(
+        blank=True, null=True, db_index=True
+    )
+
+    # Consecutive refreshes the provider rejected (see is_refresh_token_rejected),
+    # reset by new tokens
+    refresh_failures = models.PositiveIntegerField(default=0, db_index=True)
+
+    # When the provider said the tokens were revoked (by a webhook), cleared by new tokens
+    invalidated_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    # Snapshot of the provider's user profile (username, email, raw data)
+    # from the last time it was fetched
+    profile = models.JSONField(blank=True, null=True)
+    profile_fetched_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    objects = OAuthConnectionQuerySet.as_manager()
 
     class Meta:
         unique_together = ("provider_key", "provider_user_id")
@@ -46,36 +202,106 @@ class OAuthConnection(models.Model):
     def __str__(self):
         return f"{self.provider_key}[{self.user}:{self.provider_user_id}]"
 
-    def refresh_access_token(self) -> None:
-        from .providers import OAuthToken, get_oauth_provider_instance
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_user_connections(self.user_id)
+        # Cached once it's committed, so a rollback can't leave a wrong entry behind
+        transaction.on_commit(lambda: set_cached_identity(self), using=self._state.db)
 
-        provider_instance = get_oauth_provider_instance(provider_key=self.provider_key)
-        oauth_token = OAuthToken(
+    def delete(self, *args, **kwargs):
+        invalidate_identities([(self.provider_key, self.provider_user_id)])
+        deleted = super().delete(*args, **kwargs)
+        invalidate_user_connections(self.user_id)
+        return deleted
+
+    def get_oauth_token(self) -> "OAuthToken":
+        from .providers import OAuthToken
+
+        return OAuthToken(
             access_token=self.access_token,
             refresh_token=self.refresh_token,
             access_token_expires_at=self.access_token_expires_at,
             refresh_token_expires_at=self.refresh_token_expires_at,
         )
-        refreshed_oauth_token = provider_instance.refresh_oauth_token(
-            oauth_token=oauth_token
-        )
+
+    def refresh_access_token(self) -> None:
+        from .providers import get_oauth_provider_instance
+
+        provider_instance = get_oauth_provider_instance(provider_key=self.provider_key)
+        try:
+            refreshed_oauth_token = provider_instance.refresh_oauth_token(
+                oauth_token=self.get_oauth_token()
+            )
+        except Exception as e:
+            self.record_refresh_failure(e)
+            raise
+
         self.set_token_fields(refreshed_oauth_token)
         self.save()
 
+    def record_refresh_failure(self, error: Exception) -> bool:
+        """
+        Count a failed refresh towards OAUTH_LOGIN_MAX_REFRESH_FAILURES,
+        if the provider rejected the refresh token. Other errors are only logged.
+
+        Returns whether it was counted.
+        """
+        if not is_refresh_token_rejected(error):
+            logger.warning("Failed to refresh %s (will retry): %s", self, error)
+            return False
+
+        # Counted in the database so concurrent failures all add up
+        type(self).objects.filter(pk=self.pk).update(
+            refresh_failures=F("refresh_failures") + 1
+        )
+        return True
+
+    def api(self, **kwargs) -> "OAuthAPIClient":
+        """
+        Get a client for making provider API requests as this connection's user.
+        """
+        from .http import OAuthAPIClient
+
+        return OAuthAPIClient(self, **kwargs)
+
     def set_token_fields(self, oauth_token: "OAuthToken"):
         self.access_token = oauth_token.access_token
+        self.access_token_digest = get_access_token_digest(oauth_token.access_token)
         self.refresh_token = oauth_token.refresh_token
         self.access_token_expires_at = oauth_token.access_token_expires_at
         self.refresh_token_expires_at = oauth_token.refresh_token_expires_at
+        # New tokens bring a dead connection back
+        self.refresh_failures = 0
+        self.invalidated_at = None
 
     def set_user_fields(self, oauth_user: "OAuthUser"):
         self.provider_user_id = oauth_user.id
+        self.profile = {
+            "username": oauth_user.username,
+            "email": oauth_user.email,
+            "data": oauth_user.data,
+        }
+        self.profile_fetched_at = timezone.now()
 
-    def can_be_disconnected(self) -> bool:
+    def profile_stale(self, max_age: Optional[datetime.timedelta] = None) -> bool:
+        if max_age is None:
+            max_age = get_profile_max_age()
         return (
-            self.user.has_usable_password() or self.user.oauth_connections.count() > 1
+            self.profile_fetched_at is None
+            or self.profile_fetched_at < timezone.now() - max_age
         )
 
+    def can_be_disconnected(self) -> bool:
+        if self.user.has_usable_password():
+            return True
+
+        # Annotated by with_disconnectable()
+        user_connection_count = getattr(self, "user_connection_count", None)
+        if user_connection_count is None:
+            user_connection_count = self.user.oauth_connections.count()
+
+        return user_connection_count > 1
+
     def access_token_expired(self) -> bool:
         return (
             self.access_token_expires_at is not None
@@ -93,10 +319,11 @@ class OAuthConnection(models.Model):
         cls, *, provider_key: str, oauth_token: "OAuthToken", oauth_user: "OAuthUser"
     ) -> "OAuthConnection":
         try:
-            connection = cls.objects.get(
+            connection = cls.objects.get_with_fallback(
                 provider_key=provider_key,
                 provider_user_id=oauth_user.id,
             )
+            connection.set_user_fields(oauth_user)
             connection.set_token_fields(oauth_token)
             connection.save()
             return connection
@@ -140,10 +367,142 @@ class OAuthConnection(models.Model):
         connection.save()
         return connection
 
+    @classmethod
+    def disconnect(
+        cls,
+        *,
+        user: settings.AUTH_USER_MODEL,
+        provider_key: str,
+        provider_user_id: str,
+    ) -> None:
+        """
+        Delete a user's connection, as long as they can still log in some other way.
+
+        For a user without a usable password, all of their connections are locked
+        (SELECT ... FOR UPDATE) before the check, so two disconnects at once
+        can't remove the last two connections.
+        """
+        connections = cls.objects.filter(
+            user=user,
+            provider_key=provider_key,
+            provider_user_id=provider_user_id,
+        )
+
+        if get_revoke_tokens():
+            oauth_tokens = [
+                connection.get_oauth_token()
+                for connection in connections.only(
+                    "access_token",
+                    "refresh_token",
+                    "access_token_expires_at",
+                    "refresh_token_expires_at",
+                )
+            ]
+        else:
+            oauth_tokens = []
+
+        if user.has_usable_password():
+            deleted, _ = connections.delete()
+            if not deleted:
+                raise cls.DoesNotExist()
+        else:
+            using = router.db_for_write(cls, instance=user)
+            with transaction.atomic(using=using):
+                user_connections = list(
+                    cls.objects.using(using)
+                    .select_for_update()
+                    .filter(user=user)
+                    .values_list("pk", "provider_key", "provider_user_id")
+                )
+                pks = [
+                    pk
+                    for pk, key, user_id in user_connections
+                    if key == provider_key and user_id == provider_user_id
+                ]
+                if not pks:
+                    raise cls.DoesNotExist()
+                if len(user_connections) == len(pks):
+                    raise OAuthCannotDisconnectError(
+                        "Cannot remove last OAuth connection without a usable password"
+                    )
+                cls.objects.using(using).filter(pk__in=pks).delete()
+
+        invalidate_identities([(provider_key, provider_user_id)])
+        invalidate_user_connections(user.pk)
+        revoke_tokens_on_commit(
+            [(provider_key, oauth_token) for oauth_token in oauth_tokens]
+        )
+
+    @classmethod
+    def update_from_identity_cache(
+        cls, *, provider_key: str, provider_user_id: str, oauth_token: "OAuthToken"
+    ) -> Optional["OAuthConnection"]:
+        """
+        Save new tokens on a returning user's connection
+        with one UPDATE by primary key, using the ids in the identity cache.
+
+        Returns None if the identity isn't cached, the cached profile is stale
+        (and OAUTH_LOGIN_REFRESH_PROFILES_ON_LOGIN is on),
+        or the cached connection no longer matches (then it's invalidated).
+        """
+        identity = get_cached_identity(provider_key, provider_user_id)
+        if identity is None:
+            return None
+
+        profile_fetched_at = None
+        if identity["profile_fetched_at"] is not None:
+            profile_fetched_at = datetime.datetime.fromtimestamp(
+                identity["profile_fetched_at"], tz=datetime.timezone.utc
+            )
+
+        # Built like a row from a query that only selected these fields,
+        # so the rest are deferred and save() won't write over them
+        connection = cls.from_db(
+            router.db_for_write(cls),
+            ["id", "user_id", "provider_key", "provider_user_id", "profile_fetched_at"],
+            [
+                identity["connection_id"],
+                identity["user_id"],
+                provider_key,
+                provider_user_id,
+                profile_fetched_at,
+            ],
+        )
+        if get_refresh_profiles_on_login() and connection.profile_stale():
+            return None
+
+        connection.set_token_fields(oauth_token)
+        connection.updated_at = timezone.now()
+        updated = (
+            cls.objects.using(connection._state.db)
+            .filter(
+                pk=connection.pk,
+                user_id=connection.user_id,
+                provider_key=provider_key,
+                provider_user_id=provider_user_id,
+            )
+            .update(
+                access_token=connection.access_token,
+                access_token_digest=connection.access_token_digest,
+                refresh_token=connection.refresh_token,
+                access_token_expires_at=connection.access_token_expires_at,
+                refresh_token_expires_at=connection.refresh_token_expires_at,
+                refresh_failures=0,
+                invalidated_at=None,
+                updated_at=connection.updated_at,
+            )
+        )
+        if not updated:
+            invalidate_identities([(provider_key, provider_user_id)])
+            return None
+
+        return connection
+
     @classmethod
     def check(cls, **kwargs):
         """
-        A system check for ensuring that provider_keys in the database are also present in settings.
+        A system check for ensuring that provider_keys in the database are also present in settings
+        (or in an enabled OAuthProviderConfig, if OAUTH_LOGIN_DATABASE_PROVIDERS is on).
 
         Note that the --database flag is required for this to work:
           python manage.py check --database default
@@ -154,30 +513,149 @@ class OAuthConnection(models.Model):
         if not databases:
             return errors
 
+        from .provider_configs import get_database_providers
         from .providers import get_provider_keys
 
+        keys_in_settings = set(get_provider_keys())
+        database_providers = get_database_providers()
+        max_unknown_keys = getattr(settings, "OAUTH_LOGIN_CHECK_MAX_UNKNOWN_KEYS", 5)
+        time_budget = getattr(settings, "OAUTH_LOGIN_CHECK_TIME_BUDGET", 10)
+
         for database in databases:
+            unknown_keys = []
+            deadline = time.monotonic() + time_budget
+            last_key = None
+
             try:
-                keys_in_db = set(
-                    cls.objects.using(database)
-                    .values_list("provider_key", flat=True)
-                    .distinct()
-                )
+                # Jump through the provider_key index one distinct key at a time
+                # (a "loose index scan"), which is one quick lookup per provider
+                # instead of a DISTINCT over every row in the table
+                while len(unknown_keys) < max_unknown_keys:
+                    if time.monotonic() > deadline:
+                        errors.append(
+                            Warning(
+                                f"Checking the OAuth providers in the {database} database took longer than {time_budget} seconds, so it was stopped early",
+                                id="oauthlogin.W001",
+                            )
+                        )
+                        break
+
+                    keys = cls.objects.using(database).order_by("provider_key")
+                    if last_key is not None:
+                        keys = keys.filter(provider_key__gt=last_key)
+                    last_key = keys.values_list("provider_key", flat=True).first()
+
+                    if last_key is None:
+                        break
+
+                    if last_key not in keys_in_settings and not (
+                        database_providers
+                        and OAuthProviderConfig.objects.using(database)
+                        .filter(provider_key=last_key, enabled=True)
+                        .exists()
+                    ):
+                        unknown_keys.append(last_key)
             except (OperationalError, ProgrammingError):
                 # Check runs on manage.py migrate, and the table may not exist yet
                 # or it may not be installed on the particular database intentionally
                 continue
 
-            keys_in_settings = set(get_provider_keys())
-
-            if keys_in_db - keys_in_settings:
-                errors.append(
-                    Error(
-                        "The following OAuth providers are in the database but not in the settings: {}".format(
-                            ", ".join(keys_in_db - keys_in_settings)
-                        ),
-                        id="oauthlogin.E001",
-                    )
+            if unknown_keys:
+                message = "The following OAuth providers are in the database but not in the settings: {}".format(
+                    ", ".join(unknown_keys)
                 )
+                if len(unknown_keys) >= max_unknown_keys:
+                    message += " (and possibly more)"
+                errors.append(Error(message, id="oauthlogin.E001"))
 
         return errors
+
+
+class OAuthLease(models.Model):
+    """
+    A lock held in the database for a limited time,
+    so only one of several processes (like the refresher) does the work.
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    holder = models.CharField(max_length=255)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "OAuth Lease"
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def acquire(cls, *, name: str, holder: str, duration: datetime.timedelta) -> bool:
+        """
+        Take (or renew) the lease if it's free, expired, or already ours.
+        """
+        now = timezone.now()
+        updated = (
+            cls.objects.filter(name=name)
+            .filter(Q(holder=holder) | Q(expires_at__lt=now))
+            .update(holder=holder, expires_at=now + duration)
+        )
+        if updated:
+            return True
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(name=name, holder=holder, expires_at=now + duration)
+        except IntegrityError:
+            # Somebody else holds it
+            return False
+
+        return True
+
+    @classmethod
+    def release(cls, *, name: str, holder: str) -> None:
+        cls.objects.filter(name=name, holder=holder).delete()
+
+
+class OAuthProviderConfig(models.Model):
+    """
+    A provider configured in the database instead of OAUTH_LOGIN_PROVIDERS,
+    like a customer's own SSO app (used when OAUTH_LOGIN_DATABASE_PROVIDERS is enabled).
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Used the same way as a key in OAUTH_LOGIN_PROVIDERS (which takes precedence)
+    provider_key = models.SlugField(max_length=100, unique=True)
+    provider_class = models.CharField(max_length=255)
+    client_id = models.CharField(max_length=255)
+    client_secret = models.CharField(max_length=255, blank=True)
+    # Any other kwargs for the provider class (scope, issuer, endpoints...)
+    kwargs = models.JSONField(default=dict, blank=True)
+    enabled = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = "OAuth Provider Config"
+
+    def __str__(self):
+        return self.provider_key
+
+    def clean(self):
+        from .providers import import_provider_class
+
+        try:
+            import_provider_class(self.provider_class)
+        except (ImportError, ImproperlyConfigured) as e:
+            raise ValidationError({"provider_class": str(e)})
+
+    def get_provider_settings(self) -> dict:
+        """
+        The same shape as an entry in OAUTH_LOGIN_PROVIDERS.
+        """
+        return {
+            "class": self.provider_class,
+            "kwargs": {
+                **self.kwargs,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+            },
+        }
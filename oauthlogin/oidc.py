@@ -0,0 +1,285 @@
+import datetime
+import logging
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .exceptions import OAuthError
+from .http import get_session
+from .providers import OAuthProvider, OAuthToken, OAuthUser
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_PATH = "/.well-known/openid-configuration"
+DISCOVERY_CACHE_KEY_PREFIX = "oauthlogin:oidc:discovery:"
+
+# In-process copies of discovery documents, keyed by issuer.
+# Each entry is {"document": dict, "fetched_at": float}.
+_discovery_documents: Dict[str, dict] = {}
+_refreshing_issuers: Set[str] = set()
+_refreshing_lock = threading.Lock()
+
+
+def get_discovery_ttl() -> int:
+    return getattr(settings, "OAUTH_LOGIN_OIDC_DISCOVERY_TTL", 60 * 60)
+
+
+def get_discovery_stale_ttl() -> int:
+    return getattr(settings, "OAUTH_LOGIN_OIDC_DISCOVERY_STALE_TTL", 60 * 60 * 24)
+
+
+def _cache_key(issuer: str) -> str:
+    return DISCOVERY_CACHE_KEY_PREFIX + issuer
+
+
+def _fetch_discovery_document(issuer: str) -> dict:
+    response = get_session(issuer).get(
+        issuer + DISCOVERY_PATH,
+        headers={
+            "Accept": "application/json",
+        },
+        timeout=10,
+    )
+    response.raise_for_status()
+    entry = {"document": response.json(), "fetched_at": time.time()}
+
+    _discovery_documents[issuer] = entry
+    # Keep it in the shared cache for the whole stale window,
+    # so other workers can serve it while one of them revalidates
+    cache.set(
+        _cache_key(issuer),
+        entry,
+        timeout=get_discovery_ttl() + get_discovery_stale_ttl(),
+    )
+    return entry
+
+
+def _fetch_locked_discovery_document(issuer: str) -> dict:
+    # The caller holds the lock, which is only released once the document is in
+    # the shared cache (or the fetch failed), so waiting workers don't miss it
+    # and a failed fetch doesn't leave them waiting for the lock to expire
+    try:
+        return _fetch_discovery_document(issuer)
+    finally:
+        cache.delete(_cache_key(issuer) + ":lock")
+
+
+def _fetch_cold_discovery_document(issuer: str) -> dict:
+    # When a fleet of fresh workers gets its first logins at the same time,
+    # one of them fetches the document and the rest wait for it to show up in the cache
+    if cache.add(_cache_key(issuer) + ":lock", True, timeout=30):
+        return _fetch_locked_discovery_document(issuer)
+
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        time.sleep(0.1)
+        shared_entry = cache.get(_cache_key(issuer))
+        if shared_entry is not None:
+            _discovery_documents[issuer] = shared_entry
+            return shared_entry
+
+        if cache.get(_cache_key(issuer) + ":lock") is None:
+            # The worker that had the lock failed, so try it here
+            return _fetch_cold_discovery_document(issuer)
+
+    return _fetch_discovery_document(issuer)
+
+
+def _refresh_in_background(issuer: str) -> None:
+    with _refreshing_lock:
+        if issuer in _refreshing_issuers:
+            return
+        _refreshing_issuers.add(issuer)
+
+    def refresh():
+        try:
+            # Only one worker in the fleet needs to do the revalidation
+            if cache.add(_cache_key(issuer) + ":lock", True, timeout=30):
+                _fetch_locked_discovery_document(issuer)
+        except Exception:
+            logger.exception("Failed to refresh OIDC discovery document for %s", issuer)
+        finally:
+            with _refreshing_lock:
+                _refreshing_issuers.discard(issuer)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def get_discovery_document(issuer: str) -> dict:
+    """
+    Get the OpenID configuration for an issuer.
+
+    Documents are kept in-process and in the Django cache.
+    A fresh document is returned as-is,
+    a stale one is returned immediately while it is refetched in a background thread,
+    and only a missing (or expired) document is fetched during the request.
+    """
+    ttl = get_discovery_ttl()
+    entry: Optional[dict] = _discovery_documents.get(issuer)
+
+    if entry is None or time.time() - entry["fetched_at"] >= ttl:
+        # Another worker may have already fetched or revalidated it
+        shared_entry = cache.get(_cache_key(issuer))
+        if shared_entry is not None and (
+            entry is None or shared_entry["fetched_at"] > entry["fetched_at"]
+        ):
+            entry = shared_entry
+            _discovery_documents[issuer] = shared_entry
+
+    if entry is None:
+        return _fetch_cold_discovery_document(issuer)["document"]
+
+    age = time.time() - entry["fetched_at"]
+
+    if age >= ttl + get_discovery_stale_ttl():
+        return _fetch_discovery_document(issuer)["document"]
+
+    if age >= ttl:
+        _refresh_in_background(issuer)
+
+    return entry["document"]
+
+
+class OIDCOAuthProvider(OAuthProvider):
+    """
+    A generic OpenID Connect provider, configured by the issuer URL.
+
+    The endpoints are read from the issuer's discovery document:
+
+        OAUTH_LOGIN_PROVIDERS = {
+            "okta": {
+                "class": "oauthlogin.oidc.OIDCOAuthProvider",
+                "kwargs": {
+                    "issuer": "https://example.okta.com",
+                    "client_id": ...,
+                    "client_secret": ...,
+                },
+            },
+        }
+    """
+
+    def __init__(self, *, issuer: str, scope: str = "openid email profile", **kwargs):
+        super().__init__(scope=scope, **kwargs)
+        self.issuer = issuer.rstrip("/")
+
+    def get_discovery_document(self) -> dict:
+        return get_discovery_document(self.issuer)
+
+    def get_prewarm_urls(self):
+        # Getting the discovery document warms up the issuer's host too
+        discovery_document = self.get_discovery_document()
+        return [
+            discovery_document[key]
+            for key in ("token_endpoint", "userinfo_endpoint")
+            if discovery_document.get(key)
+        ]
+
+    def get_probe_url(self):
+        return self.get_discovery_document()["userinfo_endpoint"]
+
+    def get_authorization_url(self, *, request):
+        return self.get_discovery_document()["authorization_endpoint"]
+
+    def _get_client_auth(self, discovery_document, request_data):
+        # client_secret_basic is the default if the provider doesn't say
+        auth_methods = discovery_document.get(
+            "token_endpoint_auth_methods_supported", ["client_secret_basic"]
+        )
+        if "client_secret_basic" in auth_methods:
+            return (self.get_client_id(), self.get_client_secret())
+
+        request_data["client_id"] = self.get_client_id()
+        request_data["client_secret"] = self.get_client_secret()
+        return None
+
+    def _get_token(self, request_data):
+        discovery_document = self.get_discovery_document()
+
+        response = self.get_session().post(
+            discovery_document["token_endpoint"],
+            auth=self._get_client_auth(discovery_document, request_data),
+            headers={
+                "Accept": "application/json",
+            },
+            data=request_data,
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        oauth_token = OAuthToken(
+            access_token=data["access_token"],
+            refresh_token=data.get("refresh_token", ""),
+        )
+
+        if "expires_in" in data:
+            oauth_token.access_token_expires_at = timezone.now() + datetime.timedelta(
+                seconds=data["expires_in"]
+            )
+
+        return oauth_token
+
+    def get_oauth_token(self, *, code, request):
+        return self._get_token(
+            {
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": self.get_callback_url(request=request),
+            }
+        )
+
+    def refresh_oauth_token(self, *, oauth_token):
+        return self._get_token(
+            {
+                "grant_type": "refresh_token",
+                "refresh_token": oauth_token.refresh_token,
+            }
+        )
+
+    def fetch_app_token(self):
+        return self._get_token({"grant_type": "client_credentials"})
+
+    def revoke_oauth_token(self, *, oauth_token):
+        discovery_document = self.get_discovery_document()
+        if "revocation_endpoint" not in discovery_document:
+            raise NotImplementedError()
+
+        # Revoking the refresh token also revokes its access tokens (RFC 7009)
+        if oauth_token.refresh_token:
+            request_data = {
+                "token": oauth_token.refresh_token,
+                "token_type_hint": "refresh_token",
+            }
+        else:
+            request_data = {
+                "token": oauth_token.access_token,
+                "token_type_hint": "access_token",
+            }
+
+        response = self.get_session().post(
+            discovery_document["revocation_endpoint"],
+            auth=self._get_client_auth(discovery_document, request_data),
+            data=request_data,
+        )
+        response.raise_for_status()
+
+    def get_oauth_user(self, *, oauth_token):
+        response = self.api_get(
+            self.get_discovery_document()["userinfo_endpoint"],
+            oauth_token=oauth_token,
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        if not data.get("email") or data.get("email_verified") is False:
+            raise OAuthError("A verified email address is required")
+
+        return OAuthUser(
+            id=data["sub"],
+            email=data["email"],
+            username=data.get("preferred_username") or data["email"],
+            data=data,
+        )
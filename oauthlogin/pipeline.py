@@ -0,0 +1,152 @@
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
+from django.utils.module_loading import import_string
+
+from .models import OAuthConnection
+
+if TYPE_CHECKING:
+    from .providers import OAuthProvider, OAuthToken, OAuthUser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CALLBACK_PIPELINE = [
+    "oauthlogin.pipeline.check_state",
+    "oauthlogin.pipeline.exchange_token",
+    "oauthlogin.pipeline.get_identity",
+    "oauthlogin.pipeline.resolve_user",
+    "oauthlogin.pipeline.save_connection",
+    "oauthlogin.pipeline.login",
+    "oauthlogin.pipeline.redirect",
+]
+
+
+class CallbackContext:
+    """
+    The state shared by the stages of one callback request.
+
+    Each stage reads what the earlier ones filled in and adds its own part.
+    """
+
+    def __init__(self, *, provider: "OAuthProvider", request: HttpRequest):
+        self.provider = provider
+        self.request = request
+        self.oauth_token: Optional["OAuthToken"] = None
+        self.oauth_user: Optional["OAuthUser"] = None
+        self.connection: Optional[OAuthConnection] = None
+        self.user: Any = None
+        # Seconds spent in each stage that ran, by stage name
+        self.timings: Dict[str, float] = {}
+
+
+Stage = Callable[[CallbackContext], Optional[HttpResponse]]
+
+
+def get_callback_pipeline() -> List[str]:
+    return getattr(settings, "OAUTH_LOGIN_CALLBACK_PIPELINE", DEFAULT_CALLBACK_PIPELINE)
+
+
+def run_callback_pipeline(
+    *, provider: "OAuthProvider", request: HttpRequest, stages: List[Stage]
+) -> HttpResponse:
+    """
+    Run the stages in order until one returns a response.
+    """
+    context = CallbackContext(provider=provider, request=request)
+
+    try:
+        for stage in stages:
+            start = time.perf_counter()
+            try:
+                response = stage(context)
+            finally:
+                context.timings[stage.__name__] = time.perf_counter() - start
+
+            if response is not None:
+                return response
+    finally:
+        logger.debug(
+            "%s callback stages: %s",
+            provider.provider_key,
+            ", ".join(
+                f"{name}={seconds * 1000:.1f}ms"
+                for name, seconds in context.timings.items()
+            ),
+        )
+
+    raise ImproperlyConfigured("No stage in the callback pipeline returned a response")
+
+
+def import_stages(paths: List[str]) -> List[Stage]:
+    return [import_string(path) for path in paths]
+
+
+def check_state(context: CallbackContext) -> None:
+    context.provider.check_request_state(request=context.request)
+
+
+def exchange_token(context: CallbackContext) -> None:
+    context.oauth_token = context.provider.get_oauth_token(
+        code=context.request.GET["code"], request=context.request
+    )
+
+
+def get_identity(context: CallbackContext) -> None:
+    assert context.oauth_token is not None
+
+    if not context.request.user.is_authenticated:
+        # A returning user is found (and saved) without fetching the full profile
+        context.connection = context.provider.get_returning_connection(
+            oauth_token=context.oauth_token
+        )
+        if context.connection:
+            context.user = context.connection.user
+            return
+
+    context.oauth_user = context.provider.get_oauth_user(
+        oauth_token=context.oauth_token
+    )
+
+
+def resolve_user(context: CallbackContext) -> None:
+    # A new user (context.user still None) is created by save_connection
+    if context.user is None and context.request.user.is_authenticated:
+        context.user = context.request.user
+
+
+def save_connection(context: CallbackContext) -> None:
+    if context.connection:
+        return
+
+    assert context.oauth_token is not None
+    assert context.oauth_user is not None
+
+    if context.user is not None:
+        context.connection = OAuthConnection.connect(
+            user=context.user,
+            provider_key=context.provider.provider_key,
+            oauth_token=context.oauth_token,
+            oauth_user=context.oauth_user,
+        )
+    else:
+        context.connection = OAuthConnection.get_or_createuser(
+            provider_key=context.provider.provider_key,
+            oauth_token=context.oauth_token,
+            oauth_user=context.oauth_user,
+        )
+        context.user = context.connection.user
+
+
+def login(context: CallbackContext) -> None:
+    if not context.request.user.is_authenticated:
+        context.provider.login(request=context.request, user=context.user)
+
+
+def redirect(context: CallbackContext) -> HttpResponse:
+    return HttpResponseRedirect(
+        context.provider.get_login_redirect_url(request=context.request)
+    )
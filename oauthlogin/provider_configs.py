@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import OAuthProviderConfig
+from .routers import use_primary
+
+PROVIDER_CONFIG_CACHE_KEY = "oauthlogin:provider_config:{}"
+
+# Kept in the LRU for keys that have no (enabled) config, so unknown keys don't query
+# every time (but not in the Django cache, where the keys come from request URLs)
+_MISSING: dict = {}
+
+
+def get_database_providers() -> bool:
+    return getattr(settings, "OAUTH_LOGIN_DATABASE_PROVIDERS", False)
+
+
+def get_provider_config_cache_timeout() -> int:
+    return getattr(settings, "OAUTH_LOGIN_PROVIDER_CONFIG_CACHE_TIMEOUT", 60 * 60)
+
+
+class ProviderConfigCache:
+    """
+    Provider settings for OAuthProviderConfig rows, looked up by provider key
+    in a bounded, in-process LRU, then the Django cache, then the database.
+
+    Saving or deleting a config clears it from the Django cache and this process's LRU.
+    Other processes pick up the change when their LRU entry is older than
+    OAUTH_LOGIN_PROVIDER_CONFIG_LRU_TIMEOUT seconds.
+    """
+
+    def __init__(self, *, maxsize: Optional[int] = None):
+        self._maxsize = maxsize
+        # Values are (provider settings or _MISSING, time.monotonic() when loaded)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self) -> int:
+        if self._maxsize is not None:
+            return self._maxsize
+        return getattr(settings, "OAUTH_LOGIN_PROVIDER_CONFIG_LRU_SIZE", 1000)
+
+    @property
+    def lru_timeout(self) -> int:
+        return getattr(settings, "OAUTH_LOGIN_PROVIDER_CONFIG_LRU_TIMEOUT", 30)
+
+    def get(self, provider_key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(provider_key)
+            if entry is not None and time.monotonic() - entry[1] < self.lru_timeout:
+                self._entries.move_to_end(provider_key)
+                return entry[0] or None
+
+        key = PROVIDER_CONFIG_CACHE_KEY.format(provider_key)
+        provider_settings = cache.get(key)
+
+        if provider_settings is None:
+            # From the primary, since this is often right after a change was committed
+            with use_primary():
+                config = (
+                    OAuthProviderConfig.objects.filter(
+                        provider_key=provider_key, enabled=True
+                    )
+                    .order_by()
+                    .first()
+                )
+            if config:
+                provider_settings = config.get_provider_settings()
+                cache.set(
+                    key, provider_settings, timeout=get_provider_config_cache_timeout()
+                )
+            else:
+                provider_settings = _MISSING
+
+        with self._lock:
+            self._entries[provider_key] = (provider_settings, time.monotonic())
+            self._entries.move_to_end(provider_key)
+            while len(self._entries) > max(self.maxsize, 0):
+                self._entries.popitem(last=False)
+
+        return provider_settings or None
+
+    def invalidate(self, provider_key: str) -> None:
+        cache.delete(PROVIDER_CONFIG_CACHE_KEY.format(provider_key))
+        with self._lock:
+            self._entries.pop(provider_key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+provider_config_cache = ProviderConfigCache()
+
+
+def invalidate_provider_config(sender: Any, instance: Any, **kwargs) -> None:
+    # Connected to post_save and post_delete for OAuthProviderConfig,
+    # and cleared once committed so a concurrent lookup can't cache the old row again
+    provider_key = instance.provider_key
+    transaction.on_commit(
+        lambda: provider_config_cache.invalidate(provider_key),
+        using=kwargs.get("using"),
+    )
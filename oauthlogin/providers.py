@@ -1,17 +1,26 @@
 import datetime
 import secrets
-from typing import Any, List, Optional
-from urllib.parse import urlencode
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional
+from urllib.parse import urlencode, urljoin
 
 from django.conf import settings
 from django.contrib.auth import login as auth_login
+from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
 from django.urls import NoReverseMatch, reverse
 from django.utils.crypto import get_random_string
 from django.utils.module_loading import import_string
 
-from .exceptions import OAuthCannotDisconnectError, OAuthStateMismatchError
-from .models import OAuthConnection
+from .exceptions import OAuthRateLimitError, OAuthStateMismatchError
+from .models import OAuthConnection, get_refresh_profiles_on_login
+from .pipeline import get_callback_pipeline, import_stages, run_callback_pipeline
+from .provider_configs import get_database_providers, provider_config_cache
+from .registry import provider_registry
+
+if TYPE_CHECKING:
+    import requests
+
+    from .pipeline import Stage
 
 SESSION_STATE_KEY = "oauthlogin_state"
 SESSION_NEXT_KEY = "oauthlogin_next"
@@ -33,18 +42,61 @@ class OAuthToken:
 
 
 class OAuthUser:
-    def __init__(self, *, id: str, email: str, username: str = ""):
+    def __init__(
+        self,
+        *,
+        id: str,
+        email: str,
+        username: str = "",
+        # The raw profile data from the provider, saved on the connection
+        data: Optional[dict] = None,
+    ):
         self.id = id
         self.username = username
         self.email = email
+        self.data = data
 
     def __str__(self):
         return self.email
 
 
+class OAuthWebhookEvent:
+    # The user revoked the app's access, so their tokens don't work anymore
+    REVOKED = "revoked"
+    # The user's account on the provider was deleted
+    DELETED = "deleted"
+
+    def __init__(
+        self,
+        *,
+        type: str,
+        provider_user_ids: List[str],
+        data: Optional[dict] = None,
+    ):
+        self.type = type
+        self.provider_user_ids = provider_user_ids
+        self.data = data
+
+    def __str__(self):
+        return self.type
+
+
 class OAuthProvider:
     authorization_url = ""
 
+    # Relative URLs in OAuthConnection.api() requests are joined to this
+    api_base_url = ""
+
+    # The most pages api_get_list() will request for one list
+    api_max_pages = 10
+
+    # A cheap API endpoint that only works with a valid token (for probe_oauth_token)
+    probe_url = ""
+
+    # URLs on the hosts this provider talks to from the server (defaults to api_base_url),
+    # connected to ahead of time if OAUTH_LOGIN_PREWARM_CONNECTIONS is enabled
+    prewarm_urls: List[str] = []
+
     def __init__(
         self,
         *,
@@ -82,6 +134,37 @@ class OAuthProvider:
     def get_oauth_user(self, *, oauth_token: OAuthToken) -> OAuthUser:
         raise NotImplementedError()
 
+    def verify_webhook_request(self, *, request: HttpRequest) -> None:
+        # Optional, raise OAuthWebhookSignatureError if the request isn't from the provider
+        raise NotImplementedError()
+
+    def parse_webhook_request(self, *, request: HttpRequest) -> List[OAuthWebhookEvent]:
+        # Optional, the revocation and account events in a (verified) webhook request
+        raise NotImplementedError()
+
+    def get_oauth_user_id(self, *, oauth_token: OAuthToken) -> Optional[str]:
+        # Optional, the user's ID from a cheaper request than get_oauth_user(),
+        # so returning users can log in without fetching their email address
+        return None
+
+    def revoke_oauth_token(self, *, oauth_token: OAuthToken) -> None:
+        # Optional, used by the oauthlogin_cleanup command with --revoke,
+        # and on disconnect and user deletion if OAUTH_LOGIN_REVOKE_TOKENS is enabled
+        raise NotImplementedError()
+
+    def fetch_app_token(self) -> OAuthToken:
+        # Optional, a token for the app itself (like a client credentials grant)
+        raise NotImplementedError()
+
+    def get_app_token(self) -> OAuthToken:
+        """
+        The app token from fetch_app_token(), cached and shared across workers
+        and renewed shortly before it expires.
+        """
+        from .app_tokens import get_app_token
+
+        return get_app_token(self)
+
     def get_authorization_url(self, *, request: HttpRequest) -> str:
         return self.authorization_url
 
@@ -94,6 +177,108 @@ class OAuthProvider:
     def get_scope(self) -> str:
         return self.scope
 
+    def get_session(self) -> "requests.Session":
+        from .http import get_session
+
+        return get_session(self.provider_key)
+
+    def get_api_headers(self, *, oauth_token: OAuthToken) -> dict:
+        return {
+            "Accept": "application/json",
+            "Authorization": f"Bearer {oauth_token.access_token}",
+        }
+
+    def api_get(
+        self, url: str, *, oauth_token: OAuthToken, **kwargs
+    ) -> "requests.Response":
+        """
+        GET a provider API URL with the user's token, using the pooled session.
+
+        Responses with an ETag or Last-Modified header are remembered,
+        and repeat requests for the same token and URL are sent conditionally
+        so an unchanged resource comes back as a cheap 304.
+        """
+        from .http import conditional_get
+
+        headers = {
+            **self.get_api_headers(oauth_token=oauth_token),
+            **kwargs.pop("headers", {}),
+        }
+        return conditional_get(
+            self.get_session(),
+            url,
+            token=oauth_token.access_token,
+            headers=headers,
+            **kwargs,
+        )
+
+    def get_prewarm_urls(self) -> List[str]:
+        if self.prewarm_urls:
+            return self.prewarm_urls
+        if self.api_base_url:
+            return [self.api_base_url]
+        return []
+
+    def get_probe_url(self) -> str:
+        if not self.probe_url:
+            return ""
+        return urljoin(self.api_base_url, self.probe_url)
+
+    def probe_oauth_token(self, *, oauth_token: OAuthToken) -> bool:
+        """
+        Whether the access token still works, from one request to the probe URL.
+
+        Raises OAuthRateLimitError if the provider says to slow down.
+        """
+        from .http import get_rate_limit_wait
+
+        probe_url = self.get_probe_url()
+        if not probe_url:
+            raise NotImplementedError()
+
+        response = self.get_session().get(
+            probe_url,
+            headers=self.get_api_headers(oauth_token=oauth_token),
+            timeout=10,
+        )
+
+        if response.status_code in (403, 429):
+            wait = get_rate_limit_wait(response)
+            if wait is not None:
+                raise OAuthRateLimitError(
+                    f"Rate limited by {self.provider_key} for {wait:.0f} seconds",
+                    retry_after=wait,
+                )
+
+        if response.status_code == 401:
+            return False
+
+        response.raise_for_status()
+        return True
+
+    def api_get_list(
+        self,
+        url: str,
+        *,
+        oauth_token: OAuthToken,
+        max_pages: Optional[int] = None,
+        **kwargs,
+    ) -> Iterator[Any]:
+        """
+        Iterate the items of a paginated provider list endpoint (like a user's emails).
+
+        Pages are fetched lazily, so stop iterating as soon as you find what you need,
+        and at most api_max_pages are requested.
+        """
+        from .http import iter_list_items
+
+        return iter_list_items(
+            lambda url, **kwargs: self.api_get(url, oauth_token=oauth_token, **kwargs),
+            url,
+            max_pages=max_pages or self.api_max_pages,
+            **kwargs,
+        )
+
     def get_callback_url(self, *, request: HttpRequest) -> str:
         url = reverse("oauthlogin:callback", kwargs={"provider": self.provider_key})
         return request.build_absolute_uri(url)
@@ -128,50 +313,82 @@ class OAuthProvider:
         return self.handle_login_request(request=request)
 
     def handle_disconnect_request(self, *, request: HttpRequest) -> HttpResponse:
-        provider_user_id = request.POST["provider_user_id"]
-        connection = OAuthConnection.objects.get(
-            provider_key=self.provider_key, provider_user_id=provider_user_id
+        OAuthConnection.disconnect(
+            user=request.user,
+            provider_key=self.provider_key,
+            provider_user_id=request.POST["provider_user_id"],
         )
-        if (
-            request.user.has_usable_password()
-            or request.user.oauth_connections.count() > 1
-        ):
-            connection.delete()
-        else:
-            raise OAuthCannotDisconnectError(
-                "Cannot remove last OAuth connection without a usable password"
-            )
 
         redirect_url = self.get_disconnect_redirect_url(request=request)
         return HttpResponseRedirect(redirect_url)
 
+    def get_callback_pipeline(self) -> List["Stage"]:
+        """
+        The stages for handle_callback_request(), from OAUTH_LOGIN_CALLBACK_PIPELINE.
+        """
+        return import_stages(get_callback_pipeline())
+
     def handle_callback_request(self, *, request: HttpRequest) -> HttpResponse:
-        self.check_request_state(request=request)
+        return run_callback_pipeline(
+            provider=self, request=request, stages=self.get_callback_pipeline()
+        )
 
-        oauth_token = self.get_oauth_token(code=request.GET["code"], request=request)
-        oauth_user = self.get_oauth_user(oauth_token=oauth_token)
+    def handle_webhook_request(self, *, request: HttpRequest) -> HttpResponse:
+        from .webhooks import (
+            get_webhooks_background,
+            process_webhook_events,
+            webhook_queue,
+        )
 
-        if request.user.is_authenticated:
-            connection = OAuthConnection.connect(
-                user=request.user,
-                provider_key=self.provider_key,
-                oauth_token=oauth_token,
-                oauth_user=oauth_user,
-            )
-            user = connection.user
-        else:
-            connection = OAuthConnection.get_or_createuser(
+        self.verify_webhook_request(request=request)
+
+        events = self.parse_webhook_request(request=request)
+
+        if get_webhooks_background():
+            for event in events:
+                webhook_queue.put(self.provider_key, event)
+            # Accepted, the events are processed in the background
+            return HttpResponse(status=202)
+
+        # Only answered once the events are saved, so a failure gets redelivered
+        process_webhook_events([(self.provider_key, event) for event in events])
+        return HttpResponse()
+
+    def get_returning_connection(
+        self, *, oauth_token: OAuthToken
+    ) -> Optional[OAuthConnection]:
+        """
+        Find an existing connection using get_oauth_user_id()
+        (and the identity cache, if it's enabled),
+        without calling get_oauth_user() (the oauthlogin_resync_profiles command
+        keeps profiles up to date, unless OAUTH_LOGIN_REFRESH_PROFILES_ON_LOGIN
+        is on to refresh stale ones here).
+        """
+        oauth_user_id = self.get_oauth_user_id(oauth_token=oauth_token)
+        if oauth_user_id is None:
+            return None
+
+        connection = OAuthConnection.update_from_identity_cache(
+            provider_key=self.provider_key,
+            provider_user_id=oauth_user_id,
+            oauth_token=oauth_token,
+        )
+        if connection:
+            return connection
+
+        try:
+            connection = OAuthConnection.objects.get_with_fallback(
                 provider_key=self.provider_key,
-                oauth_token=oauth_token,
-                oauth_user=oauth_user,
+                provider_user_id=oauth_user_id,
             )
+        except OAuthConnection.DoesNotExist:
+            return None
 
-            user = connection.user
-
-            self.login(request=request, user=user)
-
-        redirect_url = self.get_login_redirect_url(request=request)
-        return HttpResponseRedirect(redirect_url)
+        if get_refresh_profiles_on_login() and connection.profile_stale():
+            connection.set_user_fields(self.get_oauth_user(oauth_token=oauth_token))
+        connection.set_token_fields(oauth_token)
+        connection.save()
+        return connection
 
     def login(self, *, request: HttpRequest, user: Any) -> HttpResponse:
         # Backend is *required* if there are multiple backends configured.
@@ -192,13 +409,56 @@ class OAuthProvider:
         return request.POST.get("next", "/")
 
 
-def get_oauth_provider_instance(*, provider_key: str) -> OAuthProvider:
+def get_provider_settings(*, provider_key: str) -> dict:
+    """
+    The class and kwargs for a provider, from OAUTH_LOGIN_PROVIDERS
+    or (if OAUTH_LOGIN_DATABASE_PROVIDERS is enabled) an OAuthProviderConfig.
+    """
     OAUTH_LOGIN_PROVIDERS = getattr(settings, "OAUTH_LOGIN_PROVIDERS", {})
-    provider_class_path = OAUTH_LOGIN_PROVIDERS[provider_key]["class"]
-    provider_class = import_string(provider_class_path)
-    provider_kwargs = OAUTH_LOGIN_PROVIDERS[provider_key].get("kwargs", {})
+    if provider_key in OAUTH_LOGIN_PROVIDERS:
+        return OAUTH_LOGIN_PROVIDERS[provider_key]
+
+    if get_database_providers():
+        provider_settings = provider_config_cache.get(provider_key)
+        if provider_settings is not None:
+            return provider_settings
+
+    raise KeyError(provider_key)
+
+
+def import_provider_class(class_path: str) -> type:
+    """
+    Import a provider class, and make sure it is one
+    (the path can come from an OAuthProviderConfig edited in the admin).
+    """
+    provider_class = import_string(class_path)
+    if not (
+        isinstance(provider_class, type) and issubclass(provider_class, OAuthProvider)
+    ):
+        raise ImproperlyConfigured(f"{class_path} is not an OAuthProvider subclass")
+    return provider_class
+
+
+def build_oauth_provider_instance(
+    *, provider_key: str, provider_settings: dict
+) -> OAuthProvider:
+    provider_class = import_provider_class(provider_settings["class"])
+    provider_kwargs = provider_settings.get("kwargs", {})
     return provider_class(provider_key=provider_key, **provider_kwargs)
 
 
+def get_oauth_provider_instance(*, provider_key: str) -> OAuthProvider:
+    # Providers from OAUTH_LOGIN_PROVIDERS_SOURCE come first, already built
+    provider = provider_registry.get_instance(provider_key)
+    if provider is not None:
+        return provider
+
+    return build_oauth_provider_instance(
+        provider_key=provider_key,
+        provider_settings=get_provider_settings(provider_key=provider_key),
+    )
+
+
 def get_provider_keys() -> List[str]:
-    return list(getattr(settings, "OAUTH_LOGIN_PROVIDERS", {}).keys())
+    keys = list(getattr(settings, "OAUTH_LOGIN_PROVIDERS", {}).keys())
+    return keys + [key for key in provider_registry.get_keys() if key not in keys]
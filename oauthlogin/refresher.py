@@ -0,0 +1,118 @@
+import datetime
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+from django.utils import timezone
+
+from .models import OAuthConnection, get_dead_connections_q
+
+
+class RefreshScheduler:
+    """
+    An in-memory min-heap of the connections whose access tokens expire soon,
+    ordered by access_token_expires_at.
+
+    The heap is filled with two indexed range queries:
+    connections whose expiration comes into the horizon as time passes,
+    and connections that changed (by updated_at) since the last load.
+    So between refreshes the database is barely touched.
+    """
+
+    # Rows can be committed with an updated_at slightly in the past,
+    # so each load looks back a little and skips what it already has
+    updated_at_overlap = datetime.timedelta(seconds=10)
+
+    def __init__(self, *, horizon: datetime.timedelta, provider_keys=None):
+        self.horizon = horizon
+        self.provider_keys = provider_keys
+        self.heap: List[Tuple[datetime.datetime, int]] = []
+        # The current expiration for each scheduled pk,
+        # heap entries that don't match are outdated and skipped
+        self.scheduled: Dict[int, datetime.datetime] = {}
+        self.loaded_until: Optional[datetime.datetime] = None
+        self.last_loaded_at: Optional[datetime.datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.scheduled)
+
+    def get_queryset(self):
+        queryset = (
+            OAuthConnection.objects.exclude(refresh_token="")
+            .filter(access_token_expires_at__isnull=False)
+            .exclude(get_dead_connections_q())
+            .order_by()
+        )
+        if self.provider_keys:
+            queryset = queryset.filter(provider_key__in=self.provider_keys)
+        return queryset
+
+    def schedule(self, pk: int, expires_at: datetime.datetime) -> None:
+        if self.scheduled.get(pk) == expires_at:
+            return
+        self.scheduled[pk] = expires_at
+        heapq.heappush(self.heap, (expires_at, pk))
+
+    def clear(self) -> None:
+        self.heap = []
+        self.scheduled = {}
+        self.loaded_until = None
+        self.last_loaded_at = None
+
+    def load(self) -> int:
+        """
+        Add connections that are newly within the horizon or have changed.
+        """
+        now = timezone.now()
+        horizon_end = now + self.horizon
+        queryset = self.get_queryset()
+
+        if self.loaded_until is None:
+            rows = queryset.filter(access_token_expires_at__lte=horizon_end)
+        else:
+            rows = queryset.filter(
+                access_token_expires_at__gt=self.loaded_until,
+                access_token_expires_at__lte=horizon_end,
+            )
+        rows = list(rows.values_list("pk", "access_token_expires_at"))
+
+        if self.last_loaded_at is not None:
+            # A refreshed (or reconnected) token has a new expiration
+            rows.extend(
+                queryset.filter(
+                    updated_at__gt=self.last_loaded_at - self.updated_at_overlap,
+                    access_token_expires_at__lte=horizon_end,
+                ).values_list("pk", "access_token_expires_at")
+            )
+
+        for pk, expires_at in rows:
+            self.schedule(pk, expires_at)
+
+        self.loaded_until = horizon_end
+        self.last_loaded_at = now
+
+        return len(rows)
+
+    def pop_due(self, *, margin: datetime.timedelta) -> List[int]:
+        """
+        Remove and return the pks of connections that expire within the margin.
+        """
+        due_before = timezone.now() + margin
+        due = []
+
+        while self.heap and self.heap[0][0] <= due_before:
+            expires_at, pk = heapq.heappop(self.heap)
+            if self.scheduled.get(pk) != expires_at:
+                continue
+            del self.scheduled[pk]
+            due.append(pk)
+
+        return due
+
+    def next_due_at(self, *, margin: datetime.timedelta) -> Optional[datetime.datetime]:
+        while self.heap and self.scheduled.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+        if not self.heap:
+            return None
+
+        return self.heap[0][0] - margin
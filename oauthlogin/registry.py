@@ -0,0 +1,166 @@
+import json
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+if TYPE_CHECKING:
+    from .providers import OAuthProvider
+
+logger = logging.getLogger(__name__)
+
+
+def get_providers_source() -> str:
+    return getattr(settings, "OAUTH_LOGIN_PROVIDERS_SOURCE", "")
+
+
+def get_providers_reload_interval() -> int:
+    return getattr(settings, "OAUTH_LOGIN_PROVIDERS_RELOAD_INTERVAL", 10)
+
+
+class ProviderSnapshot:
+    """
+    One version of the providers from the source, with their instances already built.
+
+    A snapshot is never changed after it's built, only replaced by a new one.
+    """
+
+    def __init__(self, *, source: str, raw: str, instances: Dict[str, "OAuthProvider"]):
+        self.source = source
+        self.raw = raw
+        self.instances = instances
+
+
+class ProviderRegistry:
+    """
+    Providers loaded from OAUTH_LOGIN_PROVIDERS_SOURCE (a JSON object shaped like
+    OAUTH_LOGIN_PROVIDERS, in a "file:<path>" or "cache:<key>"),
+    checked for changes in a background thread every
+    OAUTH_LOGIN_PROVIDERS_RELOAD_INTERVAL seconds.
+
+    A changed source is built into a new snapshot off to the side,
+    then swapped in with a single assignment, so lookups never see a half-loaded set.
+    Requests that already have a provider instance keep using it,
+    and a source that fails to load leaves the current snapshot in place.
+    """
+
+    def __init__(self):
+        self.snapshot: Optional[ProviderSnapshot] = None
+        self.reload_lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.thread_lock = threading.Lock()
+
+    def read_source(self, source: str) -> str:
+        kind, _, location = source.partition(":")
+
+        if kind == "file":
+            with open(location) as f:
+                return f.read()
+
+        if kind == "cache":
+            value = cache.get(location)
+            if value is None:
+                return ""
+            if isinstance(value, str):
+                return value
+            return json.dumps(value, sort_keys=True)
+
+        raise ImproperlyConfigured(
+            f'OAUTH_LOGIN_PROVIDERS_SOURCE must start with "file:" or "cache:", not {source!r}'
+        )
+
+    def build(self, source: str, raw: str) -> ProviderSnapshot:
+        from .providers import build_oauth_provider_instance
+
+        providers = json.loads(raw) if raw.strip() else {}
+        return ProviderSnapshot(
+            source=source,
+            raw=raw,
+            instances={
+                provider_key: build_oauth_provider_instance(
+                    provider_key=provider_key, provider_settings=provider_settings
+                )
+                for provider_key, provider_settings in providers.items()
+            },
+        )
+
+    def reload(self) -> bool:
+        """
+        Load the source, and swap in a new snapshot if it changed.
+        """
+        source = get_providers_source()
+
+        with self.reload_lock:
+            raw = self.read_source(source)
+
+            snapshot = self.snapshot
+            if snapshot and snapshot.source == source and snapshot.raw == raw:
+                return False
+
+            self.snapshot = self.build(source, raw)
+            return True
+
+    def get_snapshot(self) -> Optional[ProviderSnapshot]:
+        source = get_providers_source()
+        if not source:
+            return None
+
+        snapshot = self.snapshot
+        if snapshot is None or snapshot.source != source:
+            # The first load happens right away, and changes after that in the background
+            self.reload()
+            self.start()
+            snapshot = self.snapshot
+
+        return snapshot
+
+    def get_instance(self, provider_key: str) -> Optional["OAuthProvider"]:
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return None
+        return snapshot.instances.get(provider_key)
+
+    def get_keys(self) -> List[str]:
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return []
+        return list(snapshot.instances.keys())
+
+    def start(self) -> None:
+        if not get_providers_reload_interval():
+            return
+
+        with self.thread_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="oauthlogin-providers", daemon=True
+                )
+                self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            time.sleep(get_providers_reload_interval() or 10)
+
+            if not get_providers_source():
+                continue
+
+            try:
+                if self.reload():
+                    logger.info(
+                        "Reloaded OAuth providers from %s", get_providers_source()
+                    )
+            except Exception:
+                logger.exception(
+                    "Failed to reload OAuth providers, keeping the current ones"
+                )
+
+    def clear(self) -> None:
+        with self.reload_lock:
+            self.snapshot = None
+
+
+provider_registry = ProviderRegistry()
@@ -0,0 +1,184 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+if TYPE_CHECKING:
+    from .providers import OAuthToken
+
+logger = logging.getLogger(__name__)
+
+
+def get_revoke_tokens() -> bool:
+    return getattr(settings, "OAUTH_LOGIN_REVOKE_TOKENS", False)
+
+
+def get_revoke_concurrency() -> int:
+    return getattr(settings, "OAUTH_LOGIN_REVOKE_CONCURRENCY", 4)
+
+
+def get_revoke_max_retries() -> int:
+    return getattr(settings, "OAUTH_LOGIN_REVOKE_MAX_RETRIES", 3)
+
+
+def get_revoke_exit_timeout() -> int:
+    return getattr(settings, "OAUTH_LOGIN_REVOKE_EXIT_TIMEOUT", 30)
+
+
+class RevocationQueue:
+    """
+    Revokes tokens at the provider in a background thread,
+    in batches of up to batch_size with a few requests at a time,
+    retrying failures with an increasing delay.
+
+    The queue is drained when the process exits (for up to
+    OAUTH_LOGIN_REVOKE_EXIT_TIMEOUT seconds), so a script or a recycled worker
+    doesn't drop the revocations it queued.
+    """
+
+    batch_size = 50
+
+    def __init__(self):
+        # Items are (provider_key, oauth_token, attempt, not_before)
+        self.queue: queue.Queue = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.thread_lock = threading.Lock()
+        self.drain_at_exit_registered = False
+
+    def put(self, provider_key: str, oauth_token: "OAuthToken") -> None:
+        self.queue.put((provider_key, oauth_token, 0, 0.0))
+        self.start()
+
+    def start(self) -> None:
+        with self.thread_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="oauthlogin-revocation", daemon=True
+                )
+                self.thread.start()
+
+            if not self.drain_at_exit_registered:
+                atexit.register(self.drain_at_exit)
+                self.drain_at_exit_registered = True
+
+    def join(self) -> None:
+        """
+        Wait for everything in the queue (including retries) to be done.
+        """
+        self.queue.join()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Like join(), but gives up after timeout seconds.
+
+        Returns whether everything was done.
+        """
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def drain_at_exit(self) -> None:
+        if not self.drain(get_revoke_exit_timeout()):
+            logger.error(
+                "Exited with %s token revocations still pending",
+                self.queue.unfinished_tasks,
+            )
+
+    def run(self) -> None:
+        with ThreadPoolExecutor(max_workers=get_revoke_concurrency()) as executor:
+            while True:
+                batch = [self.queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                for item, error in zip(batch, executor.map(self.revoke, batch)):
+                    if error:
+                        self.retry(item, error)
+                    self.queue.task_done()
+
+    def revoke(self, item: tuple) -> Optional[Exception]:
+        from .providers import get_oauth_provider_instance
+
+        provider_key, oauth_token, _, not_before = item
+
+        delay = not_before - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        try:
+            get_oauth_provider_instance(provider_key=provider_key).revoke_oauth_token(
+                oauth_token=oauth_token
+            )
+        except NotImplementedError:
+            # The provider doesn't support revoking
+            return None
+        except Exception as e:
+            return e
+
+        return None
+
+    def retry(self, item: tuple, error: Exception) -> None:
+        provider_key, oauth_token, attempt, _ = item
+
+        if attempt >= get_revoke_max_retries():
+            logger.error(
+                "Failed to revoke %s token after %s attempts: %s",
+                provider_key,
+                attempt + 1,
+                error,
+            )
+            return
+
+        self.queue.put(
+            (provider_key, oauth_token, attempt + 1, time.time() + 2**attempt)
+        )
+
+
+revocation_queue = RevocationQueue()
+
+
+def revoke_tokens_on_commit(
+    tokens: List[Tuple[str, "OAuthToken"]], using: Optional[str] = None
+) -> None:
+    """
+    Queue (provider_key, oauth_token) pairs to be revoked once the transaction commits,
+    so nothing is revoked for a delete that gets rolled back.
+    """
+    if not tokens:
+        return
+
+    def enqueue():
+        for provider_key, oauth_token in tokens:
+            revocation_queue.put(provider_key, oauth_token)
+
+    transaction.on_commit(enqueue, using=using)
+
+
+def revoke_user_tokens(sender: Any, instance: Any, **kwargs) -> None:
+    # Connected to pre_delete for the user model, whose connections are deleted with it
+    if get_revoke_tokens():
+        revoke_tokens_on_commit(
+            [
+                (connection.provider_key, connection.get_oauth_token())
+                for connection in instance.oauth_connections.only(
+                    "provider_key",
+                    "access_token",
+                    "refresh_token",
+                    "access_token_expires_at",
+                    "refresh_token_expires_at",
+                )
+            ],
+            using=kwargs.get("using"),
+        )
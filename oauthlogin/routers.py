@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Set after a write, so the rest of the request reads its own writes
+_use_primary: ContextVar[bool] = ContextVar("oauthlogin_use_primary", default=False)
+
+
+def get_read_database() -> Optional[str]:
+    return getattr(settings, "OAUTH_LOGIN_READ_DATABASE", None)
+
+
+def reading_from_replica() -> bool:
+    return bool(get_read_database()) and not _use_primary.get()
+
+
+def pin_to_primary() -> None:
+    _use_primary.set(True)
+
+
+def unpin(**kwargs) -> None:
+    # Connected to request_started, so every request starts on the replica again
+    _use_primary.set(False)
+
+
+@contextmanager
+def use_primary() -> Iterator[None]:
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class OAuthLoginRouter:
+    """
+    Send OAuthConnection reads to OAUTH_LOGIN_READ_DATABASE (a replica),
+    until the first write in a request, after which everything uses the primary.
+
+    Add it to your settings:
+        DATABASE_ROUTERS = ["oauthlogin.routers.OAuthLoginRouter"]
+        OAUTH_LOGIN_READ_DATABASE = "replica"
+    """
+
+    def db_for_read(self, model, **hints):
+        read_database = get_read_database()
+        if not read_database:
+            return None
+
+        # Other oauthlogin models (like OAuthProviderConfig) are cached,
+        # and reading a stale row from the replica would be cached with them
+        if model._meta.label_lower != "oauthlogin.oauthconnection":
+            # A related object (like connection.user) would otherwise be read
+            # from wherever the connection came from
+            instance = hints.get("instance")
+            if instance is not None and instance._state.db == read_database:
+                return DEFAULT_DB_ALIAS
+            return None
+
+        if _use_primary.get():
+            return DEFAULT_DB_ALIAS
+
+        return read_database
+
+    def db_for_write(self, model, **hints):
+        read_database = get_read_database()
+        if not read_database:
+            return None
+
+        if model._meta.app_label == "oauthlogin":
+            pin_to_primary()
+            return DEFAULT_DB_ALIAS
+
+        # Never write to the replica, even if the instance was loaded from it
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db == read_database:
+            return DEFAULT_DB_ALIAS
+
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        read_database = get_read_database()
+        if not read_database:
+            return None
+
+        # The replica has the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, read_database}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
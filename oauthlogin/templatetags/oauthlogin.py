@@ -0,0 +1,53 @@
+from django import template
+from django.urls import reverse
+
+from ..cache import get_user_connections
+from ..providers import get_provider_keys
+
+register = template.Library()
+
+
+@register.inclusion_tag("oauthlogin/provider_buttons.html", takes_context=True)
+def oauth_provider_buttons(context, action="login", next=""):
+    """
+    A form and button for each provider, to either "login" or "connect".
+    """
+    return {
+        "providers": [
+            (
+                provider_key,
+                reverse(f"oauthlogin:{action}", kwargs={"provider": provider_key}),
+            )
+            for provider_key in get_provider_keys()
+        ],
+        "action": action,
+        "next": next,
+        "csrf_token": context.get("csrf_token"),
+    }
+
+
+@register.inclusion_tag("oauthlogin/connections.html", takes_context=True)
+def oauth_connections(context, user=None, next=""):
+    """
+    The user's connections, with a disconnect button for the ones that can be removed.
+
+    The connections are loaded in a single query,
+    or from the cache when OAUTH_LOGIN_CONNECTIONS_CACHE_TIMEOUT is set.
+    """
+    if user is None:
+        user = context["request"].user
+
+    has_usable_password = user.has_usable_password()
+
+    return {
+        "connections": [
+            {
+                **connection,
+                "can_be_disconnected": has_usable_password
+                or connection["user_connection_count"] > 1,
+            }
+            for connection in get_user_connections(user)
+        ],
+        "next": next,
+        "csrf_token": context.get("csrf_token"),
+    }
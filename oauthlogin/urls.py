@@ -18,6 +18,7 @@ urlpatterns = [
                     name="disconnect",
                 ),
                 path("callback/", views.OAuthCallbackView.as_view(), name="callback"),
+                path("webhook/", views.OAuthWebhookView.as_view(), name="webhook"),
             ]
         ),
     ),
@@ -1,11 +1,15 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404, HttpResponseForbidden
 from django.shortcuts import redirect, render
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 
 from .exceptions import (
     OAuthCannotDisconnectError,
     OAuthStateMismatchError,
     OAuthUserAlreadyExistsError,
+    OAuthWebhookSignatureError,
 )
 from .providers import get_oauth_provider_instance
 
@@ -66,3 +70,15 @@ class OAuthDisconnectView(LoginRequiredMixin, View):
                 },
                 status=400,
             )
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class OAuthWebhookView(View):
+    def post(self, request, provider):
+        provider_instance = get_oauth_provider_instance(provider_key=provider)
+        try:
+            return provider_instance.handle_webhook_request(request=request)
+        except NotImplementedError:
+            raise Http404("This provider doesn't accept webhooks")
+        except OAuthWebhookSignatureError:
+            return HttpResponseForbidden()
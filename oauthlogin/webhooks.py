@@ -0,0 +1,116 @@
+import logging
+import queue
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .cache import invalidate_identities, invalidate_user_connections
+from .models import OAuthConnection
+
+if TYPE_CHECKING:
+    from .providers import OAuthWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+
+def get_webhooks_background() -> bool:
+    return getattr(settings, "OAUTH_LOGIN_WEBHOOKS_BACKGROUND", False)
+
+
+def process_webhook_events(events: List[Tuple[str, "OAuthWebhookEvent"]]) -> None:
+    """
+    Apply (provider_key, event) pairs with one bulk query per provider and event type.
+
+    Repeated deliveries of the same event don't change anything the second time.
+    """
+    from .providers import OAuthWebhookEvent
+
+    revoked: Dict[str, Set[str]] = defaultdict(set)
+    deleted: Dict[str, Set[str]] = defaultdict(set)
+
+    for provider_key, event in events:
+        if event.type == OAuthWebhookEvent.REVOKED:
+            revoked[provider_key].update(event.provider_user_ids)
+        elif event.type == OAuthWebhookEvent.DELETED:
+            deleted[provider_key].update(event.provider_user_ids)
+
+    for provider_key, provider_user_ids in revoked.items():
+        OAuthConnection.objects.filter(
+            provider_key=provider_key,
+            provider_user_id__in=provider_user_ids,
+            invalidated_at__isnull=True,
+        ).update(invalidated_at=timezone.now())
+
+    for provider_key, provider_user_ids in deleted.items():
+        connections = OAuthConnection.objects.filter(
+            provider_key=provider_key, provider_user_id__in=provider_user_ids
+        )
+        rows = list(connections.values_list("pk", "user_id", "provider_user_id"))
+        if not rows:
+            continue
+
+        OAuthConnection.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+
+        invalidate_identities(
+            [(provider_key, provider_user_id) for _, _, provider_user_id in rows]
+        )
+        for user_id in {user_id for _, user_id, _ in rows}:
+            invalidate_user_connections(user_id)
+
+
+class WebhookQueue:
+    """
+    Processes webhook events in a background thread (if OAUTH_LOGIN_WEBHOOKS_BACKGROUND is enabled),
+    so a burst of deliveries is answered right away and applied in batches.
+
+    The queue is only in memory, so events that haven't been applied
+    are lost if the process exits (and providers won't send them again).
+    """
+
+    batch_size = 500
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.thread_lock = threading.Lock()
+
+    def put(self, provider_key: str, event: "OAuthWebhookEvent") -> None:
+        self.queue.put((provider_key, event))
+        self.start()
+
+    def start(self) -> None:
+        with self.thread_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="oauthlogin-webhooks", daemon=True
+                )
+                self.thread.start()
+
+    def join(self) -> None:
+        self.queue.join()
+
+    def run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                close_old_connections()
+                process_webhook_events(batch)
+            except Exception:
+                logger.exception("Failed to process %s webhook events", len(batch))
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self.queue.task_done()
+
+
+webhook_queue = WebhookQueue()
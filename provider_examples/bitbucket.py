@@ -1,16 +1,19 @@
 import datetime
 
-import requests
 from django.utils import timezone
 
+from oauthlogin.exceptions import OAuthError
 from oauthlogin.providers import OAuthProvider, OAuthToken, OAuthUser
 
 
 class BitbucketOAuthProvider(OAuthProvider):
     authorization_url = "https://bitbucket.org/site/oauth2/authorize"
+    api_base_url = "https://api.bitbucket.org/2.0/"
+    probe_url = "user"
+    prewarm_urls = ["https://bitbucket.org/site/oauth2/access_token", api_base_url]
 
     def _get_token(self, request_data):
-        response = requests.post(
+        response = self.get_session().post(
             "https://bitbucket.org/site/oauth2/access_token",
             auth=(self.get_client_id(), self.get_client_secret()),
             headers={
@@ -44,32 +47,42 @@ class BitbucketOAuthProvider(OAuthProvider):
             }
         )
 
-    def get_oauth_user(self, *, oauth_token):
-        response = requests.get(
-            "https://api.bitbucket.org/2.0/user",
-            headers={
-                "Authorization": "Bearer {}".format(oauth_token.access_token),
-            },
+    def get_oauth_user_id(self, *, oauth_token):
+        # Returning users are logged in by ID, without the emails request
+        response = self.api_get(
+            "https://api.bitbucket.org/2.0/user", oauth_token=oauth_token
         )
         response.raise_for_status()
-        user_id = response.json()["uuid"]
-        username = response.json()["username"]
+        return response.json()["uuid"]
 
-        response = requests.get(
-            "https://api.bitbucket.org/2.0/user/emails",
-            headers={
-                "Authorization": "Bearer {}".format(oauth_token.access_token),
-            },
+    def get_oauth_user(self, *, oauth_token):
+        response = self.api_get(
+            "https://api.bitbucket.org/2.0/user", oauth_token=oauth_token
         )
         response.raise_for_status()
-        confirmed_primary_email = [
-            x["email"]
-            for x in response.json()["values"]
-            if x["is_primary"] and x["is_confirmed"]
-        ][0]
+        data = response.json()
+        user_id = data["uuid"]
+        username = data["username"]
+
+        confirmed_primary_email = next(
+            (
+                x["email"]
+                for x in self.api_get_list(
+                    "https://api.bitbucket.org/2.0/user/emails",
+                    oauth_token=oauth_token,
+                )
+                if x["is_primary"] and x["is_confirmed"]
+            ),
+            None,
+        )
+        if not confirmed_primary_email:
+            raise OAuthError(
+                "A confirmed primary email address is required on Bitbucket"
+            )
 
         return OAuthUser(
             id=user_id,
             email=confirmed_primary_email,
             username=username,
+            data=data,
         )
@@ -1,21 +1,34 @@
 import datetime
+import hashlib
+import hmac
+import json
 
-import requests
 from django.utils import timezone
 
-from oauthlogin.exceptions import OAuthError
-from oauthlogin.providers import OAuthProvider, OAuthToken, OAuthUser
+from oauthlogin.exceptions import OAuthError, OAuthWebhookSignatureError
+from oauthlogin.providers import OAuthProvider, OAuthToken, OAuthUser, OAuthWebhookEvent
 
 
 class GitHubOAuthProvider(OAuthProvider):
     authorization_url = "https://github.com/login/oauth/authorize"
+    api_base_url = "https://api.github.com/"
+    # Doesn't count against the rate limit
+    probe_url = "rate_limit"
 
     github_token_url = "https://github.com/login/oauth/access_token"
     github_user_url = "https://api.github.com/user"
     github_emails_url = "https://api.github.com/user/emails"
 
+    # Tokens come from github.com, everything else from api.github.com
+    prewarm_urls = [github_token_url, api_base_url]
+
+    def __init__(self, *, webhook_secret="", **kwargs):
+        # The secret for the GitHub App's webhook (to receive authorization revocations)
+        super().__init__(**kwargs)
+        self.webhook_secret = webhook_secret
+
     def _get_token(self, request_data):
-        response = requests.post(
+        response = self.get_session().post(
             self.github_token_url,
             headers={
                 "Accept": "application/json",
@@ -64,38 +77,76 @@ class GitHubOAuthProvider(OAuthProvider):
             }
         )
 
+    def get_api_headers(self, *, oauth_token):
+        return {
+            "Accept": "application/json",
+            "Authorization": f"token {oauth_token.access_token}",
+        }
+
+    def get_oauth_user_id(self, *, oauth_token):
+        # Returning users are logged in by ID, without the emails request
+        response = self.api_get(self.github_user_url, oauth_token=oauth_token)
+        response.raise_for_status()
+        return str(response.json()["id"])
+
     def get_oauth_user(self, *, oauth_token):
-        response = requests.get(
-            self.github_user_url,
-            headers={
-                "Accept": "application/json",
-                "Authorization": f"token {oauth_token.access_token}",
-            },
-        )
+        response = self.api_get(self.github_user_url, oauth_token=oauth_token)
         response.raise_for_status()
         data = response.json()
         user_id = data["id"]
         username = data["login"]
 
         # Use the verified, primary email address (not the public profile email, which is optional anyway)
-        response = requests.get(
-            self.github_emails_url,
-            headers={
-                "Accept": "application/json",
-                "Authorization": f"token {oauth_token.access_token}",
-            },
+        verified_primary_email = next(
+            (
+                x["email"]
+                for x in self.api_get_list(
+                    self.github_emails_url,
+                    oauth_token=oauth_token,
+                    params={"per_page": 100},
+                )
+                if x["primary"] and x["verified"]
+            ),
+            None,
         )
-        response.raise_for_status()
-
-        try:
-            verified_primary_email = [
-                x["email"] for x in response.json() if x["primary"] and x["verified"]
-            ][0]
-        except IndexError:
+        if not verified_primary_email:
             raise OAuthError("A verified primary email address is required on GitHub")
 
         return OAuthUser(
             id=user_id,
             email=verified_primary_email,
             username=username,
+            data=data,
+        )
+
+    def verify_webhook_request(self, *, request):
+        if not self.webhook_secret:
+            raise NotImplementedError()
+
+        expected_signature = (
+            "sha256="
+            + hmac.new(
+                self.webhook_secret.encode(), request.body, hashlib.sha256
+            ).hexdigest()
         )
+        signature = request.headers.get("X-Hub-Signature-256", "")
+        if not hmac.compare_digest(signature, expected_signature):
+            raise OAuthWebhookSignatureError()
+
+    def parse_webhook_request(self, *, request):
+        payload = json.loads(request.body)
+
+        # Sent when a user revokes their authorization of a GitHub App
+        if (
+            request.headers.get("X-GitHub-Event") == "github_app_authorization"
+            and payload.get("action") == "revoked"
+        ):
+            return [
+                OAuthWebhookEvent(
+                    type=OAuthWebhookEvent.REVOKED,
+                    provider_user_ids=[str(payload["sender"]["id"])],
+                    data=payload,
+                )
+            ]
+
+        return []
@@ -1,15 +1,15 @@
-import requests
-
 from oauthlogin.providers import OAuthProvider, OAuthToken, OAuthUser
 
 
 class GitLabOAuthProvider(OAuthProvider):
     authorization_url = "https://gitlab.com/oauth/authorize"
+    api_base_url = "https://gitlab.com/api/v4/"
+    probe_url = "user"
 
     def _get_token(self, request_data):
         request_data["client_id"] = self.get_client_id()
         request_data["client_secret"] = self.get_client_secret()
-        response = requests.post(
+        response = self.get_session().post(
             "https://gitlab.com/oauth/token",
             headers={
                 "Accept": "application/json",
@@ -42,11 +42,8 @@ class GitLabOAuthProvider(OAuthProvider):
         )
 
     def get_oauth_user(self, *, oauth_token):
-        response = requests.get(
-            "https://gitlab.com/api/v4/user",
-            headers={
-                "Authorization": "Bearer {}".format(oauth_token.access_token),
-            },
+        response = self.api_get(
+            "https://gitlab.com/api/v4/user", oauth_token=oauth_token
         )
         response.raise_for_status()
         data = response.json()
@@ -54,4 +51,5 @@ class GitLabOAuthProvider(OAuthProvider):
             id=data["id"],
             email=data["email"],
             username=data["username"],
+            data=data,
         )
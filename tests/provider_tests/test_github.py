@@ -1,7 +1,14 @@
+import datetime
+
 import pytest
+from django.utils import timezone
 
+from oauthlogin.exceptions import OAuthError
+from oauthlogin.http import response_cache
+from oauthlogin.models import OAuthConnection
 from oauthlogin.providers import OAuthToken, OAuthUser
 from tests.providers.github import GitHubOAuthProvider
+from tests.stand_in import StandInServer
 
 
 class DummyGitHubOAuthProvider(GitHubOAuthProvider):
@@ -11,6 +18,9 @@ class DummyGitHubOAuthProvider(GitHubOAuthProvider):
     def get_oauth_token(self, code, request):
         return OAuthToken(access_token="gho_key")
 
+    def get_oauth_user_id(self, oauth_token):
+        return "99"
+
     def get_oauth_user(self, oauth_token):
         return OAuthUser(
             id="99",
@@ -66,3 +76,149 @@ def test_github_provider(client, monkeypatch, settings):
     assert connections[0].access_token == "gho_key"
     assert connections[0].refresh_token == ""
     assert connections[0].access_token_expires_at == None
+
+
+@pytest.fixture
+def github_api():
+    response_cache.clear()
+
+    with StandInServer() as server:
+
+        @server.route("GET", "/user")
+        def user(request):
+            return 200, {}, {"id": 99, "login": "userone"}
+
+        yield server
+
+    response_cache.clear()
+
+
+def get_github_provider(github_api):
+    provider = GitHubOAuthProvider(
+        provider_key="github", client_id="test_id", client_secret="test_secret"
+    )
+    provider.github_user_url = github_api.url + "/user"
+    provider.github_emails_url = github_api.url + "/user/emails"
+    return provider
+
+
+def test_github_primary_email_on_later_page(github_api):
+    @github_api.route("GET", "/user/emails")
+    def emails(request):
+        if request.query.get("page") == "2":
+            return (
+                200,
+                {},
+                [{"email": "user@example.com", "primary": True, "verified": True}],
+            )
+        return (
+            200,
+            {"Link": f'<{github_api.url}/user/emails?page=2>; rel="next"'},
+            [{"email": "other@example.com", "primary": False, "verified": True}],
+        )
+
+    oauth_user = get_github_provider(github_api).get_oauth_user(
+        oauth_token=OAuthToken(access_token="gho_key")
+    )
+    assert oauth_user.email == "user@example.com"
+    assert oauth_user.data == {"id": 99, "login": "userone"}
+    assert len(github_api.requests_to("/user/emails")) == 2
+
+
+def test_github_primary_email_stops_at_first_page(github_api):
+    @github_api.route("GET", "/user/emails")
+    def emails(request):
+        return (
+            200,
+            {"Link": f'<{github_api.url}/user/emails?page=2>; rel="next"'},
+            [{"email": "user@example.com", "primary": True, "verified": True}],
+        )
+
+    oauth_user = get_github_provider(github_api).get_oauth_user(
+        oauth_token=OAuthToken(access_token="gho_key")
+    )
+    assert oauth_user.email == "user@example.com"
+    assert len(github_api.requests_to("/user/emails")) == 1
+
+
+def test_github_no_primary_email(github_api):
+    @github_api.route("GET", "/user/emails")
+    def emails(request):
+        # Always another page, but only up to api_max_pages are requested
+        return (
+            200,
+            {"Link": f'<{github_api.url}/user/emails?page=2>; rel="next"'},
+            [{"email": "other@example.com", "primary": False, "verified": True}],
+        )
+
+    with pytest.raises(OAuthError):
+        get_github_provider(github_api).get_oauth_user(
+            oauth_token=OAuthToken(access_token="gho_key")
+        )
+
+    assert len(github_api.requests_to("/user/emails")) == 10
+
+
+class StandInGitHubOAuthProvider(GitHubOAuthProvider):
+    def get_oauth_token(self, code, request):
+        return OAuthToken(access_token="gho_returning_key")
+
+    def check_request_state(self, *, request):
+        return
+
+
+@pytest.mark.django_db
+def test_github_returning_user_skips_emails(client, settings, monkeypatch, github_api):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "github": {
+            "class": "tests.provider_tests.test_github.StandInGitHubOAuthProvider",
+            "kwargs": {"client_id": "test_id", "client_secret": "test_secret"},
+        }
+    }
+    monkeypatch.setattr(
+        StandInGitHubOAuthProvider, "github_user_url", github_api.url + "/user"
+    )
+    monkeypatch.setattr(
+        StandInGitHubOAuthProvider,
+        "github_emails_url",
+        github_api.url + "/user/emails",
+    )
+
+    @github_api.route("GET", "/user/emails")
+    def emails(request):
+        return (
+            200,
+            {},
+            [{"email": "user@example.com", "primary": True, "verified": True}],
+        )
+
+    # The first login fetches the email to create the user
+    response = client.get("/oauth/github/callback/?code=test_code&state=test")
+    assert response.status_code == 302
+    assert len(github_api.requests_to("/user/emails")) == 1
+    client.logout()
+
+    # A returning user with a fresh profile is logged in by ID
+    response = client.get("/oauth/github/callback/?code=test_code&state=test")
+    assert response.status_code == 302
+    assert len(github_api.requests_to("/user/emails")) == 1
+    assert client.session["_auth_user_id"]
+
+    connection = OAuthConnection.objects.get(provider_key="github")
+    assert connection.provider_user_id == "99"
+    assert connection.access_token == "gho_returning_key"
+
+    # A stale profile is left to oauthlogin_resync_profiles by default
+    connection.profile_fetched_at = timezone.now() - datetime.timedelta(days=2)
+    connection.save()
+    client.logout()
+    response = client.get("/oauth/github/callback/?code=test_code&state=test")
+    assert response.status_code == 302
+    assert len(github_api.requests_to("/user/emails")) == 1
+
+    # Or refreshed during the login when that's turned on
+    settings.OAUTH_LOGIN_REFRESH_PROFILES_ON_LOGIN = True
+    client.logout()
+    response = client.get("/oauth/github/callback/?code=test_code&state=test")
+    assert response.status_code == 302
+    assert len(github_api.requests_to("/user/emails")) == 2
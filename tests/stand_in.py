@@ -0,0 +1,92 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StandInRequest:
+    def __init__(self, *, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    @property
+    def form(self):
+        return {k: v[0] for k, v in parse_qs(self.body.decode()).items()}
+
+
+class StandInServer:
+    """
+    A local HTTP server that stands in for a provider in tests.
+
+    Routes map (method, path) to a function that takes a StandInRequest
+    and returns a (status, headers, body) tuple. A dict or list body is sent as JSON.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_method(self):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                request = StandInRequest(
+                    method=self.command,
+                    path=parsed.path,
+                    query={k: v[0] for k, v in parse_qs(parsed.query).items()},
+                    headers=self.headers,
+                    body=self.rfile.read(length),
+                )
+                stand_in.requests.append(request)
+
+                route = stand_in.routes.get((self.command, parsed.path))
+                if route is None:
+                    status, headers, body = 404, {}, b""
+                else:
+                    status, headers, body = route(request)
+
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                    headers = {"Content-Type": "application/json", **headers}
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            do_GET = handle_method
+            do_POST = handle_method
+            do_HEAD = handle_method
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def route(self, method, path):
+        def decorator(func):
+            self.routes[(method, path)] = func
+            return func
+
+        return decorator
+
+    def requests_to(self, path):
+        return [r for r in self.requests if r.path == path]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
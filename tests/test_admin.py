@@ -0,0 +1,86 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from oauthlogin.models import OAuthConnection
+
+
+@pytest.fixture
+def admin_client(client):
+    admin_user = get_user_model().objects.create_superuser(
+        username="admin", email="admin@example.com", password="admin"
+    )
+    client.force_login(admin_user)
+    return client
+
+
+def create_connections(count, start=0):
+    for i in range(start, start + count):
+        user = get_user_model().objects.create_user(
+            username=f"user{i}", email=f"user{i}@example.com"
+        )
+        OAuthConnection.objects.create(
+            user=user, provider_key="github", provider_user_id=f"{i}00"
+        )
+
+
+def get_changelist_query_count(admin_client):
+    with CaptureQueriesContext(connection) as queries:
+        response = admin_client.get(
+            reverse("admin:oauthlogin_oauthconnection_changelist")
+        )
+    assert response.status_code == 200
+    return len(queries)
+
+
+@pytest.mark.django_db
+def test_changelist_queries_dont_grow_with_rows(admin_client, settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {"github": {}}
+
+    create_connections(2)
+    few = get_changelist_query_count(admin_client)
+
+    create_connections(5, start=2)
+    many = get_changelist_query_count(admin_client)
+
+    assert few == many
+
+
+@pytest.mark.django_db
+def test_changelist_search(admin_client, settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {"github": {}}
+    create_connections(12)
+    url = reverse("admin:oauthlogin_oauthconnection_changelist")
+
+    response = admin_client.get(url, {"q": "1"})
+    assert [c.provider_user_id for c in response.context["cl"].result_list] == [
+        "1100",
+        "1000",
+        "100",
+    ]
+
+    # Only searched by email when the column is known to be indexed
+    response = admin_client.get(url, {"q": "user3@example.com"})
+    assert [c.provider_user_id for c in response.context["cl"].result_list] == []
+
+    settings.OAUTH_LOGIN_ADMIN_SEARCH_EMAIL = True
+    response = admin_client.get(url, {"q": "user3@example.com"})
+    assert [c.provider_user_id for c in response.context["cl"].result_list] == ["300"]
+
+
+@pytest.mark.django_db
+def test_changelist_filters(admin_client, settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {"github": {}}
+    create_connections(2)
+    url = reverse("admin:oauthlogin_oauthconnection_changelist")
+
+    response = admin_client.get(url, {"provider_key": "github"})
+    assert len(response.context["cl"].result_list) == 2
+
+    response = admin_client.get(url, {"access_token_expiry": "never"})
+    assert len(response.context["cl"].result_list) == 2
+
+    response = admin_client.get(url, {"access_token_expiry": "expired"})
+    assert len(response.context["cl"].result_list) == 0
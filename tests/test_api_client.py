@@ -0,0 +1,134 @@
+import datetime
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+from oauthlogin.exceptions import OAuthRateLimitError
+from oauthlogin.http import response_cache
+from oauthlogin.models import OAuthConnection
+from oauthlogin.providers import OAuthProvider, OAuthToken
+from tests.stand_in import StandInServer
+
+
+class APIProvider(OAuthProvider):
+    def refresh_oauth_token(self, *, oauth_token):
+        return OAuthToken(
+            access_token="refreshed_access_token",
+            refresh_token="refreshed_refresh_token",
+        )
+
+
+@pytest.fixture
+def api(settings):
+    response_cache.clear()
+
+    with StandInServer() as server:
+        settings.OAUTH_LOGIN_PROVIDERS = {
+            "api": {
+                "class": "test_api_client.APIProvider",
+                "kwargs": {
+                    "client_id": "api_client_id",
+                    "client_secret": "api_client_secret",
+                },
+            }
+        }
+
+        @server.route("GET", "/user")
+        def user(request):
+            if request.headers["Authorization"] != "Bearer refreshed_access_token":
+                return 401, {}, {"message": "Bad credentials"}
+            return 200, {}, {"id": 1}
+
+        @server.route("GET", "/repos")
+        def repos(request):
+            if request.query.get("page") == "2":
+                return 200, {}, [{"id": 3}]
+            return (
+                200,
+                {"Link": f'<{server.url}/repos?page=2>; rel="next"'},
+                [{"id": 1}, {"id": 2}],
+            )
+
+        yield server
+
+    response_cache.clear()
+
+
+@pytest.fixture
+def connection():
+    user = get_user_model().objects.create_user(
+        username="api_username", email="api@example.com"
+    )
+    return OAuthConnection.objects.create(
+        user=user,
+        provider_key="api",
+        provider_user_id="api_id",
+        access_token="api_access_token",
+        refresh_token="api_refresh_token",
+    )
+
+
+@pytest.mark.django_db
+def test_refresh_on_401(api, connection):
+    client = connection.api(base_url=api.url)
+
+    response = client.get("/user")
+    assert response.status_code == 200
+    assert response.json() == {"id": 1}
+
+    connection.refresh_from_db()
+    assert connection.access_token == "refreshed_access_token"
+    assert len(api.requests_to("/user")) == 2
+
+
+@pytest.mark.django_db
+def test_refresh_before_expiry(api, connection):
+    connection.access_token_expires_at = timezone.now() + datetime.timedelta(seconds=10)
+    connection.save()
+
+    response = connection.api(base_url=api.url).get("/user")
+    assert response.status_code == 200
+    assert len(api.requests_to("/user")) == 1
+
+
+@pytest.mark.django_db
+def test_rate_limit_retry(api, connection):
+    attempts = []
+
+    @api.route("GET", "/limited")
+    def limited(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            return 429, {"Retry-After": "0"}, {}
+        return 200, {}, {"ok": True}
+
+    response = connection.api(base_url=api.url).get("/limited")
+    assert response.json() == {"ok": True}
+    assert len(attempts) == 2
+
+
+@pytest.mark.django_db
+def test_rate_limit_too_long(api, connection):
+    @api.route("GET", "/limited")
+    def limited(request):
+        return 403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "3600"}, {}
+
+    with pytest.raises(OAuthRateLimitError) as e:
+        connection.api(base_url=api.url, max_rate_limit_wait=5).get("/limited")
+
+    assert e.value.retry_after > 5
+
+
+@pytest.mark.django_db
+def test_paginate(api, connection):
+    client = connection.api(base_url=api.url)
+
+    repos = client.paginate("/repos")
+    assert next(repos) == {"id": 1}
+    assert next(repos) == {"id": 2}
+    # The second page isn't requested until it's needed
+    assert len(api.requests_to("/repos")) == 1
+
+    assert list(repos) == [{"id": 3}]
+    assert len(api.requests_to("/repos")) == 2
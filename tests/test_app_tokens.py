@@ -0,0 +1,92 @@
+import datetime
+import threading
+import time
+
+import pytest
+from django.core.cache import cache
+from django.utils import timezone
+
+from oauthlogin import app_tokens
+from oauthlogin.providers import OAuthProvider, OAuthToken
+
+
+class AppTokenProvider(OAuthProvider):
+    def __init__(self, *, expires_in=3600, delay=0, **kwargs):
+        super().__init__(
+            provider_key="app",
+            client_id="app_client_id",
+            client_secret="app_client_secret",
+            **kwargs,
+        )
+        self.expires_in = expires_in
+        self.delay = delay
+        self.fetched = 0
+
+    def fetch_app_token(self):
+        time.sleep(self.delay)
+        self.fetched += 1
+        return OAuthToken(
+            access_token=f"app_token_{self.fetched}",
+            access_token_expires_at=timezone.now()
+            + datetime.timedelta(seconds=self.expires_in),
+        )
+
+
+@pytest.fixture(autouse=True)
+def clear_app_tokens():
+    app_tokens._app_tokens.clear()
+    cache.clear()
+    yield
+    app_tokens._app_tokens.clear()
+    cache.clear()
+
+
+def test_app_token_cached():
+    provider = AppTokenProvider()
+
+    assert provider.get_app_token().access_token == "app_token_1"
+    assert provider.get_app_token().access_token == "app_token_1"
+    assert provider.fetched == 1
+
+    # Another worker gets it from the shared cache
+    app_tokens._app_tokens.clear()
+    other_provider = AppTokenProvider()
+    assert other_provider.get_app_token().access_token == "app_token_1"
+    assert other_provider.fetched == 0
+
+
+def test_app_token_renewed_early(settings):
+    settings.OAUTH_LOGIN_APP_TOKEN_RENEW_MARGIN = 120
+    provider = AppTokenProvider(expires_in=60)
+
+    assert provider.get_app_token().access_token == "app_token_1"
+    # Still valid, but within the renewal margin
+    assert provider.get_app_token().access_token == "app_token_2"
+
+
+def test_app_token_used_while_another_worker_renews(settings):
+    settings.OAUTH_LOGIN_APP_TOKEN_RENEW_MARGIN = 120
+    provider = AppTokenProvider(expires_in=60)
+    provider.get_app_token()
+
+    cache.add(app_tokens._cache_key(provider) + ":lock", True)
+
+    assert provider.get_app_token().access_token == "app_token_1"
+    assert provider.fetched == 1
+
+
+def test_app_token_single_flight():
+    provider = AppTokenProvider(delay=0.2)
+    results = []
+
+    threads = [
+        threading.Thread(target=lambda: results.append(provider.get_app_token()))
+        for _ in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert provider.fetched == 1
+    assert {oauth_token.access_token for oauth_token in results} == {"app_token_1"}
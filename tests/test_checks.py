@@ -1,6 +1,7 @@
 import pytest
 from django.contrib.auth import get_user_model
 
+from oauthlogin.checks import check_providers
 from oauthlogin.models import OAuthConnection
 
 
@@ -55,3 +56,62 @@ def test_oauth_provider_keys_check_pass(settings):
         errors[0].msg
         == "The following OAuth providers are in the database but not in the settings: bar"
     )
+
+
+@pytest.mark.django_db
+def test_oauth_provider_keys_check_max_unknown_keys(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {"google": {}}
+    settings.OAUTH_LOGIN_CHECK_MAX_UNKNOWN_KEYS = 2
+
+    user = get_user_model().objects.create_user(username="test_user")
+    for provider_key in ("a", "b", "c", "google"):
+        OAuthConnection.objects.create(
+            user=user, provider_key=provider_key, provider_user_id="test_id"
+        )
+
+    errors = OAuthConnection.check(databases=["default"])
+    assert len(errors) == 1
+    assert (
+        errors[0].msg
+        == "The following OAuth providers are in the database but not in the settings: a, b (and possibly more)"
+    )
+
+
+@pytest.mark.django_db
+def test_oauth_provider_keys_check_time_budget(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {"google": {}}
+    settings.OAUTH_LOGIN_CHECK_TIME_BUDGET = -1
+
+    user = get_user_model().objects.create_user(username="test_user")
+    OAuthConnection.objects.create(
+        user=user, provider_key="bar", provider_user_id="test_id"
+    )
+
+    errors = OAuthConnection.check(databases=["default"])
+    assert [e.id for e in errors] == ["oauthlogin.W001"]
+
+
+def test_providers_check(settings):
+    settings.OAUTH_LOGIN_CHECK_PROVIDERS = True
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "dummy": {
+            "class": "test_providers.DummyProvider",
+            "kwargs": {"client_id": "dummy_id", "client_secret": "dummy_secret"},
+        },
+        "missing": {
+            "class": "test_providers.DoesNotExist",
+            "kwargs": {"client_id": "dummy_id", "client_secret": "dummy_secret"},
+        },
+        "no_kwargs": {"class": "test_providers.DummyProvider"},
+    }
+
+    errors = check_providers()
+    assert [e.id for e in errors] == ["oauthlogin.E002", "oauthlogin.E003"]
+    assert '"missing"' in errors[0].msg
+    assert '"no_kwargs"' in errors[1].msg
+
+
+def test_providers_check_opt_in(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {"missing": {"class": "does.not.Exist"}}
+
+    assert check_providers() == []
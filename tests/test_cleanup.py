@@ -0,0 +1,190 @@
+import datetime
+import json
+
+import pytest
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection as db_connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from oauthlogin.exceptions import OAuthRefreshTokenRejectedError
+from oauthlogin.models import OAuthConnection, is_refresh_token_rejected
+from oauthlogin.providers import OAuthProvider, OAuthToken, OAuthUser
+
+
+class RevokeProvider(OAuthProvider):
+    revoked = []
+    refresh_error = OAuthRefreshTokenRejectedError("invalid_grant")
+
+    def revoke_oauth_token(self, *, oauth_token):
+        self.revoked.append(oauth_token.refresh_token)
+
+    def refresh_oauth_token(self, *, oauth_token):
+        raise self.refresh_error
+
+
+@pytest.fixture
+def revoke_provider(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "revoke": {
+            "class": "tests.test_cleanup.RevokeProvider",
+            "kwargs": {
+                "client_id": "revoke_client_id",
+                "client_secret": "revoke_client_secret",
+            },
+        }
+    }
+    RevokeProvider.revoked = []
+    RevokeProvider.refresh_error = OAuthRefreshTokenRejectedError("invalid_grant")
+
+
+@pytest.fixture
+def connections():
+    past = timezone.now() - datetime.timedelta(days=1)
+    future = timezone.now() + datetime.timedelta(days=1)
+    password_user = get_user_model().objects.create_user(
+        username="password", email="password@example.com", password="password"
+    )
+    no_password_user = get_user_model().objects.create_user(
+        username="no_password", email="no_password@example.com"
+    )
+
+    def create(user, provider_user_id, **kwargs):
+        return OAuthConnection.objects.create(
+            user=user,
+            provider_key="revoke",
+            provider_user_id=provider_user_id,
+            refresh_token=f"refresh_{provider_user_id}",
+            **kwargs,
+        )
+
+    return {
+        "expired": create(
+            password_user,
+            "1",
+            access_token_expires_at=past,
+            refresh_token_expires_at=past,
+        ),
+        "failing": create(password_user, "2", refresh_failures=5),
+        "valid": create(
+            password_user,
+            "3",
+            access_token_expires_at=past,
+            refresh_token_expires_at=future,
+        ),
+        "last_login": create(
+            no_password_user,
+            "4",
+            access_token_expires_at=past,
+            refresh_token_expires_at=past,
+        ),
+    }
+
+
+@pytest.mark.django_db
+def test_cleanup(revoke_provider, connections, capsys):
+    call_command("oauthlogin_cleanup", batch_size=1, sleep=0, revoke=True)
+
+    assert set(OAuthConnection.objects.values_list("provider_user_id", flat=True)) == {
+        "3",
+        "4",
+    }
+    assert sorted(RevokeProvider.revoked) == ["refresh_1", "refresh_2"]
+    assert "Deleted 2 connections (0 failed to revoke)" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_cleanup_unknown_provider(revoke_provider, connections, capsys):
+    connections["expired"].provider_key = "removed"
+    connections["expired"].save()
+
+    call_command("oauthlogin_cleanup", sleep=0, revoke=True)
+
+    assert not OAuthConnection.objects.filter(pk=connections["expired"].pk).exists()
+    assert RevokeProvider.revoked == ["refresh_2"]
+    assert "Deleted 2 connections (1 failed to revoke)" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_cleanup_plain_delete(revoke_provider, connections):
+    with CaptureQueriesContext(db_connection) as queries:
+        call_command("oauthlogin_cleanup", sleep=0)
+
+    # MySQL can't DELETE from a table that a subquery in it reads
+    deletes = [
+        query["sql"]
+        for query in queries.captured_queries
+        if query["sql"].startswith("DELETE")
+    ]
+    assert deletes
+    assert not any("EXISTS" in sql or "JOIN" in sql for sql in deletes)
+
+
+@pytest.mark.django_db
+def test_cleanup_dry_run(revoke_provider, connections, capsys):
+    call_command("oauthlogin_cleanup", dry_run=True, include_last_connections=True)
+
+    assert OAuthConnection.objects.count() == 4
+    assert "Would delete 3 connections" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_cleanup_resume(revoke_provider, connections):
+    call_command("oauthlogin_cleanup", sleep=0, after_id=connections["expired"].pk)
+
+    assert OAuthConnection.objects.filter(pk=connections["expired"].pk).exists()
+    assert not OAuthConnection.objects.filter(pk=connections["failing"].pk).exists()
+
+
+@pytest.mark.django_db
+def test_refresh_failures_counted(revoke_provider, connections):
+    connection = connections["valid"]
+
+    with pytest.raises(Exception):
+        connection.refresh_access_token()
+
+    connection.refresh_from_db()
+    assert connection.refresh_failures == 1
+
+
+@pytest.mark.django_db
+def test_transient_refresh_failures_not_counted(revoke_provider, connections):
+    connection = connections["valid"]
+    RevokeProvider.refresh_error = requests.ConnectionError("Provider is down")
+
+    with pytest.raises(requests.ConnectionError):
+        connection.refresh_access_token()
+
+    connection.refresh_from_db()
+    assert connection.refresh_failures == 0
+
+
+def test_refresh_token_rejected():
+    def http_error(status_code, body):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = json.dumps(body).encode()
+        return requests.HTTPError(response=response)
+
+    assert is_refresh_token_rejected(http_error(400, {"error": "invalid_grant"}))
+    assert not is_refresh_token_rejected(http_error(400, {"error": "invalid_request"}))
+    assert not is_refresh_token_rejected(http_error(503, {"error": "invalid_grant"}))
+    assert not is_refresh_token_rejected(requests.Timeout())
+
+
+@pytest.mark.django_db
+def test_relogin_revives_dead_connection(revoke_provider, connections):
+    connection = connections["failing"]
+    assert OAuthConnection.objects.dead().filter(pk=connection.pk).exists()
+
+    OAuthConnection.get_or_createuser(
+        provider_key="revoke",
+        oauth_token=OAuthToken(access_token="new", refresh_token="new"),
+        oauth_user=OAuthUser(id="2", email="password@example.com", username="password"),
+    )
+
+    connection.refresh_from_db()
+    assert connection.refresh_failures == 0
+    assert not OAuthConnection.objects.dead().filter(pk=connection.pk).exists()
@@ -0,0 +1,125 @@
+import pytest
+
+from oauthlogin.http import (
+    ConditionalResponseCache,
+    prewarm_connections,
+    response_cache,
+)
+from oauthlogin.providers import OAuthProvider, OAuthToken
+from tests.stand_in import StandInServer
+
+
+@pytest.fixture
+def api():
+    response_cache.clear()
+
+    with StandInServer() as server:
+
+        @server.route("GET", "/user")
+        def user(request):
+            if request.headers.get("If-None-Match") == '"v1"':
+                return 304, {"ETag": '"v1"', "X-RateLimit-Remaining": "4999"}, b""
+            return 200, {"ETag": '"v1"'}, {"id": 1, "login": "userone"}
+
+        @server.route("GET", "/emails")
+        def emails(request):
+            if request.headers.get("If-Modified-Since"):
+                return 304, {}, b""
+            return (
+                200,
+                {"Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"},
+                [{"email": "user@example.com"}],
+            )
+
+        yield server
+
+    response_cache.clear()
+
+
+def get_provider():
+    return OAuthProvider(provider_key="test", client_id="", client_secret="")
+
+
+def test_etag_revalidation(api):
+    provider = get_provider()
+    oauth_token = OAuthToken(access_token="token_one")
+
+    response = provider.api_get(api.url + "/user", oauth_token=oauth_token)
+    assert response.json() == {"id": 1, "login": "userone"}
+    assert "If-None-Match" not in api.requests[-1].headers
+
+    response = provider.api_get(api.url + "/user", oauth_token=oauth_token)
+    assert api.requests[-1].headers["If-None-Match"] == '"v1"'
+    assert response.status_code == 200
+    assert response.json() == {"id": 1, "login": "userone"}
+    assert response.headers["Content-Type"] == "application/json"
+    assert response.headers["X-RateLimit-Remaining"] == "4999"
+
+    assert response_cache.stats()["hits"] == 1
+    assert response_cache.stats()["misses"] == 1
+
+
+def test_last_modified_revalidation(api):
+    provider = get_provider()
+    oauth_token = OAuthToken(access_token="token_one")
+
+    provider.api_get(api.url + "/emails", oauth_token=oauth_token)
+    response = provider.api_get(api.url + "/emails", oauth_token=oauth_token)
+
+    assert (
+        api.requests[-1].headers["If-Modified-Since"] == "Wed, 21 Oct 2015 07:28:00 GMT"
+    )
+    assert response.json() == [{"email": "user@example.com"}]
+    assert response_cache.stats()["hits"] == 1
+
+
+def test_cache_keyed_per_token(api):
+    provider = get_provider()
+
+    provider.api_get(api.url + "/user", oauth_token=OAuthToken(access_token="one"))
+    provider.api_get(api.url + "/user", oauth_token=OAuthToken(access_token="two"))
+
+    assert "If-None-Match" not in api.requests[-1].headers
+    assert response_cache.stats() == {
+        "hits": 0,
+        "misses": 2,
+        "size": 2,
+        "maxsize": 1000,
+    }
+
+
+def test_cache_is_bounded():
+    class Response:
+        headers = {"ETag": '"v1"'}
+        content = b"{}"
+
+    cache = ConditionalResponseCache(maxsize=2)
+    cache.set("a", Response())
+    cache.set("b", Response())
+    cache.get("a")
+    cache.set("c", Response())
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_prewarm_connections(api):
+    class PrewarmProvider(OAuthProvider):
+        api_base_url = api.url + "/"
+
+    @api.route("HEAD", "/")
+    def root(request):
+        return 404, {}, b""
+
+    prewarm_connections(
+        [
+            PrewarmProvider(
+                provider_key="prewarm",
+                client_id="prewarm_client_id",
+                client_secret="prewarm_client_secret",
+            )
+        ]
+    )
+
+    assert [(r.method, r.path) for r in api.requests] == [("HEAD", "/")]
@@ -0,0 +1,145 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection as db_connection
+from django.test.utils import CaptureQueriesContext
+
+from oauthlogin.cache import get_cached_identity
+from oauthlogin.models import OAuthConnection
+from oauthlogin.providers import OAuthProvider, OAuthToken, OAuthUser
+
+
+class IdentityProvider(OAuthProvider):
+    def get_oauth_token(self, *, code, request):
+        return OAuthToken(access_token=f"identity_access_token_{code}")
+
+    def get_oauth_user_id(self, *, oauth_token):
+        return "identity_id"
+
+    def get_oauth_user(self, *, oauth_token):
+        return OAuthUser(
+            id="identity_id",
+            email="identity@example.com",
+            username="identity_username",
+        )
+
+    def check_request_state(self, *, request):
+        return
+
+
+@pytest.fixture
+def identity_provider(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "identity": {
+            "class": "tests.test_identity_cache.IdentityProvider",
+            "kwargs": {
+                "client_id": "identity_client_id",
+                "client_secret": "identity_client_secret",
+            },
+        }
+    }
+    settings.OAUTH_LOGIN_IDENTITY_CACHE_TIMEOUT = 60
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def connection_selects(queries):
+    return [
+        query["sql"]
+        for query in queries
+        if query["sql"].startswith("SELECT")
+        and 'FROM "oauthlogin_oauthconnection"' in query["sql"]
+    ]
+
+
+@pytest.mark.django_db
+def test_returning_login_from_cache(
+    client, identity_provider, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.get("/oauth/identity/callback/?code=1&state=test")
+    assert response.status_code == 302
+    connection = OAuthConnection.objects.get()
+    assert get_cached_identity("identity", "identity_id")["connection_id"] == (
+        connection.pk
+    )
+    client.logout()
+
+    with CaptureQueriesContext(db_connection) as queries:
+        response = client.get("/oauth/identity/callback/?code=2&state=test")
+    assert response.status_code == 302
+    assert int(client.session["_auth_user_id"]) == connection.user_id
+    assert connection_selects(queries) == []
+
+    connection.refresh_from_db()
+    assert connection.access_token == "identity_access_token_2"
+
+
+@pytest.mark.django_db
+def test_cached_connection_saves_loaded_fields(
+    client, identity_provider, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        client.get("/oauth/identity/callback/?code=1&state=test")
+    saved = OAuthConnection.objects.get()
+
+    connection = OAuthConnection.update_from_identity_cache(
+        provider_key="identity",
+        provider_user_id="identity_id",
+        oauth_token=OAuthToken(access_token="identity_access_token_2"),
+    )
+    assert "profile" in connection.get_deferred_fields()
+
+    # Like a custom callback stage might
+    connection.access_token = "identity_access_token_3"
+    connection.save()
+
+    connection = OAuthConnection.objects.get()
+    assert connection.access_token == "identity_access_token_3"
+    assert connection.profile == saved.profile
+    assert connection.created_at == saved.created_at
+
+
+@pytest.mark.django_db
+def test_returning_login_from_cache_revives_dead_connection(
+    client, identity_provider, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        client.get("/oauth/identity/callback/?code=1&state=test")
+    client.logout()
+    OAuthConnection.objects.update(refresh_failures=5)
+    assert OAuthConnection.objects.dead().exists()
+
+    client.get("/oauth/identity/callback/?code=2&state=test")
+
+    assert not OAuthConnection.objects.dead().exists()
+
+
+@pytest.mark.django_db
+def test_stale_cache_entry(
+    client, identity_provider, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        client.get("/oauth/identity/callback/?code=1&state=test")
+    client.logout()
+
+    # Deleted without going through the model
+    OAuthConnection.objects.all().delete()
+
+    # Falls back to the regular flow, where the user's email is already taken
+    response = client.get("/oauth/identity/callback/?code=2&state=test")
+    assert response.status_code == 400
+    assert get_cached_identity("identity", "identity_id") is None
+
+
+@pytest.mark.django_db
+def test_user_delete_invalidates(
+    client, identity_provider, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks(execute=True):
+        client.get("/oauth/identity/callback/?code=1&state=test")
+
+    get_user_model().objects.get().delete()
+
+    assert get_cached_identity("identity", "identity_id") is None
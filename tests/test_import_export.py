@@ -0,0 +1,97 @@
+import datetime
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+
+from oauthlogin.models import OAuthConnection
+
+
+@pytest.fixture
+def user():
+    user = get_user_model().objects.create_user(
+        username="export", email="export@example.com"
+    )
+    OAuthConnection.objects.create(
+        user=user,
+        provider_key="github",
+        provider_user_id="1",
+        access_token="access_1",
+        refresh_token="refresh_1",
+        access_token_expires_at=timezone.now() + datetime.timedelta(hours=1),
+        profile={"username": "export", "email": "export@example.com", "data": {}},
+        profile_fetched_at=timezone.now(),
+    )
+    OAuthConnection.objects.create(
+        user=user,
+        provider_key="gitlab",
+        provider_user_id="2",
+        access_token="access_2",
+    )
+    return user
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "csv"])
+@pytest.mark.django_db
+def test_export_import(user, tmp_path, extension):
+    path = str(tmp_path / f"connections.{extension}")
+    call_command("oauthlogin_export", output=path, chunk_size=1)
+
+    exported = list(
+        OAuthConnection.objects.order_by("pk").values(
+            "provider_key",
+            "provider_user_id",
+            "access_token",
+            "refresh_token",
+            "access_token_expires_at",
+            "profile",
+        )
+    )
+    OAuthConnection.objects.all().delete()
+
+    call_command("oauthlogin_import", path, batch_size=1)
+
+    imported = list(
+        OAuthConnection.objects.order_by("pk").values(
+            "provider_key",
+            "provider_user_id",
+            "access_token",
+            "refresh_token",
+            "access_token_expires_at",
+            "profile",
+        )
+    )
+    assert imported == exported
+    assert set(OAuthConnection.objects.values_list("user", flat=True)) == {user.pk}
+    assert OAuthConnection.objects.get_by_access_token("access_1").provider_key == (
+        "github"
+    )
+
+
+@pytest.mark.django_db
+def test_import_conflicts(user, tmp_path, capsys, django_assert_num_queries):
+    path = tmp_path / "connections.jsonl"
+    path.write_text(
+        '{"user_email": "export@example.com", "provider_key": "github", "provider_user_id": "1", "access_token": "new_access"}\n'
+        '{"user_email": "missing@example.com", "provider_key": "github", "provider_user_id": "3", "access_token": "access_3"}\n'
+    )
+
+    # One query to find the users, one for existing connections, and one to insert
+    with django_assert_num_queries(3):
+        call_command("oauthlogin_import", str(path))
+    assert OAuthConnection.objects.get(provider_user_id="1").access_token == "access_1"
+    assert (
+        "Created 0 connections (1 existing left alone, 1 skipped without a matching user)"
+        in capsys.readouterr().out
+    )
+
+    call_command("oauthlogin_import", str(path), on_conflict="update")
+    assert (
+        OAuthConnection.objects.get(provider_user_id="1").access_token == "new_access"
+    )
+    assert (
+        "Created 0 connections (1 existing updated, 1 skipped without a matching user)"
+        in capsys.readouterr().out
+    )
+    assert OAuthConnection.objects.count() == 2
@@ -1,5 +1,9 @@
 import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection as db_connection
+from django.test.utils import CaptureQueriesContext
 
+from oauthlogin.exceptions import OAuthCannotDisconnectError
 from oauthlogin.models import OAuthConnection
 from oauthlogin.providers import OAuthToken, OAuthUser
 
@@ -19,3 +23,104 @@ def test_email_normalized():
         ),
     )
     assert connection.user.email == "Dummy@example.com"
+
+
+@pytest.mark.django_db
+def test_with_disconnectable_single_query(django_assert_num_queries):
+    user = get_user_model().objects.create_user(
+        username="many", email="many@example.com"
+    )
+    other_user = get_user_model().objects.create_user(
+        username="one", email="one@example.com"
+    )
+    for i in range(3):
+        OAuthConnection.objects.create(
+            user=user, provider_key="dummy", provider_user_id=f"many_{i}"
+        )
+    OAuthConnection.objects.create(
+        user=other_user, provider_key="dummy", provider_user_id="one"
+    )
+
+    with django_assert_num_queries(1):
+        connections = list(OAuthConnection.objects.with_disconnectable())
+        disconnectable = {
+            c.provider_user_id: c.can_be_disconnected() for c in connections
+        }
+
+    assert disconnectable == {
+        "many_0": True,
+        "many_1": True,
+        "many_2": True,
+        "one": False,
+    }
+
+
+@pytest.mark.django_db
+def test_disconnect_locks_user_connections():
+    user = get_user_model().objects.create_user(username="two", email="two@example.com")
+    OAuthConnection.objects.create(
+        user=user, provider_key="dummy", provider_user_id="a"
+    )
+    OAuthConnection.objects.create(
+        user=user, provider_key="dummy", provider_user_id="b"
+    )
+
+    with CaptureQueriesContext(db_connection) as queries:
+        OAuthConnection.disconnect(
+            user=user, provider_key="dummy", provider_user_id="a"
+        )
+    # The user's connections are locked before the last-connection check
+    # (SQLite doesn't support FOR UPDATE, so it's left out of the SQL here)
+    assert [q["sql"].split()[0] for q in queries if "SAVEPOINT" not in q["sql"]] == [
+        "SELECT",
+        "DELETE",
+    ]
+
+    with pytest.raises(OAuthCannotDisconnectError):
+        OAuthConnection.disconnect(
+            user=user, provider_key="dummy", provider_user_id="b"
+        )
+
+    assert list(user.oauth_connections.values_list("provider_user_id", flat=True)) == [
+        "b"
+    ]
+
+
+@pytest.mark.django_db
+def test_disconnect_other_users_connection():
+    user = get_user_model().objects.create_user(
+        username="user", email="user@example.com", password="password"
+    )
+    other_user = get_user_model().objects.create_user(
+        username="other", email="other@example.com"
+    )
+    OAuthConnection.objects.create(
+        user=other_user, provider_key="dummy", provider_user_id="other"
+    )
+
+    with pytest.raises(OAuthConnection.DoesNotExist):
+        OAuthConnection.disconnect(
+            user=user, provider_key="dummy", provider_user_id="other"
+        )
+
+    assert OAuthConnection.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_get_by_access_token(django_assert_num_queries):
+    connection = OAuthConnection.get_or_createuser(
+        provider_key="dummy",
+        oauth_token=OAuthToken(access_token="lookup_access_token"),
+        oauth_user=OAuthUser(
+            id="lookup_id", username="lookup_username", email="lookup@example.com"
+        ),
+    )
+    assert len(connection.access_token_digest) == 64
+
+    with django_assert_num_queries(1):
+        assert OAuthConnection.objects.get_by_access_token("lookup_access_token") == (
+            connection
+        )
+
+    with pytest.raises(OAuthConnection.DoesNotExist):
+        OAuthConnection.objects.get_by_access_token("other_access_token")
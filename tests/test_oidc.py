@@ -0,0 +1,149 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+from django.core.cache import cache
+
+from oauthlogin import app_tokens, oidc
+from oauthlogin.models import OAuthConnection
+from tests.stand_in import StandInServer
+
+
+@pytest.fixture
+def issuer():
+    oidc._discovery_documents.clear()
+    cache.clear()
+
+    with StandInServer() as server:
+
+        @server.route("GET", "/.well-known/openid-configuration")
+        def discovery(request):
+            return (
+                200,
+                {},
+                {
+                    "issuer": server.url,
+                    "authorization_endpoint": server.url + "/authorize",
+                    "token_endpoint": server.url + "/token",
+                    "userinfo_endpoint": server.url + "/userinfo",
+                },
+            )
+
+        @server.route("POST", "/token")
+        def token(request):
+            assert request.form["code"] == "test_code"
+            return 200, {}, {"access_token": "oidc_token", "expires_in": 3600}
+
+        @server.route("GET", "/userinfo")
+        def userinfo(request):
+            assert request.headers["Authorization"] == "Bearer oidc_token"
+            return (
+                200,
+                {},
+                {
+                    "sub": "oidc_sub",
+                    "email": "oidc@example.com",
+                    "email_verified": True,
+                    "preferred_username": "oidc_username",
+                },
+            )
+
+        yield server
+
+    oidc._discovery_documents.clear()
+
+
+@pytest.mark.django_db
+def test_oidc_login(client, settings, issuer):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "oidc": {
+            "class": "oauthlogin.oidc.OIDCOAuthProvider",
+            "kwargs": {
+                "issuer": issuer.url + "/",
+                "client_id": "oidc_client_id",
+                "client_secret": "oidc_client_secret",
+            },
+        }
+    }
+
+    response = client.post("/oauth/oidc/login/")
+    assert response.status_code == 302
+    assert response.url.startswith(issuer.url + "/authorize?")
+    state = parse_qs(urlparse(response.url).query)["state"][0]
+
+    response = client.get(f"/oauth/oidc/callback/?code=test_code&state={state}")
+    assert response.status_code == 302
+
+    connection = OAuthConnection.objects.get(provider_key="oidc")
+    assert connection.provider_user_id == "oidc_sub"
+    assert connection.access_token == "oidc_token"
+    assert connection.user.email == "oidc@example.com"
+    assert connection.user.username == "oidc_username"
+
+    # Discovery was only fetched once for the whole flow
+    assert len(issuer.requests_to("/.well-known/openid-configuration")) == 1
+
+
+def test_discovery_shared_between_workers(settings, issuer):
+    oidc.get_discovery_document(issuer.url)
+
+    # A cold worker gets the document from the Django cache
+    oidc._discovery_documents.clear()
+    document = oidc.get_discovery_document(issuer.url)
+
+    assert document["token_endpoint"] == issuer.url + "/token"
+    assert len(issuer.requests_to("/.well-known/openid-configuration")) == 1
+
+
+def test_failed_discovery_releases_lock(issuer):
+    @issuer.route("GET", "/.well-known/openid-configuration")
+    def discovery(request):
+        return 500, {}, {}
+
+    with pytest.raises(requests.HTTPError):
+        oidc.get_discovery_document(issuer.url)
+
+    # The next worker fetches right away instead of waiting on the lock
+    assert cache.get(oidc._cache_key(issuer.url) + ":lock") is None
+
+
+def test_stale_discovery_revalidated_in_background(settings, issuer):
+    settings.OAUTH_LOGIN_OIDC_DISCOVERY_TTL = 60
+
+    oidc.get_discovery_document(issuer.url)
+    stale_entry = oidc._discovery_documents[issuer.url]
+    stale_entry["fetched_at"] -= 120
+    cache.set(oidc._cache_key(issuer.url), stale_entry)
+
+    # The stale document is returned without waiting on the refetch
+    assert oidc.get_discovery_document(issuer.url) == stale_entry["document"]
+
+    deadline = time.time() + 5
+    while oidc._refreshing_issuers and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert len(issuer.requests_to("/.well-known/openid-configuration")) == 2
+    assert oidc._discovery_documents[issuer.url]["fetched_at"] > (
+        stale_entry["fetched_at"]
+    )
+
+
+def test_oidc_app_token(issuer):
+    app_tokens._app_tokens.clear()
+
+    @issuer.route("POST", "/token")
+    def token(request):
+        assert request.form["grant_type"] == "client_credentials"
+        return 200, {}, {"access_token": "oidc_app_token", "expires_in": 3600}
+
+    provider = oidc.OIDCOAuthProvider(
+        provider_key="oidc",
+        issuer=issuer.url,
+        client_id="oidc_client_id",
+        client_secret="oidc_client_secret",
+    )
+
+    assert provider.get_app_token().access_token == "oidc_app_token"
+    assert provider.get_app_token().access_token == "oidc_app_token"
+    assert len(issuer.requests_to("/token")) == 1
@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.http import HttpResponseForbidden
+
+from oauthlogin.models import OAuthConnection
+from oauthlogin.pipeline import DEFAULT_CALLBACK_PIPELINE
+
+
+def match_user_by_email(context):
+    context.user = (
+        get_user_model().objects.filter(email=context.oauth_user.email).first()
+    )
+
+
+def deny_example_com(context):
+    if context.oauth_user.email.endswith("@example.com"):
+        return HttpResponseForbidden("Not allowed")
+
+
+@pytest.fixture
+def dummy_provider(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "dummy": {
+            "class": "test_providers.DummyProvider",
+            "kwargs": {
+                "client_id": "dummy_client_id",
+                "client_secret": "dummy_client_secret",
+            },
+        }
+    }
+
+
+def callback(client):
+    client.post("/oauth/dummy/login/")
+    return client.get("/oauth/dummy/callback/?code=test_code&state=dummy_state")
+
+
+@pytest.mark.django_db
+def test_custom_user_matching(client, settings, dummy_provider):
+    settings.OAUTH_LOGIN_CALLBACK_PIPELINE = [
+        "tests.test_pipeline.match_user_by_email"
+        if path == "oauthlogin.pipeline.resolve_user"
+        else path
+        for path in DEFAULT_CALLBACK_PIPELINE
+    ]
+    user = get_user_model().objects.create_user(
+        username="existing", email="dummy@example.com"
+    )
+
+    response = callback(client)
+    assert response.status_code == 302
+    assert response.url == "/"
+
+    # Connected to the existing user instead of failing on the duplicate email
+    connection = OAuthConnection.objects.get()
+    assert connection.user == user
+    assert client.get("/").context["user"] == user
+
+
+@pytest.mark.django_db
+def test_short_circuit(client, settings, dummy_provider, caplog):
+    settings.OAUTH_LOGIN_CALLBACK_PIPELINE = [
+        "oauthlogin.pipeline.check_state",
+        "oauthlogin.pipeline.exchange_token",
+        "oauthlogin.pipeline.get_identity",
+        "tests.test_pipeline.deny_example_com",
+        "oauthlogin.pipeline.resolve_user",
+        "oauthlogin.pipeline.save_connection",
+        "oauthlogin.pipeline.login",
+        "oauthlogin.pipeline.redirect",
+    ]
+
+    with caplog.at_level(logging.DEBUG, logger="oauthlogin.pipeline"):
+        response = callback(client)
+
+    assert response.status_code == 403
+    assert not OAuthConnection.objects.exists()
+    assert not get_user_model().objects.exists()
+
+    # Only the stages that ran are timed
+    assert "deny_example_com=" in caplog.text
+    assert "save_connection=" not in caplog.text
@@ -0,0 +1,125 @@
+import datetime
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+
+from oauthlogin.models import OAuthConnection
+from oauthlogin.providers import OAuthProvider
+from tests.stand_in import StandInServer
+
+
+class ProbeProvider(OAuthProvider):
+    probe_url = "user"
+
+
+@pytest.fixture
+def probe_server(settings):
+    with StandInServer() as server:
+        ProbeProvider.api_base_url = server.url + "/"
+        settings.OAUTH_LOGIN_PROVIDERS = {
+            "probe": {
+                "class": "tests.test_probe.ProbeProvider",
+                "kwargs": {
+                    "client_id": "probe_client_id",
+                    "client_secret": "probe_client_secret",
+                },
+            }
+        }
+
+        @server.route("GET", "/user")
+        def user(request):
+            if request.headers["Authorization"].startswith("Bearer valid"):
+                return 200, {}, {"id": 1}
+            if request.headers["Authorization"].startswith("Bearer limited"):
+                return 429, {"Retry-After": "3600"}, {}
+            return 401, {}, {"message": "Bad credentials"}
+
+        yield server
+
+
+@pytest.fixture
+def connections():
+    user = get_user_model().objects.create_user(
+        username="probe", email="probe@example.com"
+    )
+    return {
+        access_token: OAuthConnection.objects.create(
+            user=user,
+            provider_key="probe",
+            provider_user_id=access_token,
+            access_token=access_token,
+        )
+        for access_token in ["valid_1", "valid_2", "revoked_1", "revoked_2"]
+    }
+
+
+@pytest.mark.django_db
+def test_probe(probe_server, connections, capsys):
+    expired = OAuthConnection.objects.create(
+        user=connections["valid_1"].user,
+        provider_key="probe",
+        provider_user_id="expired",
+        access_token="expired",
+        access_token_expires_at=timezone.now() - datetime.timedelta(hours=1),
+        refresh_token="expired_refresh_token",
+    )
+
+    call_command("oauthlogin_probe", "--batch-size", "3")
+
+    assert "Probed 4 access tokens (2 valid, 2 invalid, 0 failed)" in (
+        capsys.readouterr().out
+    )
+    assert set(
+        OAuthConnection.objects.filter(invalidated_at__isnull=False).values_list(
+            "access_token", flat=True
+        )
+    ) == {"revoked_1", "revoked_2"}
+
+    # Expired tokens are left for the refresher
+    expired.refresh_from_db()
+    assert expired.invalidated_at is None
+    assert len(probe_server.requests_to("/user")) == 4
+
+    # Invalidated connections aren't probed again
+    call_command("oauthlogin_probe")
+    assert len(probe_server.requests_to("/user")) == 6
+
+
+@pytest.mark.django_db
+def test_probe_resume(probe_server, connections, tmp_path):
+    limited = OAuthConnection.objects.create(
+        user=connections["valid_1"].user,
+        provider_key="probe",
+        provider_user_id="limited",
+        access_token="limited",
+    )
+    checkpoint = tmp_path / "checkpoint.json"
+
+    with pytest.raises(CommandError, match="Rate limited by probe"):
+        call_command(
+            "oauthlogin_probe",
+            "--batch-size",
+            "4",
+            "--checkpoint",
+            str(checkpoint),
+            "--max-rate-limit-wait",
+            "5",
+        )
+
+    # The first full batch was finished and saved
+    assert json.loads(checkpoint.read_text()) == {
+        "last_pk": connections["revoked_2"].pk
+    }
+    assert OAuthConnection.objects.filter(invalidated_at__isnull=False).count() == 2
+
+    limited.access_token = "valid_3"
+    limited.save()
+
+    call_command("oauthlogin_probe", "--checkpoint", str(checkpoint))
+
+    # Only the rest was probed, and the finished run clears the checkpoint
+    assert len(probe_server.requests_to("/user")) == 6
+    assert not checkpoint.exists()
@@ -0,0 +1,128 @@
+import datetime
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+
+from oauthlogin.cache import (
+    get_cached_identity,
+    get_user_connections,
+    set_cached_identity,
+)
+from oauthlogin.models import OAuthConnection
+from oauthlogin.providers import OAuthProvider, OAuthToken, OAuthUser
+
+
+class ProfileProvider(OAuthProvider):
+    def get_oauth_token(self, *, code, request):
+        return OAuthToken(access_token="profile_access_token")
+
+    def get_oauth_user(self, *, oauth_token):
+        return OAuthUser(
+            id="profile_id",
+            email="profile@example.com",
+            username="profile_username",
+            data={"avatar_url": "https://example.com/avatar.png"},
+        )
+
+    def check_request_state(self, *, request):
+        return
+
+
+@pytest.fixture
+def profile_provider(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "profile": {
+            "class": "test_profiles.ProfileProvider",
+            "kwargs": {
+                "client_id": "profile_client_id",
+                "client_secret": "profile_client_secret",
+            },
+        }
+    }
+
+
+@pytest.mark.django_db
+def test_profile_saved_on_callback(client, profile_provider):
+    response = client.get("/oauth/profile/callback/?code=test_code&state=test")
+    assert response.status_code == 302
+
+    connection = OAuthConnection.objects.get()
+    assert connection.profile == {
+        "username": "profile_username",
+        "email": "profile@example.com",
+        "data": {"avatar_url": "https://example.com/avatar.png"},
+    }
+    assert connection.profile_fetched_at is not None
+    assert not connection.profile_stale()
+
+
+@pytest.mark.django_db
+def test_resync_stale_profiles(profile_provider, capsys):
+    user = get_user_model().objects.create_user(
+        username="profile_username", email="profile@example.com"
+    )
+    fresh_fetched_at = timezone.now()
+    fresh = OAuthConnection.objects.create(
+        user=user,
+        provider_key="profile",
+        provider_user_id="fresh_id",
+        access_token="profile_access_token",
+        profile={"username": "fresh"},
+        profile_fetched_at=fresh_fetched_at,
+    )
+    stale = OAuthConnection.objects.create(
+        user=user,
+        provider_key="profile",
+        provider_user_id="stale_id",
+        access_token="profile_access_token",
+        profile={"username": "stale"},
+        profile_fetched_at=timezone.now() - datetime.timedelta(days=2),
+    )
+    missing = OAuthConnection.objects.create(
+        user=user,
+        provider_key="profile",
+        provider_user_id="missing_id",
+        access_token="profile_access_token",
+    )
+
+    call_command("oauthlogin_resync_profiles", batch_size=1, concurrency=2)
+    assert "Resynced 2 profiles (0 failed)" in capsys.readouterr().out
+
+    fresh.refresh_from_db()
+    assert fresh.profile == {"username": "fresh"}
+    assert fresh.profile_fetched_at == fresh_fetched_at
+
+    for connection in (stale, missing):
+        connection.refresh_from_db()
+        assert connection.profile["username"] == "profile_username"
+        assert not connection.profile_stale()
+
+
+@pytest.mark.django_db
+def test_resync_invalidates_caches(settings, profile_provider):
+    settings.OAUTH_LOGIN_IDENTITY_CACHE_TIMEOUT = 60
+    settings.OAUTH_LOGIN_CONNECTIONS_CACHE_TIMEOUT = 60
+    cache.clear()
+
+    user = get_user_model().objects.create_user(
+        username="profile_username", email="profile@example.com"
+    )
+    stale = OAuthConnection.objects.create(
+        user=user,
+        provider_key="profile",
+        provider_user_id="stale_id",
+        access_token="profile_access_token",
+        profile={"username": "stale"},
+        profile_fetched_at=timezone.now() - datetime.timedelta(days=2),
+    )
+    set_cached_identity(stale)
+    assert get_user_connections(user)[0]["profile"] == {"username": "stale"}
+
+    call_command("oauthlogin_resync_profiles")
+
+    assert get_cached_identity("profile", "stale_id") is None
+    assert get_user_connections(user)[0]["profile"]["username"] == "profile_username"
+    cache.clear()
@@ -0,0 +1,148 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+
+from oauthlogin.models import OAuthConnection, OAuthProviderConfig
+from oauthlogin.provider_configs import (
+    PROVIDER_CONFIG_CACHE_KEY,
+    provider_config_cache,
+)
+from oauthlogin.providers import get_oauth_provider_instance
+
+
+@pytest.fixture
+def database_providers(settings):
+    settings.OAUTH_LOGIN_DATABASE_PROVIDERS = True
+    settings.OAUTH_LOGIN_PROVIDERS = {}
+    cache.clear()
+    provider_config_cache.clear()
+    yield
+    cache.clear()
+    provider_config_cache.clear()
+
+
+@pytest.fixture
+def config(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        return OAuthProviderConfig.objects.create(
+            provider_key="acme",
+            provider_class="test_providers.DummyProvider",
+            client_id="acme_client_id",
+            client_secret="acme_client_secret",
+            kwargs={"scope": "acme_scope"},
+        )
+
+
+@pytest.mark.django_db
+def test_lookup_levels(database_providers, config, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        provider = get_oauth_provider_instance(provider_key="acme")
+
+    assert provider.provider_key == "acme"
+    assert provider.get_client_id() == "acme_client_id"
+    assert provider.get_client_secret() == "acme_client_secret"
+    assert provider.get_scope() == "acme_scope"
+
+    # From the in-process LRU
+    with django_assert_num_queries(0):
+        get_oauth_provider_instance(provider_key="acme")
+
+    # From the Django cache (like another worker would)
+    provider_config_cache.clear()
+    with django_assert_num_queries(0):
+        get_oauth_provider_instance(provider_key="acme")
+
+
+@pytest.mark.django_db
+def test_unknown_key(database_providers, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        with pytest.raises(KeyError):
+            get_oauth_provider_instance(provider_key="unknown")
+
+    with django_assert_num_queries(0):
+        with pytest.raises(KeyError):
+            get_oauth_provider_instance(provider_key="unknown")
+
+    # Only remembered in the bounded LRU, not the shared cache
+    assert cache.get(PROVIDER_CONFIG_CACHE_KEY.format("unknown")) is None
+
+
+@pytest.mark.django_db
+def test_disabled_setting(settings, database_providers, config):
+    settings.OAUTH_LOGIN_DATABASE_PROVIDERS = False
+
+    with pytest.raises(KeyError):
+        get_oauth_provider_instance(provider_key="acme")
+
+
+@pytest.mark.django_db
+def test_invalidation(database_providers, config, django_capture_on_commit_callbacks):
+    get_oauth_provider_instance(provider_key="acme")
+
+    config.client_secret = "rotated_secret"
+    with django_capture_on_commit_callbacks(execute=True):
+        config.save()
+
+    provider = get_oauth_provider_instance(provider_key="acme")
+    assert provider.get_client_secret() == "rotated_secret"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        config.delete()
+
+    with pytest.raises(KeyError):
+        get_oauth_provider_instance(provider_key="acme")
+
+
+@pytest.mark.django_db
+def test_lru_size(database_providers, config):
+    provider_config_cache._maxsize = 2
+    try:
+        for key in ["acme", "unknown_1", "unknown_2"]:
+            try:
+                get_oauth_provider_instance(provider_key=key)
+            except KeyError:
+                pass
+
+        assert list(provider_config_cache._entries) == ["unknown_1", "unknown_2"]
+    finally:
+        provider_config_cache._maxsize = None
+
+
+@pytest.mark.django_db
+def test_keys_check(settings, database_providers, config):
+    user = get_user_model().objects.create_user(username="check", email="c@example.com")
+    OAuthConnection.objects.create(user=user, provider_key="acme", provider_user_id="1")
+
+    assert OAuthConnection.check(databases=["default"]) == []
+
+    config.enabled = False
+    config.save()
+    assert [e.id for e in OAuthConnection.check(databases=["default"])] == [
+        "oauthlogin.E001"
+    ]
+
+    config.enabled = True
+    config.save()
+    settings.OAUTH_LOGIN_DATABASE_PROVIDERS = False
+    assert [e.id for e in OAuthConnection.check(databases=["default"])] == [
+        "oauthlogin.E001"
+    ]
+
+
+@pytest.mark.django_db
+def test_provider_class_must_be_a_provider(database_providers):
+    config = OAuthProviderConfig(
+        provider_key="not_a_provider",
+        provider_class="django.contrib.auth.models.User",
+        client_id="client_id",
+    )
+
+    with pytest.raises(ValidationError) as excinfo:
+        config.full_clean()
+    assert "provider_class" in excinfo.value.message_dict
+
+    # Rows saved without the admin are checked before anything is instantiated
+    config.save()
+    with pytest.raises(ImproperlyConfigured):
+        get_oauth_provider_instance(provider_key="not_a_provider")
@@ -0,0 +1,188 @@
+import datetime
+
+import pytest
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+
+from oauthlogin.exceptions import OAuthRefreshTokenRejectedError
+from oauthlogin.models import OAuthConnection, OAuthLease
+from oauthlogin.providers import OAuthProvider, OAuthToken
+from oauthlogin.refresher import RefreshScheduler
+
+
+class RefreshProvider(OAuthProvider):
+    def refresh_oauth_token(self, *, oauth_token):
+        if oauth_token.refresh_token == "failing":
+            raise OAuthRefreshTokenRejectedError("invalid_grant")
+        if oauth_token.refresh_token == "down":
+            raise requests.ConnectionError("Provider is down")
+        return OAuthToken(
+            access_token="refreshed",
+            refresh_token=oauth_token.refresh_token,
+            access_token_expires_at=timezone.now() + datetime.timedelta(hours=2),
+        )
+
+
+@pytest.fixture
+def refresh_provider(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "refresh": {
+            "class": "tests.test_refresher.RefreshProvider",
+            "kwargs": {
+                "client_id": "refresh_client_id",
+                "client_secret": "refresh_client_secret",
+            },
+        }
+    }
+
+
+@pytest.fixture
+def create_connection():
+    user = get_user_model().objects.create_user(
+        username="refresh", email="refresh@example.com"
+    )
+
+    def create(provider_user_id, expires_in, refresh_token="refresh"):
+        return OAuthConnection.objects.create(
+            user=user,
+            provider_key="refresh",
+            provider_user_id=provider_user_id,
+            access_token="access",
+            refresh_token=refresh_token,
+            access_token_expires_at=timezone.now()
+            + datetime.timedelta(seconds=expires_in),
+        )
+
+    return create
+
+
+@pytest.mark.django_db
+def test_scheduler(create_connection):
+    soon = create_connection("soon", 60)
+    later = create_connection("later", 60 * 30)
+    create_connection("outside_horizon", 60 * 60 * 2)
+    create_connection("no_refresh_token", 60, refresh_token="")
+
+    scheduler = RefreshScheduler(horizon=datetime.timedelta(hours=1))
+    scheduler.load()
+    assert len(scheduler) == 2
+
+    assert scheduler.pop_due(margin=datetime.timedelta(minutes=5)) == [soon.pk]
+    assert scheduler.next_due_at(
+        margin=datetime.timedelta(minutes=5)
+    ) == later.access_token_expires_at - datetime.timedelta(minutes=5)
+
+    # Changed connections are picked up incrementally
+    soon.access_token_expires_at = timezone.now() + datetime.timedelta(seconds=30)
+    soon.save()
+    scheduler.load()
+    assert scheduler.pop_due(margin=datetime.timedelta(minutes=5)) == [soon.pk]
+
+
+@pytest.mark.django_db
+def test_refresher(refresh_provider, create_connection, capsys):
+    soon = create_connection("soon", 60)
+    failing = create_connection("failing", 60, refresh_token="failing")
+    later = create_connection("later", 60 * 30)
+
+    call_command("oauthlogin_refresher", once=True)
+
+    soon.refresh_from_db()
+    assert soon.access_token == "refreshed"
+    failing.refresh_from_db()
+    assert failing.refresh_failures == 1
+    later.refresh_from_db()
+    assert later.access_token == "access"
+    assert "Refreshed 1 of 2 access tokens" in capsys.readouterr().out
+
+    # The lease is released on exit
+    assert not OAuthLease.objects.exists()
+
+
+@pytest.mark.django_db
+def test_refresher_transient_failures(refresh_provider, create_connection, capsys):
+    down = create_connection("down", 60, refresh_token="down")
+
+    call_command("oauthlogin_refresher", once=True)
+
+    # Not counted towards the limit, so an outage can't make connections dead
+    down.refresh_from_db()
+    assert down.refresh_failures == 0
+    assert "Refreshed 0 of 1 access tokens" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_refresher_unknown_provider(refresh_provider, create_connection, capsys):
+    soon = create_connection("soon", 60)
+    removed = create_connection("removed", 60)
+    removed.provider_key = "removed"
+    removed.save()
+
+    call_command("oauthlogin_refresher", once=True)
+
+    soon.refresh_from_db()
+    assert soon.access_token == "refreshed"
+    removed.refresh_from_db()
+    assert removed.access_token == "access"
+
+    captured = capsys.readouterr()
+    assert "Refreshed 1 of 1 access tokens" in captured.out
+    assert 'Skipping connections for the OAuth provider "removed"' in captured.err
+
+
+@pytest.mark.django_db
+def test_refresher_retry_backoff(refresh_provider, create_connection):
+    from oauthlogin.management.commands.oauthlogin_refresher import Command
+
+    down = create_connection("down", 60, refresh_token="down")
+    command = Command()
+    command.retry_attempts = {}
+    command.retry_delay = 60
+    command.max_retry_delay = 200
+    scheduler = RefreshScheduler(horizon=datetime.timedelta(hours=1))
+
+    retry_delays = []
+    for _ in range(4):
+        command.schedule_retry(scheduler, down, datetime.timedelta(0))
+        retry_delays.append(
+            round((scheduler.scheduled[down.pk] - timezone.now()).total_seconds())
+        )
+
+    assert retry_delays == [60, 120, 200, 200]
+
+
+@pytest.mark.django_db
+def test_refresher_renews_lease_between_chunks(
+    refresh_provider, create_connection, capsys, monkeypatch
+):
+    for i in range(6):
+        create_connection(f"soon_{i}", 60)
+
+    # The lease is taken at the start of the loop, then lost before the second chunk
+    acquired = iter([True, False])
+    monkeypatch.setattr(OAuthLease, "acquire", lambda **kwargs: next(acquired))
+
+    call_command("oauthlogin_refresher", once=True, concurrency=1)
+
+    out, err = capsys.readouterr()
+    assert "Lost the lease" in err
+    assert "Refreshed 4 of 4 access tokens" in out
+    assert OAuthConnection.objects.filter(access_token="refreshed").count() == 4
+
+
+@pytest.mark.django_db
+def test_refresher_lease(refresh_provider, create_connection, capsys):
+    connection = create_connection("soon", 60)
+    OAuthLease.acquire(
+        name="oauthlogin_refresher",
+        holder="other",
+        duration=datetime.timedelta(minutes=1),
+    )
+
+    call_command("oauthlogin_refresher", once=True)
+
+    connection.refresh_from_db()
+    assert connection.access_token == "access"
+    assert "Another refresher holds the lease" in capsys.readouterr().out
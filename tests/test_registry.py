@@ -0,0 +1,85 @@
+import json
+
+import pytest
+from django.core.cache import cache
+
+from oauthlogin.providers import get_oauth_provider_instance, get_provider_keys
+from oauthlogin.registry import provider_registry
+
+
+def dummy_provider_settings(client_secret):
+    return {
+        "class": "test_providers.DummyProvider",
+        "kwargs": {
+            "client_id": "dummy_client_id",
+            "client_secret": client_secret,
+        },
+    }
+
+
+@pytest.fixture
+def providers_file(settings, tmp_path):
+    path = tmp_path / "providers.json"
+    path.write_text(json.dumps({"dummy": dummy_provider_settings("first_secret")}))
+
+    settings.OAUTH_LOGIN_PROVIDERS = {}
+    settings.OAUTH_LOGIN_PROVIDERS_SOURCE = f"file:{path}"
+    # Reloaded by the tests instead of a background thread
+    settings.OAUTH_LOGIN_PROVIDERS_RELOAD_INTERVAL = 0
+    provider_registry.clear()
+    yield path
+    provider_registry.clear()
+
+
+def test_file_source(providers_file):
+    provider = get_oauth_provider_instance(provider_key="dummy")
+    assert provider.get_client_secret() == "first_secret"
+    assert get_provider_keys() == ["dummy"]
+
+    # The same instance until something changes
+    assert get_oauth_provider_instance(provider_key="dummy") is provider
+    assert not provider_registry.reload()
+
+    providers_file.write_text(
+        json.dumps({"dummy": dummy_provider_settings("rotated_secret")})
+    )
+    assert provider_registry.reload()
+
+    assert (
+        get_oauth_provider_instance(provider_key="dummy").get_client_secret()
+        == "rotated_secret"
+    )
+    # Anything still holding the old instance keeps working with it
+    assert provider.get_client_secret() == "first_secret"
+
+
+def test_bad_source_keeps_current_providers(providers_file):
+    get_oauth_provider_instance(provider_key="dummy")
+
+    providers_file.write_text(
+        json.dumps({"dummy": {"class": "test_providers.DoesNotExist"}})
+    )
+    with pytest.raises(ImportError):
+        provider_registry.reload()
+
+    assert (
+        get_oauth_provider_instance(provider_key="dummy").get_client_secret()
+        == "first_secret"
+    )
+
+
+def test_cache_source(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {}
+    settings.OAUTH_LOGIN_PROVIDERS_SOURCE = "cache:oauth_providers"
+    settings.OAUTH_LOGIN_PROVIDERS_RELOAD_INTERVAL = 0
+    provider_registry.clear()
+    cache.set("oauth_providers", {"dummy": dummy_provider_settings("cache_secret")})
+
+    try:
+        assert (
+            get_oauth_provider_instance(provider_key="dummy").get_client_secret()
+            == "cache_secret"
+        )
+    finally:
+        cache.delete("oauth_providers")
+        provider_registry.clear()
@@ -0,0 +1,108 @@
+import pytest
+from django.contrib.auth import get_user_model
+
+from oauthlogin.models import OAuthConnection
+from oauthlogin.providers import OAuthProvider, OAuthToken
+from oauthlogin.revocation import revocation_queue
+
+
+class RevokingProvider(OAuthProvider):
+    revoked = []
+    failures = 0
+
+    def revoke_oauth_token(self, *, oauth_token):
+        if RevokingProvider.failures:
+            RevokingProvider.failures -= 1
+            raise Exception("Revoke failed")
+        RevokingProvider.revoked.append(oauth_token.access_token)
+
+
+@pytest.fixture
+def revoking_provider(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "revoking": {
+            "class": "tests.test_revocation.RevokingProvider",
+            "kwargs": {
+                "client_id": "revoking_client_id",
+                "client_secret": "revoking_client_secret",
+            },
+        }
+    }
+    settings.OAUTH_LOGIN_REVOKE_TOKENS = True
+    RevokingProvider.revoked = []
+    RevokingProvider.failures = 0
+
+
+@pytest.fixture
+def user():
+    user = get_user_model().objects.create_user(
+        username="revoking", email="revoking@example.com", password="password"
+    )
+    for i in range(3):
+        OAuthConnection.objects.create(
+            user=user,
+            provider_key="revoking",
+            provider_user_id=str(i),
+            access_token=f"access_{i}",
+        )
+    return user
+
+
+@pytest.mark.django_db
+def test_disconnect_revokes_after_commit(
+    revoking_provider, user, django_capture_on_commit_callbacks
+):
+    with django_capture_on_commit_callbacks() as callbacks:
+        OAuthConnection.disconnect(
+            user=user, provider_key="revoking", provider_user_id="0"
+        )
+
+    # Nothing is revoked until the transaction commits
+    assert RevokingProvider.revoked == []
+
+    for callback in callbacks:
+        callback()
+    revocation_queue.join()
+
+    assert RevokingProvider.revoked == ["access_0"]
+
+
+@pytest.mark.django_db
+def test_user_delete_revokes_with_retries(
+    revoking_provider, user, django_capture_on_commit_callbacks
+):
+    RevokingProvider.failures = 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user.delete()
+    revocation_queue.join()
+
+    assert sorted(RevokingProvider.revoked) == ["access_0", "access_1", "access_2"]
+
+
+@pytest.mark.django_db
+def test_revocation_disabled(
+    revoking_provider, settings, user, django_capture_on_commit_callbacks
+):
+    settings.OAUTH_LOGIN_REVOKE_TOKENS = False
+
+    with django_capture_on_commit_callbacks(execute=True):
+        user.delete()
+    revocation_queue.join()
+
+    assert RevokingProvider.revoked == []
+
+
+def test_drain_at_exit(revoking_provider, monkeypatch):
+    registered = []
+    monkeypatch.setattr("atexit.register", registered.append)
+    monkeypatch.setattr(revocation_queue, "drain_at_exit_registered", False)
+
+    for i in range(20):
+        revocation_queue.put("revoking", OAuthToken(access_token=f"purged_{i}"))
+
+    assert registered == [revocation_queue.drain_at_exit]
+
+    # What the exit hook does, before the daemon thread is stopped
+    registered[0]()
+    assert len(RevokingProvider.revoked) == 20
@@ -0,0 +1,63 @@
+import pytest
+from django.contrib.auth import get_user_model
+
+from oauthlogin import routers
+from oauthlogin.models import OAuthConnection, OAuthLease, OAuthProviderConfig
+from oauthlogin.routers import OAuthLoginRouter
+
+
+@pytest.fixture
+def router(settings):
+    settings.OAUTH_LOGIN_READ_DATABASE = "replica"
+    routers.unpin()
+    yield OAuthLoginRouter()
+    routers.unpin()
+
+
+def from_database(instance, database):
+    instance._state.db = database
+    return instance
+
+
+def test_no_read_database(settings):
+    settings.OAUTH_LOGIN_READ_DATABASE = None
+    router = OAuthLoginRouter()
+
+    assert router.db_for_read(OAuthConnection) is None
+    assert router.db_for_write(OAuthConnection) is None
+
+
+def test_reads_from_replica_until_write(router, client):
+    assert router.db_for_read(OAuthConnection) == "replica"
+    assert router.db_for_read(get_user_model()) is None
+
+    assert router.db_for_write(OAuthConnection) == "default"
+    assert router.db_for_read(OAuthConnection) == "default"
+
+    # The next request starts on the replica again
+    client.get("/not-found/")
+    assert router.db_for_read(OAuthConnection) == "replica"
+
+
+def test_use_primary(router):
+    with routers.use_primary():
+        assert router.db_for_read(OAuthConnection) == "default"
+    assert router.db_for_read(OAuthConnection) == "replica"
+
+
+def test_related_objects_use_primary(router):
+    connection = from_database(OAuthConnection(), "replica")
+    user = from_database(get_user_model()(), "replica")
+
+    # connection.user and user.save() don't go to the replica
+    assert router.db_for_read(get_user_model(), instance=connection) == "default"
+    assert router.db_for_write(get_user_model(), instance=user) == "default"
+    assert (
+        router.allow_relation(connection, from_database(get_user_model()(), "default"))
+        is True
+    )
+
+
+def test_provider_configs_read_from_primary(router):
+    assert router.db_for_read(OAuthProviderConfig) is None
+    assert router.db_for_read(OAuthLease) is None
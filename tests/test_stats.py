@@ -0,0 +1,93 @@
+import datetime
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+
+from oauthlogin.models import OAuthConnection
+
+
+@pytest.fixture
+def connections():
+    now = timezone.now()
+    no_password = get_user_model().objects.create_user(
+        username="no_password", email="no_password@example.com"
+    )
+    password = get_user_model().objects.create_user(
+        username="password", email="password@example.com", password="password"
+    )
+    two_connections = get_user_model().objects.create_user(
+        username="two", email="two@example.com"
+    )
+
+    OAuthConnection.objects.create(
+        user=no_password,
+        provider_key="github",
+        provider_user_id="1",
+        access_token_expires_at=now - datetime.timedelta(hours=1),
+    )
+    OAuthConnection.objects.create(
+        user=password,
+        provider_key="github",
+        provider_user_id="2",
+        refresh_token="refresh",
+        access_token_expires_at=now + datetime.timedelta(hours=1),
+    )
+    OAuthConnection.objects.create(
+        user=two_connections,
+        provider_key="github",
+        provider_user_id="3",
+        refresh_token="refresh",
+        refresh_token_expires_at=now - datetime.timedelta(days=1),
+    )
+    OAuthConnection.objects.create(
+        user=two_connections,
+        provider_key="gitlab",
+        provider_user_id="4",
+        access_token_expires_at=now + datetime.timedelta(days=30),
+    )
+
+
+@pytest.mark.django_db
+def test_stats_json(connections, capsys, django_assert_num_queries):
+    with django_assert_num_queries(2):
+        call_command("oauthlogin_stats", format="json")
+
+    stats = json.loads(capsys.readouterr().out)
+    assert stats["providers"] == {
+        "github": {
+            "connections": 3,
+            "access_token_expired": 1,
+            "access_token_expiring": 1,
+            "no_refresh_token": 1,
+            "refresh_token_expired": 1,
+        },
+        "gitlab": {
+            "connections": 1,
+            "access_token_expired": 0,
+            "access_token_expiring": 0,
+            "no_refresh_token": 1,
+            "refresh_token_expired": 0,
+        },
+    }
+    assert stats["totals"]["connections"] == 4
+    assert stats["single_connection_users_without_password"] == 1
+
+
+@pytest.mark.django_db
+def test_stats_text(connections, capsys):
+    call_command("oauthlogin_stats")
+
+    output = capsys.readouterr().out
+    assert output.splitlines()[0].split() == [
+        "provider",
+        "connections",
+        "access_token_expired",
+        "access_token_expiring",
+        "no_refresh_token",
+        "refresh_token_expired",
+    ]
+    assert output.splitlines()[1].split() == ["github", "3", "1", "1", "1", "1"]
+    assert "Users with a single connection and no usable password: 1" in output
@@ -0,0 +1,71 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import RequestFactory
+
+from oauthlogin.models import OAuthConnection
+
+
+def render(template_string, user):
+    request = RequestFactory().get("/")
+    request.user = user
+    return Template("{% load oauthlogin %}" + template_string).render(
+        Context({"request": request})
+    )
+
+
+@pytest.fixture
+def user():
+    user = get_user_model().objects.create_user(
+        username="tags_username", email="tags@example.com"
+    )
+    OAuthConnection.objects.create(
+        user=user, provider_key="github", provider_user_id="1"
+    )
+    OAuthConnection.objects.create(
+        user=user, provider_key="gitlab", provider_user_id="2"
+    )
+    return user
+
+
+def test_provider_buttons(settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {"github": {}, "gitlab": {}}
+
+    html = render('{% oauth_provider_buttons "connect" next="/settings/" %}', None)
+
+    assert 'action="/oauth/github/connect/"' in html
+    assert 'action="/oauth/gitlab/connect/"' in html
+    assert 'name="next" value="/settings/"' in html
+    assert "Connect github" in html
+
+
+@pytest.mark.django_db
+def test_connections_single_query(user, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        html = render("{% oauth_connections %}", user)
+
+    assert "github [ID: 1]" in html
+    assert "gitlab [ID: 2]" in html
+    assert html.count("Disconnect") == 2
+
+
+@pytest.mark.django_db
+def test_connections_cached(user, settings, django_assert_num_queries):
+    settings.OAUTH_LOGIN_CONNECTIONS_CACHE_TIMEOUT = 60
+    cache.clear()
+
+    render("{% oauth_connections %}", user)
+
+    with django_assert_num_queries(0):
+        html = render("{% oauth_connections %}", user)
+    assert html.count("Disconnect") == 2
+
+    # Removing a connection invalidates the cached list
+    OAuthConnection.objects.get(provider_key="gitlab").delete()
+
+    html = render("{% oauth_connections %}", user)
+    assert "gitlab" not in html
+    assert "Disconnect" not in html
+
+    cache.clear()
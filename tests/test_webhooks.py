@@ -0,0 +1,139 @@
+import hashlib
+import hmac
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from oauthlogin.models import OAuthConnection
+from oauthlogin.providers import OAuthWebhookEvent
+from oauthlogin.webhooks import process_webhook_events, webhook_queue
+
+
+class StandInWebhookSender:
+    """
+    Sends webhook deliveries the way GitHub does, signed with the secret.
+    """
+
+    def __init__(self, client, secret):
+        self.client = client
+        self.secret = secret
+
+    def send(self, event, payload, signature=None):
+        body = json.dumps(payload).encode()
+        if signature is None:
+            signature = (
+                "sha256="
+                + hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+            )
+        return self.client.post(
+            "/oauth/github/webhook/",
+            data=body,
+            content_type="application/json",
+            HTTP_X_GITHUB_EVENT=event,
+            HTTP_X_HUB_SIGNATURE_256=signature,
+        )
+
+    def send_revoked(self, github_user_id):
+        return self.send(
+            "github_app_authorization",
+            {"action": "revoked", "sender": {"id": github_user_id}},
+        )
+
+
+@pytest.fixture
+def sender(client, settings):
+    settings.OAUTH_LOGIN_PROVIDERS = {
+        "github": {
+            "class": "providers.github.GitHubOAuthProvider",
+            "kwargs": {
+                "client_id": "test_id",
+                "client_secret": "test_secret",
+                "webhook_secret": "webhook_secret",
+            },
+        }
+    }
+    return StandInWebhookSender(client, "webhook_secret")
+
+
+@pytest.fixture
+def connections():
+    user = get_user_model().objects.create_user(
+        username="webhooks", email="webhooks@example.com"
+    )
+    return [
+        OAuthConnection.objects.create(
+            user=user, provider_key="github", provider_user_id=str(i)
+        )
+        for i in range(10)
+    ]
+
+
+@pytest.mark.django_db
+def test_revoked(sender, settings, connections):
+    response = sender.send_revoked(1)
+    assert response.status_code == 200
+
+    connection = OAuthConnection.objects.get(provider_user_id="1")
+    assert connection.invalidated_at is not None
+    assert OAuthConnection.objects.filter(invalidated_at__isnull=False).count() == 1
+
+    # A repeated delivery doesn't change anything
+    sender.send_revoked(1)
+    assert OAuthConnection.objects.get(provider_user_id="1").invalidated_at == (
+        connection.invalidated_at
+    )
+
+
+@pytest.mark.django_db
+def test_bad_signature(sender, connections):
+    response = sender.send(
+        "github_app_authorization",
+        {"action": "revoked", "sender": {"id": 1}},
+        signature="sha256=bad",
+    )
+    assert response.status_code == 403
+    assert not OAuthConnection.objects.filter(invalidated_at__isnull=False).exists()
+
+
+@pytest.mark.django_db
+def test_webhooks_not_configured(sender, settings):
+    del settings.OAUTH_LOGIN_PROVIDERS["github"]["kwargs"]["webhook_secret"]
+
+    response = sender.send_revoked(1)
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_burst_processed_in_background(sender, settings, connections):
+    settings.OAUTH_LOGIN_WEBHOOKS_BACKGROUND = True
+
+    for connection in connections:
+        assert sender.send_revoked(int(connection.provider_user_id)).status_code == 202
+
+    webhook_queue.join()
+
+    assert OAuthConnection.objects.filter(invalidated_at__isnull=True).count() == 0
+
+
+@pytest.mark.django_db
+def test_deleted(connections):
+    process_webhook_events(
+        [
+            (
+                "github",
+                OAuthWebhookEvent(
+                    type=OAuthWebhookEvent.DELETED, provider_user_ids=["1", "2"]
+                ),
+            ),
+            (
+                "github",
+                OAuthWebhookEvent(
+                    type=OAuthWebhookEvent.DELETED, provider_user_ids=["2"]
+                ),
+            ),
+        ]
+    )
+
+    assert OAuthConnection.objects.count() == 8
+    assert not OAuthConnection.objects.filter(provider_user_id__in=["1", "2"]).exists()